@@ -1,6 +1,7 @@
 import aiohttp
 
 from aiolocust import HttpUser
+from aiolocust.pacing import exponential
 
 
 class TimeoutUser(HttpUser):
@@ -10,3 +11,13 @@ class TimeoutUser(HttpUser):
     async def run(self):
         async with self.client.get("http://localhost:8080/") as resp:
             pass
+
+
+class PacedUser(HttpUser):
+    # start an iteration every 2s on average (exponentially distributed, so all users combined make a Poisson process).
+    # Use pacing = 2 for a fixed interval, or think_time=True to wait after each iteration instead of between starts
+    pacing = exponential(2)
+
+    async def run(self):
+        async with self.client.get("http://localhost:8080/") as resp:
+            pass
@@ -0,0 +1,17 @@
+# A capacity search finds the highest load that meets your SLO. It adds 20 users every 30s until p95 response time
+# goes above 500ms or more than 1% of requests fail, then bisects between the last step that met the SLO and the
+# first that didn't. The summary ends with a table of all the steps and the result.
+#
+# Use rate=True to search for the highest arrival rate (iterations per second) instead, and warmup to leave the first
+# seconds of each step out of the evaluation.
+
+from aiolocust import HttpUser
+from aiolocust.capacity import CapacitySearch
+
+shape = CapacitySearch(step=20, step_duration=30, p95_ms=500, error_rate=0.01, max_load=1000)
+
+
+class MyUser(HttpUser):
+    async def run(self):
+        async with self.client.get("http://localhost:8080/") as resp:
+            pass
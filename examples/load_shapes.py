@@ -0,0 +1,35 @@
+# Instead of stages, a locustfile can define a load shape.
+# The built-in shapes are step, spike, sine (e.g. for a daily pattern) and from_csv (points from a file),
+# all of which can also describe an arrival rate (iterations per second) instead of a user count, using rate=True
+#
+# For example, this ramps between 10 and 100 users following a sine curve with a period of 10 minutes, for an hour:
+#
+# shape = shapes.sine(low=10, high=100, period=600, duration=3600)
+#
+# And this holds 50 iterations/s for 5 minutes, except for a 30s spike to 500/s after 2 minutes:
+#
+# shape = shapes.spike(base=50, peak=500, duration=300, spike_at=120, spike_duration=30, rate=True)
+#
+# For anything else, subclass LoadShape and return the target (or None to stop the test) for a point in time.
+
+import asyncio
+import math
+
+from aiolocust import HttpUser
+from aiolocust.shapes import LoadShape
+
+
+class SawtoothShape(LoadShape):
+    interval = 0.5  # how often target() is called
+
+    def target(self, elapsed: float) -> float | None:
+        if elapsed > 120:
+            return None
+        return 5 + 2 * math.floor(elapsed % 30)  # ramp up from 5 to 63 users, then drop back, every 30s
+
+
+class MyUser(HttpUser):
+    async def run(self):
+        async with self.client.get("http://localhost:8080/") as resp:
+            pass
+        await asyncio.sleep(0.1)
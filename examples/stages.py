@@ -1,6 +1,14 @@
 # If you want to vary load over time, you can specify stages in the config.
 # For example, this will ramp up with one user/second and then ramp down with two users/second:
 # aiolocust --config '{ "stages": [{"duration": 10, "target": 10}, {"duration": 5, "target": 0}] }'
+#
+# Stages can also specify an arrival rate (iterations per second) instead of a user count. Iterations are then started
+# at that rate (optionally with Poisson distributed arrivals) by a fixed pool of max_users users.
+# For example, this will ramp up to 100 iterations/s over 10s and then keep that rate for 60s:
+# aiolocust --config '{ "stages": [{"duration": 10, "rate": 100}, {"duration": 60, "rate": 100}], "max_users": 50, "arrival": "poisson" }'
+# (for a constant rate you can also just use: aiolocust --arrival-rate 100 -u 50 -d 60)
+#
+# For step, spike or sine shaped load (or your own function of time), see load_shapes.py
 
 import asyncio
 
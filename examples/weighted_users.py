@@ -0,0 +1,29 @@
+# With multiple User classes, users are started in proportion to their weight (80% browse, 20% checkout in this case),
+# keeping the ratio exact while ramping up and down. Users with fixed_count are always started first.
+# aiolocust examples/weighted_users.py -u 10 -r 2
+
+from aiolocust import HttpUser
+
+
+class BrowseUser(HttpUser):
+    weight = 4
+
+    async def run(self):
+        async with self.client.get("http://localhost:8080/") as resp:
+            pass
+
+
+class CheckoutUser(HttpUser):
+    weight = 1
+
+    async def run(self):
+        async with self.client.post("http://localhost:8080/checkout") as resp:
+            pass
+
+
+class AdminUser(HttpUser):
+    fixed_count = 1
+
+    async def run(self):
+        async with self.client.get("http://localhost:8080/admin") as resp:
+            pass
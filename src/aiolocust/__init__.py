@@ -2,8 +2,27 @@ from abc import ABC, abstractmethod
 from contextlib import asynccontextmanager
 from typing import TYPE_CHECKING
 
+from aiolocust.pacing import Pacing
+
 
 class User(ABC):
+    weight: int = 1
+    """
+    Relative number of users of this class, when there are multiple User classes (e.g. 4 and 1 gives an 80/20 split).
+    """
+
+    fixed_count: int = 0
+    """
+    If set, exactly this many users of this class are started (before any weighted ones), regardless of weight.
+    """
+
+    pacing: float | Pacing | None = None
+    """
+    Target time (in seconds) from the start of one iteration to the start of the next.
+    If an iteration finishes early the user waits, if it overruns the next one starts immediately (and the overrun
+    is reported). For random intervals, or think time measured from the end of each iteration, see aiolocust.pacing
+    """
+
     def __init__(self, runner: Runner | None = None, **kwargs):
         self.runner: Runner = runner  # pyright: ignore[reportAttributeAccessIssue] # always set outside of unit testing
         self.running = True
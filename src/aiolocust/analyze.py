@@ -0,0 +1,93 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+
+from rich.console import Console
+from rich.table import Table
+
+from aiolocust.datatypes import RequestEntry
+from aiolocust.recorder import read_chunks
+from aiolocust.stats import make_row, new_table
+
+
+@dataclass
+class Analysis:
+    entries: dict[str, RequestEntry] = field(default_factory=lambda: defaultdict(RequestEntry))
+    # total for each time slice, keyed by slice start time
+    slices: dict[float, RequestEntry] = field(default_factory=lambda: defaultdict(RequestEntry))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    statuses: dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    start_time: float = math.inf
+    end_time: float = 0.0
+
+
+def analyze_recording(path: Path, slice_length: float = 10.0) -> Analysis:
+    """
+    Aggregate a recording chunk by chunk, reading the columns straight from the memory mapped file,
+    so that memory use depends on the number of names and slices rather than the number of requests.
+    """
+    analysis = Analysis()
+    entries, slices, errors, statuses = analysis.entries, analysis.slices, analysis.errors, analysis.statuses
+    for columns, names, error_messages in read_chunks(path):
+        timestamps = columns["timestamp"]
+        if not len(timestamps):
+            continue
+        analysis.start_time = min(analysis.start_time, min(timestamps))
+        analysis.end_time = max(analysis.end_time, max(timestamps))
+        name_entries = [entries[name] for name in names]  # by id, saves a string lookup per request
+        for timestamp, name_id, ttfb, ttlb, error_id, status in zip(
+            timestamps,
+            columns["name"],
+            columns["ttfb"],
+            columns["ttlb"],
+            columns["error"],
+            columns["status"],
+            strict=True,
+        ):
+            name_entries[name_id].record(ttfb, ttlb, error_id != 0)
+            slices[timestamp // slice_length * slice_length].record(ttfb, ttlb, error_id != 0)
+            if error_id:
+                errors[error_messages[error_id]] += 1
+            statuses[status] += 1
+    entries.pop("", None)  # the unused id 0
+    return analysis
+
+
+def print_analysis(analysis: Analysis, slice_length: float, console: Console) -> None:
+    if not analysis.entries:
+        console.print("No requests recorded")
+        return
+    start, end = analysis.start_time, max(analysis.end_time, analysis.start_time + 0.001)
+
+    summary_table = new_table()
+    summary_table.title = f"{datetime.fromtimestamp(start).strftime('%Y-%m-%d %H:%M:%S')} - {datetime.fromtimestamp(end).strftime('%H:%M:%S')} ({end - start:.2f}s)"
+    total = RequestEntry()
+    for name, entry in sorted(analysis.entries.items(), key=lambda item: item[1].count, reverse=True):
+        total += entry
+        summary_table.add_row(*make_row(name, entry, start, end))
+    summary_table.add_row(*make_row("Total", total, start, end))
+    console.print(summary_table)
+
+    slice_table = new_table(first_column="Time")
+    slice_table.title = f"Total per {slice_length:g}s"
+    for slice_start, entry in sorted(analysis.slices.items()):
+        label = datetime.fromtimestamp(slice_start).strftime("%H:%M:%S")
+        slice_table.add_row(*make_row(label, entry, slice_start, slice_start + slice_length))
+    console.print(slice_table)
+
+    if analysis.errors:
+        error_table = Table(show_edge=False, title="Errors")
+        error_table.add_column("Count", justify="right")
+        error_table.add_column("Error")
+        for message, count in sorted(analysis.errors.items(), key=lambda item: item[1], reverse=True):
+            error_table.add_row(str(count), message)
+        console.print(error_table)
+
+    status_table = Table(show_edge=False, title="Status codes")
+    status_table.add_column("Status", justify="right")
+    status_table.add_column("Count", justify="right")
+    for status, count in sorted(analysis.statuses.items()):
+        status_table.add_row(str(status) if status else "none", str(count))
+    console.print(status_table)
@@ -0,0 +1,162 @@
+"""
+Capacity search: find the highest load that meets a service level objective (SLO), instead of hand-tuning --users.
+
+The load (a user count, or an arrival rate) is stepped up until a step breaks the SLO, by having a p95 response time
+above p95_ms or too many failed requests. Then the search backs off and bisects between the highest load that met
+the SLO and the lowest one that didn't, until they are within resolution of each other. Each step is evaluated on the
+requests made during it, leaving out the first warmup seconds (to let things settle after a change).
+
+Define one in your locustfile:
+
+    shape = CapacitySearch(step=20, step_duration=30, p95_ms=500, error_rate=0.01)
+"""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+
+from rich.table import Table
+
+from aiolocust.datatypes import RequestEntry
+from aiolocust.shapes import LoadShape
+
+
+@dataclass
+class CapacityStep:
+    phase: str  # "step" (stepping up) or "bisect"
+    load: float
+    requests: int
+    rate: float  # requests per second
+    p95_ms: float
+    error_rate: float  # 0-1
+    passed: bool
+
+
+class CapacitySearch(LoadShape):
+    """
+    Steps the target user count (or arrival rate, if rate is True) starting at start (default: step) and going no
+    higher than max_load. The search itself is driven by the runner, which calls run() when the test starts
+    """
+
+    def __init__(
+        self,
+        step: float,
+        step_duration: float = 30.0,
+        p95_ms: float | None = None,
+        error_rate: float | None = 0.01,
+        start: float | None = None,
+        max_load: float | None = None,
+        resolution: float | None = None,
+        warmup: float = 0.0,
+        rate: bool = False,
+    ):
+        if p95_ms is None and error_rate is None:
+            raise ValueError("A capacity search needs an SLO (p95_ms and/or error_rate)")
+        if step <= 0:
+            raise ValueError(f"step must be positive, got {step}")
+        if not 0 <= warmup < step_duration:
+            raise ValueError(f"warmup ({warmup}s) must be shorter than step_duration ({step_duration}s)")
+        self.step = step
+        self.step_duration = step_duration
+        self.p95_ms = p95_ms
+        self.error_rate = error_rate
+        self.max_load = max_load
+        self.warmup = warmup
+        self.rate = rate
+        # by default, stop bisecting at a tenth of a step (or a single user)
+        self.resolution = resolution or (step / 10 if rate else max(round(step / 10), 1))
+        self.load: float | None = start or step  # None once the search is done
+        self.steps: list[CapacityStep] = []
+        self.passed: float | None = None  # highest load that met the SLO
+        self.failed: float | None = None  # lowest load that didn't
+
+    def target(self, elapsed: float) -> float | None:
+        return self.load
+
+    async def run(self, take_window: Callable[[], Awaitable[RequestEntry]]) -> None:
+        """Hold each load for step_duration, then evaluate it. take_window() returns the stats since its last call"""
+        while self.load is not None:
+            if self.warmup:
+                await asyncio.sleep(self.warmup)
+            await take_window()
+            start = time.monotonic()
+            await asyncio.sleep(self.step_duration - self.warmup)
+            self.record(await take_window(), time.monotonic() - start)
+
+    def record(self, window: RequestEntry, duration: float) -> None:
+        """Evaluate the step that just ended (with the stats of its duration seconds), and pick the next load"""
+        assert self.load is not None
+        p95_ms = window.ttlb_percentiles_ms([0.95])[0]
+        error_rate = window.errorcount / window.count if window.count else 0.0
+        passed = (
+            window.count > 0  # no requests at all is not a pass
+            and (self.p95_ms is None or p95_ms <= self.p95_ms)
+            and (self.error_rate is None or error_rate <= self.error_rate)
+        )
+        phase = "step" if self.failed is None else "bisect"
+        rate = window.count / duration
+        self.steps.append(CapacityStep(phase, self.load, window.count, rate, p95_ms, error_rate, passed))
+        if passed:
+            self.passed = max(self.passed or 0, self.load)
+        else:
+            self.failed = min(self.failed or self.load, self.load)
+        self.load = self.next_load()
+
+    def next_load(self) -> float | None:
+        assert self.load is not None
+        if self.failed is None:
+            load = self.load + self.step
+            return None if self.max_load is not None and load > self.max_load else load
+        low = self.passed or 0
+        if self.failed - low <= self.resolution:
+            return None
+        middle = (low + self.failed) / 2
+        return middle if self.rate else round(middle)
+
+    def format_load(self, load: float) -> str:
+        return f"{load:g}/s" if self.rate else f"{load:.0f} users"
+
+    def slo(self) -> str:
+        limits = []
+        if self.p95_ms is not None:
+            limits.append(f"p95 <= {self.p95_ms:g}ms")
+        if self.error_rate is not None:
+            limits.append(f"errors <= {self.error_rate:.1%}")
+        return ", ".join(limits)
+
+    def get_table(self) -> Table:
+        table = Table(title="Capacity search", show_edge=False)
+        table.add_column("Step", justify="right")
+        table.add_column("Phase")
+        table.add_column("Rate" if self.rate else "Users", justify="right")
+        table.add_column("Requests", justify="right")
+        table.add_column("Req/s", justify="right")
+        table.add_column("p95", justify="right")
+        table.add_column("Errors", justify="right")
+        table.add_column("SLO")
+        for i, step in enumerate(self.steps, 1):
+            table.add_row(
+                str(i),
+                step.phase,
+                f"{step.load:g}",
+                str(step.requests),
+                f"{step.rate:.2f}/s",
+                f"{step.p95_ms:4.1f}ms",
+                f"{step.error_rate:.1%}",
+                "[green]met[/green]" if step.passed else "[red]missed[/red]",
+            )
+        return table
+
+    def summary(self) -> str:
+        if self.passed is None:
+            result = f"No load level met the SLO ({self.slo()})"
+        else:
+            result = f"Capacity: {self.format_load(self.passed)} met the SLO ({self.slo()})"
+            if self.failed is not None:
+                result += f", {self.format_load(self.failed)} didn't"
+            elif self.load is None:
+                result += ", up to max_load"
+        if self.load is not None:
+            result += " (the search was stopped before it finished)"
+        return result
@@ -16,11 +16,25 @@ users: int = 1
 duration: int | None = None
 rate: float | None = None
 iterations: int | None = None
+arrival_rate: float | None = None
+stop_timeout: float = 10.0
 host: str | None = None
 instrument: bool = False
 log_level: LogLevel = LogLevel.info
 config: dict | None = None
-event_loops: int | None = None
+event_loops: int | str | None = None
+processes: int | None = None
+coordinator: bool = False
+expect_workers: int = 1
+coordinator_port: int = 5557
+worker: str | None = None
+instance_index: int = 0
+instance_count: int = 1
+start_at: float | None = None
+run_id: str | None = None
+rebalance: bool = False
 html_report: Path | None = None
+co_correction: bool = False
+record: Path | None = None
 profile: str | None = None
 _version: bool = False
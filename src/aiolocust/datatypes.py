@@ -1,6 +1,13 @@
+import math
 import sys
 import threading
-from dataclasses import dataclass
+from bisect import bisect_left
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+
+# the message tasks are cancelled with when they don't finish within the stop timeout,
+# and the error recorded for any requests they were in the middle of
+CANCELLED_AT_SHUTDOWN = "cancelled at shutdown"
 
 
 @dataclass(slots=True)
@@ -9,6 +16,81 @@ class Request:
     ttfb: float
     ttlb: float
     error: Exception | bool | str | None
+    status: int = 0  # e.g. HTTP status code, 0 if there was no response (or the concept doesn't apply)
+
+
+class LatencyHistogram:
+    """
+    A log-linear (HDR-style) latency histogram with bounded size and fixed relative error.
+
+    Values are bucketed with microsecond resolution. Below 128us every value gets its own bucket, above that each
+    power of two is split into 64 buckets, so a reported value is never more than ~0.8% off. Values above ~19 hours
+    are clamped, which caps the number of buckets at 2048. Merging is just adding counts of the non-empty buckets.
+    """
+
+    __slots__ = ("counts",)
+
+    SUB_BUCKET_BITS = 7
+    MAX_VALUE_US = (1 << 36) - 1
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+
+    def __iadd__(self, other: LatencyHistogram):
+        counts = self.counts
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+        return self
+
+    def record(self, value: float) -> None:
+        us = int(value * 1_000_000)
+        if us >= 1 << self.SUB_BUCKET_BITS:
+            if us > self.MAX_VALUE_US:
+                us = self.MAX_VALUE_US
+            shift = us.bit_length() - self.SUB_BUCKET_BITS
+            index = (shift << (self.SUB_BUCKET_BITS - 1)) + (us >> shift)
+        else:
+            index = max(us, 0)
+        self.counts[index] = self.counts.get(index, 0) + 1
+
+    @classmethod
+    def bucket_range(cls, index: int) -> tuple[float, float]:
+        """Lower (inclusive) and upper (exclusive) bound of a bucket, in seconds"""
+        if index < 1 << cls.SUB_BUCKET_BITS:
+            return index / 1_000_000, (index + 1) / 1_000_000
+        shift = (index >> (cls.SUB_BUCKET_BITS - 1)) - 1
+        sub_bucket = index - (shift << (cls.SUB_BUCKET_BITS - 1))
+        return (sub_bucket << shift) / 1_000_000, ((sub_bucket + 1) << shift) / 1_000_000
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts.values())
+
+    def percentiles(self, quantiles: Iterable[float]) -> list[float]:
+        """Values (midpoint of the matching bucket, in seconds) for each quantile (0.0-1.0, in ascending order)"""
+        total = self.count
+        if not total:
+            return [0.0 for _ in quantiles]
+        result = []
+        buckets = iter(sorted(self.counts.items()))
+        seen = 0
+        index = 0
+        for quantile in quantiles:
+            target = max(math.ceil(quantile * total), 1)
+            while seen < target:
+                index, count = next(buckets)
+                seen += count
+            low, high = self.bucket_range(index)
+            result.append((low + high) / 2)
+        return result
+
+    def bucket_counts(self, boundaries: Sequence[float]) -> list[int]:
+        """Re-bucket into explicit boundaries (like the ones used by OTel histograms)"""
+        bucket_counts = [0] * (len(boundaries) + 1)
+        for index, count in self.counts.items():
+            low, high = self.bucket_range(index)
+            bucket_counts[bisect_left(boundaries, (low + high) / 2)] += count
+        return bucket_counts
 
 
 @dataclass(slots=True)
@@ -17,6 +99,19 @@ class RequestEntry:
     errorcount: int = 0
     sum_ttlb: float = 0.0
     max_ttlb: float = 0.0
+    min_ttlb: float = math.inf
+    ttlb_histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    sum_ttfb: float = 0.0
+    max_ttfb: float = 0.0
+    min_ttfb: float = math.inf
+    ttfb_histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    # latency measured from when the request should have been sent, if the iteration started late
+    # (only recorded when running with coordinated omission correction)
+    corrected_count: int = 0
+    sum_corrected: float = 0.0
+    max_corrected: float = 0.0
+    min_corrected: float = math.inf
+    corrected_histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
 
     def __iadd__(self, other: RequestEntry):
         if isinstance(other, RequestEntry):
@@ -24,8 +119,45 @@ class RequestEntry:
             self.errorcount += other.errorcount
             self.sum_ttlb += other.sum_ttlb
             self.max_ttlb = max(self.max_ttlb, other.max_ttlb)
+            self.min_ttlb = min(self.min_ttlb, other.min_ttlb)
+            self.ttlb_histogram += other.ttlb_histogram
+            self.sum_ttfb += other.sum_ttfb
+            self.max_ttfb = max(self.max_ttfb, other.max_ttfb)
+            self.min_ttfb = min(self.min_ttfb, other.min_ttfb)
+            self.ttfb_histogram += other.ttfb_histogram
+            self.corrected_count += other.corrected_count
+            self.sum_corrected += other.sum_corrected
+            self.max_corrected = max(self.max_corrected, other.max_corrected)
+            self.min_corrected = min(self.min_corrected, other.min_corrected)
+            self.corrected_histogram += other.corrected_histogram
             return self
 
+    def record(self, ttfb: float, ttlb: float, error: bool) -> None:
+        self.count += 1
+        if error:
+            self.errorcount += 1
+        self.sum_ttlb += ttlb
+        if ttlb > self.max_ttlb:
+            self.max_ttlb = ttlb
+        if ttlb < self.min_ttlb:
+            self.min_ttlb = ttlb
+        self.ttlb_histogram.record(ttlb)
+        self.sum_ttfb += ttfb
+        if ttfb > self.max_ttfb:
+            self.max_ttfb = ttfb
+        if ttfb < self.min_ttfb:
+            self.min_ttfb = ttfb
+        self.ttfb_histogram.record(ttfb)
+
+    def record_corrected(self, corrected_ttlb: float) -> None:
+        self.corrected_count += 1
+        self.sum_corrected += corrected_ttlb
+        if corrected_ttlb > self.max_corrected:
+            self.max_corrected = corrected_ttlb
+        if corrected_ttlb < self.min_corrected:
+            self.min_corrected = corrected_ttlb
+        self.corrected_histogram.record(corrected_ttlb)
+
     def rate(self, start, end) -> float:
         return self.count / (end - start)
 
@@ -41,6 +173,31 @@ class RequestEntry:
     def max_ttlb_ms(self) -> float:
         return self.max_ttlb * 1000
 
+    @property
+    def avg_ttfb_ms(self) -> float:
+        return self.sum_ttfb / self.count * 1000 if self.count > 0 else 0.0
+
+    # clamp percentiles to min/max, so that we don't report a p99 higher than the max just because of bucket resolution
+    def ttlb_percentiles_ms(self, quantiles: Iterable[float]) -> list[float]:
+        return [
+            min(max(value, self.min_ttlb), self.max_ttlb) * 1000 for value in self.ttlb_histogram.percentiles(quantiles)
+        ]
+
+    def ttfb_percentiles_ms(self, quantiles: Iterable[float]) -> list[float]:
+        return [
+            min(max(value, self.min_ttfb), self.max_ttfb) * 1000 for value in self.ttfb_histogram.percentiles(quantiles)
+        ]
+
+    def corrected_percentiles_ms(self, quantiles: Iterable[float]) -> list[float]:
+        return [
+            min(max(value, self.min_corrected), self.max_corrected) * 1000
+            for value in self.corrected_histogram.percentiles(quantiles)
+        ]
+
+    @property
+    def max_corrected_ms(self) -> float:
+        return self.max_corrected * 1000
+
     @property
     def error_percentage(self) -> float:
         return self.errorcount / self.count * 100.0 if self.count > 0 else 0.0
@@ -49,20 +206,76 @@ class RequestEntry:
 @dataclass
 class Stage:
     duration: float
-    target: int
+    target: int = 0
+    rate: float | None = None  # iterations per second, for arrival rate (open model) tests
+
 
+class IterationLease:
+    """Iterations leased by one thread. The lock is normally only taken by that thread, so it is uncontended"""
 
-class SafeCounter:
-    """A thread-safe counter."""
+    __slots__ = ("remaining", "used", "lock")
 
-    def __init__(self, limit: int | None = None):
-        self.value = 0
+    def __init__(self):
+        self.remaining = 0
+        self.used = 0  # iterations started by this thread
+        self.lock = threading.Lock()
+
+
+class IterationBudget:
+    """
+    Hands out a limited number of iterations to many threads (in practice, event loops) without them all
+    contending for the same lock: each thread leases a chunk of iterations from the shared pool and counts it
+    down locally. Chunks get smaller as the pool runs out, and a thread that finds the pool empty takes what is
+    left in other threads' leases, so exactly limit iterations are started (unless the users stop before that).
+    """
+
+    def __init__(self, limit: int | None = None, max_lease: int = 100):
         self.limit = limit if limit is not None else sys.maxsize
+        self.pool = self.limit
+        self.max_lease = max_lease
+        self.leases: list[IterationLease] = []
         self.lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def value(self) -> int:
+        """Iterations started so far"""
+        with self.lock:
+            return sum(lease.used for lease in self.leases)
+
+    def _get_lease(self) -> IterationLease:
+        try:
+            return self._local.lease
+        except AttributeError:
+            lease = self._local.lease = IterationLease()
+            with self.lock:
+                self.leases.append(lease)
+            return lease
 
-    def increment(self) -> bool:
+    def take(self) -> bool:
+        """Take one iteration, returns False if the limit has been reached"""
+        lease = self._get_lease()
+        with lease.lock:
+            if lease.remaining:
+                lease.remaining -= 1
+                lease.used += 1
+                return True
         with self.lock:
-            if self.value < self.limit:
-                self.value += 1
-                return False
+            if self.pool:
+                # leave enough in the pool for the other threads to get some too
+                chunk = min(self.max_lease, self.pool // (4 * len(self.leases)) + 1)
+                self.pool -= chunk
+                with lease.lock:
+                    lease.remaining += chunk - 1
+                    lease.used += 1
+                return True
+            leases = list(self.leases)
+        for other in leases:
+            with other.lock:
+                if not other.remaining:
+                    continue
+                other.remaining -= 1
+            with lease.lock:
+                lease.used += 1
             return True
+        return False
@@ -0,0 +1,264 @@
+"""
+Running a test on several machines: one coordinator (--coordinator) and any number of workers (--worker HOST).
+
+Workers connect to the coordinator over TCP. Once the expected number of them have connected, the coordinator sends
+each one the locustfile, the options (and so the stage plan), its index and a shared start time. Each worker runs its
+share of the users, just like a process started using --processes, and sends back what it has recorded since its
+previous message about once per second: request counts, sums and latency histograms, which merge exactly. So the
+console table, the summary, the HTML report and the OTel request metrics all come from the coordinator.
+
+Messages are JSON objects, prefixed by their length. The coordinator turns away workers that speak a different
+PROTOCOL_VERSION. Workers run whatever locustfile the coordinator sends them,
+so only ever point them at a coordinator you trust, on a network you trust.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import socket
+import struct
+import threading
+import time
+
+from aiolocust.processes import FINAL_PUBLISH_TIMEOUT, StatsAggregator, StatsDeltas
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5557
+# how often workers send their stats
+NETWORK_PUBLISH_INTERVAL = 1.0
+# time between sending the start message and starting the test, for the workers to load the locustfile
+START_DELAY = 2.0
+# how often a worker retries connecting to a coordinator that isn't up yet
+CONNECT_RETRY_INTERVAL = 1.0
+# bumped whenever the messages change in a way that older workers or coordinators can't handle
+PROTOCOL_VERSION = 1
+
+_HEADER = struct.Struct("!I")
+
+
+def encode_message(message: dict) -> bytes:
+    data = json.dumps(message, separators=(",", ":")).encode()
+    return _HEADER.pack(len(data)) + data
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict | None:
+    """The next message, or None if the connection was closed"""
+    try:
+        (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+        return json.loads(await reader.readexactly(length))
+    except asyncio.IncompleteReadError, ConnectionError:
+        return None
+
+
+def _recv_exactly(sock: socket.socket, length: int) -> bytes | None:
+    chunks = []
+    while length:
+        chunk = sock.recv(min(length, 1024 * 1024))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock: socket.socket) -> dict | None:
+    """Blocking version of read_message(), for the worker side"""
+    try:
+        if (header := _recv_exactly(sock, _HEADER.size)) is None:
+            return None
+        (length,) = _HEADER.unpack(header)
+        if (data := _recv_exactly(sock, length)) is None:
+            return None
+        return json.loads(data)
+    except OSError:
+        return None
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    """HOST or HOST:PORT"""
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, DEFAULT_PORT
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError(f"Invalid coordinator address {address!r}, expected HOST or HOST:PORT")
+
+
+class WorkerGroup(StatsAggregator):
+    """
+    The coordinator's side: accepts worker connections, starts the test on all of them at once and merges their
+    stats into its own. Runs on the coordinator's event loop.
+    """
+
+    def __init__(self, count: int, payload: dict, host: str = "", port: int = DEFAULT_PORT):
+        super().__init__(count)
+        self.count = count
+        self.payload = payload  # what every worker needs to run the test: the locustfile and the options
+        self.host = host
+        self.port = port
+        self.server: asyncio.Server | None = None
+        self.writers: list[asyncio.StreamWriter] = []  # in order of connection, which becomes their index at start
+        self.started = False
+        self.running: set[int] = set()  # indexes of workers that haven't sent their final stats yet
+
+    async def listen(self) -> None:
+        self.server = await asyncio.start_server(self._handle, self.host or None, self.port)
+
+    @property
+    def ready(self) -> bool:
+        """True once the expected number of workers have connected"""
+        return len(self.writers) == self.count
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        hello = await read_message(reader)
+        if hello is None or hello.get("type") != "hello":
+            writer.close()
+            return
+        if (version := hello.get("version")) != PROTOCOL_VERSION:
+            logger.warning(
+                f"Rejected worker {hello.get('hostname')} ({peer[0]}), it uses protocol version {version} "
+                f"instead of {PROTOCOL_VERSION} (run the same version of aiolocust everywhere)"
+            )
+            reason = f"protocol version mismatch, the coordinator uses {PROTOCOL_VERSION} and this worker {version}"
+            writer.write(encode_message({"type": "reject", "reason": reason}))
+            writer.close()
+            return
+        if self.started or self.ready:
+            logger.warning(f"Rejected worker {hello.get('hostname')} ({peer[0]}), already have {self.count}")
+            writer.write(encode_message({"type": "reject", "reason": f"the coordinator already has {self.count}"}))
+            writer.close()
+            return
+        self.writers.append(writer)
+        logger.info(f"Worker {hello.get('hostname')} ({peer[0]}) connected ({len(self.writers)}/{self.count})")
+        # workers send nothing more until the test has started, so this also notices disconnects while waiting
+        message = await read_message(reader)
+        if message is None and not self.started:
+            logger.warning(f"Worker {hello.get('hostname')} ({peer[0]}) disconnected before the test started")
+            self.writers.remove(writer)
+            writer.close()
+            return
+        index = self.writers.index(writer)
+        while message is not None:
+            final = message.pop("final", False)
+            self.merge_snapshot(index, message)
+            if final:
+                break
+            message = await read_message(reader)
+        else:
+            logger.warning(f"Lost the connection to worker {index} ({peer[0]}) before it sent its final stats")
+        self.running.discard(index)
+        writer.close()
+
+    def start(self, start_at: float) -> None:
+        """Tell all workers to start the test at start_at (wall clock time, so the machines' clocks need to be in sync)"""
+        self.started = True
+        self.running = set(range(self.count))
+        for index, writer in enumerate(self.writers):
+            message = {"type": "start", "index": index, "count": self.count, "start_at": start_at, **self.payload}
+            writer.write(encode_message(message))
+
+    @property
+    def alive(self) -> bool:
+        return bool(self.running)
+
+    def stop(self) -> None:
+        for index in self.running:
+            self.writers[index].write(encode_message({"type": "stop"}))
+
+    def close(self) -> None:
+        if self.server:
+            self.server.close()
+        for writer in self.writers:
+            writer.close()
+
+
+class NetworkPublisher:
+    """
+    The worker's side: sends its stats to the coordinator, and listens for it asking us to stop. Both happen on
+    background threads, so that a slow network never holds up the event loop
+    """
+
+    interval = NETWORK_PUBLISH_INTERVAL
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.deltas = StatsDeltas()
+        self._stop = threading.Event()
+        self._closed = threading.Event()
+        self._outbox: queue.SimpleQueue[dict | None] = queue.SimpleQueue()  # None means there is nothing more to send
+        self._send_failed = False
+        threading.Thread(target=self._listen, name="aiolocust-coordinator", daemon=True).start()
+        self._sender = threading.Thread(target=self._send, name="aiolocust-coordinator-send", daemon=True)
+        self._sender.start()
+
+    def _listen(self) -> None:
+        # the only thing the coordinator sends after the start message is a request to stop, and it closes the
+        # connection once it has our final stats. Losing the connection means stopping too
+        while (message := recv_message(self.sock)) is not None:
+            if message.get("type") == "stop":
+                self._stop.set()
+        self._stop.set()
+        self._closed.set()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop.is_set()
+
+    def _send(self) -> None:
+        while (message := self._outbox.get()) is not None:
+            try:
+                self.sock.sendall(encode_message(message))
+            except OSError as e:
+                logger.warning(f"Failed to send stats to the coordinator: {e}")
+                self._send_failed = True
+                self._stop.set()
+                return
+
+    def publish(self, state: dict) -> bool:
+        """Queue a snapshot for sending. Nothing is resent if the connection fails, but then the test is over anyway"""
+        self._outbox.put(self.deltas.snapshot(state))
+        self.deltas.clear()
+        return True
+
+    def _finish(self) -> None:
+        self._sender.join(FINAL_PUBLISH_TIMEOUT)
+        if not self._send_failed:
+            self._closed.wait(FINAL_PUBLISH_TIMEOUT)
+
+    async def publish_final(self, state: dict) -> None:
+        """Send everything that's left, and wait for the coordinator to close the connection"""
+        self._outbox.put({**self.deltas.snapshot(state), "final": True})
+        self._outbox.put(None)
+        await asyncio.to_thread(self._finish)
+        self.sock.close()
+
+
+def connect(address: str) -> tuple[NetworkPublisher, dict]:
+    """
+    Connect to the coordinator (waiting for it to come up, if needed) and wait for it to start the test.
+    Returns the publisher and the start message.
+    """
+    host, port = parse_address(address)
+    logged = False
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError as e:
+            if not logged:
+                logger.info(f"Waiting for the coordinator at {host}:{port} ({e})")
+                logged = True
+            time.sleep(CONNECT_RETRY_INTERVAL)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(encode_message({"type": "hello", "version": PROTOCOL_VERSION, "hostname": socket.gethostname()}))
+    logger.info(f"Connected to the coordinator at {host}:{port}, waiting for the test to start")
+    message = recv_message(sock)
+    if message is None:
+        raise ConnectionError("The coordinator closed the connection before starting the test")
+    if message.get("type") == "reject":
+        raise ConnectionError(f"The coordinator rejected this worker: {message['reason']}")
+    return NetworkPublisher(sock), message
@@ -0,0 +1,154 @@
+from array import array
+from threading import Lock
+
+from aiolocust.datatypes import RequestEntry
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+# 24 hours worth of 2 second intervals
+HISTORY_CAPACITY = 43200
+
+# typecodes for per-name columns. Latencies are stored as float32 milliseconds, to keep long runs small
+SERIES_COLUMNS = {
+    "seq": "I",
+    "count": "I",
+    "errors": "I",
+    "sum": "d",
+    "max": "f",
+    **{f"p{quantile * 100:g}": "f" for quantile in PERCENTILES},
+}
+
+
+class RingBuffer:
+    """Fixed capacity, column-wise storage backed by arrays. Once full, the oldest row is overwritten."""
+
+    def __init__(self, capacity: int, columns: dict[str, str]):
+        self.capacity = capacity
+        self.columns = {name: array(typecode) for name, typecode in columns.items()}
+        self.length = 0
+        self.next = 0  # slot to overwrite next, once we're full
+
+    def __len__(self) -> int:
+        return self.length
+
+    def append(self, *values) -> None:
+        if self.length < self.capacity:
+            for column, value in zip(self.columns.values(), values, strict=True):
+                column.append(value)
+            self.length += 1
+        else:
+            for column, value in zip(self.columns.values(), values, strict=True):
+                column[self.next] = value
+            self.next = (self.next + 1) % self.capacity
+
+    def get(self, column: str) -> list:
+        """All values of a column, oldest first"""
+        data = self.columns[column]
+        return data[self.next :].tolist() + data[: self.next].tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns.values())
+
+
+class StatsHistory:
+    """
+    Per-interval stats for the whole run, kept in memory.
+
+    The timeline (interval start/end and user count) is stored once, and each name has its own series that only
+    gets a row for intervals where it had any requests. The total of all names is a separate series (a request can
+    be named "Total" too). Everything is kept in ring buffers, so very long runs only keep the latest `capacity`
+    intervals.
+    """
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY):
+        self.capacity = capacity
+        self.intervals = RingBuffer(capacity, {"seq": "I", "start": "d", "end": "d", "users": "I"})
+        self.series: dict[str, RingBuffer] = {}
+        self.total = RingBuffer(capacity, SERIES_COLUMNS)
+        self.seq = 0
+        self.lock = Lock()
+
+    def record(
+        self,
+        start: float,
+        end: float,
+        user_count: int,
+        entries: dict[str, RequestEntry],
+        total: RequestEntry | None = None,
+    ) -> None:
+        with self.lock:
+            seq = self.seq
+            self.intervals.append(seq, start, end, user_count)
+            for name, entry in entries.items():
+                if not entry.count:
+                    continue
+                series = self.series.get(name)
+                if series is None:
+                    series = self.series[name] = RingBuffer(self.capacity, SERIES_COLUMNS)
+                self._append(series, seq, entry)
+            if total and total.count:
+                self._append(self.total, seq, total)
+            self.seq += 1
+
+    @staticmethod
+    def _append(series: RingBuffer, seq: int, entry: RequestEntry) -> None:
+        series.append(
+            seq,
+            entry.count,
+            entry.errorcount,
+            entry.sum_ttlb * 1000,
+            entry.max_ttlb_ms,
+            *entry.ttlb_percentiles_ms(PERCENTILES),
+        )
+
+    def names(self) -> list[str]:
+        with self.lock:
+            return list(self.series)
+
+    def timeline(self, since: float | None = None) -> dict[str, list]:
+        """Start/end time and user count of each interval (optionally only those ending after `since`)"""
+        with self.lock:
+            return self._timeline(since)
+
+    def _timeline(self, since: float | None) -> dict[str, list]:
+        timeline = {column: self.intervals.get(column) for column in ("seq", "start", "end", "users")}
+        if since is not None:
+            first = next((i for i, end in enumerate(timeline["end"]) if end >= since), len(timeline["end"]))
+            timeline = {column: values[first:] for column, values in timeline.items()}
+        return timeline
+
+    def get(self, name: str, since: float | None = None) -> dict[str, list]:
+        """
+        Stats for a name, one value per interval in the timeline (zero for intervals without any requests).
+        Columns are start, end, users, count, errors, sum, max and percentiles (p50, p90, ...), all times in ms.
+        """
+        with self.lock:
+            return self._get(self.series.get(name), since)
+
+    def get_total(self, since: float | None = None) -> dict[str, list]:
+        """Like get(), for all names combined"""
+        with self.lock:
+            return self._get(self.total, since)
+
+    def _get(self, series: RingBuffer | None, since: float | None) -> dict[str, list]:
+        timeline = self._timeline(since)
+        seqs = timeline.pop("seq")
+        columns: dict[str, list] = {**timeline}
+        for column in SERIES_COLUMNS:
+            if column != "seq":
+                columns[column] = [0] * len(seqs)
+        if series is None or not seqs:
+            return columns
+        first_seq = seqs[0]
+        series_columns = {column: series.get(column) for column in SERIES_COLUMNS}
+        for row, seq in enumerate(series_columns.pop("seq")):
+            index = seq - first_seq
+            if 0 <= index < len(seqs):
+                for column, values in series_columns.items():
+                    columns[column][index] = values[row]
+        return columns
+
+    @property
+    def nbytes(self) -> int:
+        with self.lock:
+            return self.intervals.nbytes + self.total.nbytes + sum(series.nbytes for series in self.series.values())
@@ -4,19 +4,35 @@ import json
 import logging
 import os
 import sys
+import tempfile
 import traceback
+from datetime import datetime
 from importlib.metadata import version
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
 import click
 import typer
+from typer.core import TyperGroup
 
 import aiolocust
 from aiolocust.config import LogLevel
 from aiolocust.otel import configure_telemetry
 
-app = typer.Typer(add_completion=False)
+if TYPE_CHECKING:
+    from aiolocust.shapes import LoadShape
+
+
+class DefaultCommandGroup(TyperGroup):
+    """Runs the `run` command, unless the first argument is the name of another command (like `analyze`)"""
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or args[0] not in self.commands:
+            args = ["run", *args]
+        return super().parse_args(ctx, args)
+
+
+app = typer.Typer(add_completion=False, cls=DefaultCommandGroup)
 logger = logging.getLogger(__name__)
 # avoid annoying "Using selector: KqueueSelector" when running in debug:
 logging.getLogger("asyncio").setLevel(logging.INFO)
@@ -44,13 +60,121 @@ def load_config(input_string: str) -> dict:
         raise
 
 
+def parse_event_loops(input_string: str) -> int | str:
+    if input_string == "auto":
+        return input_string
+    try:
+        return int(input_string)
+    except ValueError:
+        raise typer.BadParameter(f"must be an integer or auto, got {input_string!r}")
+
+
+def parse_start_at(input_string: str) -> float:
+    try:
+        return float(input_string)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(input_string).timestamp()
+    except ValueError:
+        raise typer.BadParameter(f"must be a unix timestamp or an ISO 8601 date/time, got {input_string!r}")
+
+
 def version_callback(value: bool):
     if value:
         print(f"aiolocust {version('aiolocust')}")
         raise typer.Exit()
 
 
-@app.command(context_settings={"auto_envvar_prefix": "LOCUST"})
+def load_locustfile(file_path: Path) -> tuple[dict[str, type], LoadShape | None]:
+    """Run the locustfile, and return its User classes (by name) and load shape (if it has one)"""
+    from aiolocust import HttpUser, User
+    from aiolocust.shapes import LoadShape
+
+    filename = file_path.name
+    module_name = file_path.stem
+
+    spec = importlib.util.spec_from_file_location(
+        module_name,
+        file_path,
+        submodule_search_locations=[str(file_path.parent)],
+    )
+    if spec is None or spec.loader is None:
+        typer.echo(f"Error: Could not load the file at {file_path}")
+        raise typer.Exit(code=1)
+
+    module = importlib.util.module_from_spec(spec)
+
+    # Add the module to sys.modules so it behaves like a normal import
+    sys.modules[module_name] = module
+
+    SDK_ROOT = Path(__file__).resolve().parent
+
+    def is_ignored_frame(tb):
+        filename = tb.tb_frame.f_code.co_filename
+
+        # 1. Skip frozen / synthetic frames
+        if filename.startswith("<") and filename.endswith(">"):
+            return True
+
+        # 2. Skip your SDK frames
+        try:
+            path = Path(filename).resolve()
+            if path.is_relative_to(SDK_ROOT):
+                return True
+        except Exception:
+            pass
+
+        return False
+
+    # Run any top-level code
+    try:
+        spec.loader.exec_module(module)
+    except BaseException as exc:
+        # if there's an error during import, print the traceback for the user code, but leave out aiolocust and importlib
+        tb = exc.__traceback__
+        logger.debug(f"Error during import of {filename}: {exc}")
+        while tb and is_ignored_frame(tb):
+            tb = tb.tb_next
+
+        traceback.print_exception(type(exc), exc, tb)
+        raise SystemExit(1)
+
+    def is_user_class(item) -> bool:
+        """
+        Check if a variable is a runnable (non-abstract) User class
+        """
+        return bool(inspect.isclass(item)) and issubclass(item, User) and not inspect.isabstract(item)
+
+    user_classes = {name: value for name, value in vars(module).items() if is_user_class(value)}
+    if not user_classes and hasattr(module, "run"):
+
+        class SimpleUser(HttpUser):
+            async def run(self):
+                pass  # This will be overwritten immediately, but needs to be here to satisfy the abstract base class requirement
+
+        SimpleUser.run = module.run
+        user_classes = {"SimpleUser": SimpleUser}
+
+    # a load shape instance (like shape = shapes.sine(...)), or a LoadShape subclass defined in the file
+    shapes = [
+        value() if inspect.isclass(value) else value
+        for value in vars(module).values()
+        if isinstance(value, LoadShape)
+        or (
+            inspect.isclass(value)
+            and issubclass(value, LoadShape)
+            and not inspect.isabstract(value)
+            and value.__module__ == module_name
+        )
+    ]
+    if len(shapes) > 1:
+        typer.echo(f"Error: Only one load shape can be defined, {filename} has {len(shapes)}")
+        raise typer.Exit(code=1)
+    return user_classes, shapes[0] if shapes else None
+
+
+@app.command("run", context_settings={"auto_envvar_prefix": "LOCUST"})
 def main(
     filename: Annotated[
         str,
@@ -65,6 +189,20 @@ def main(
     iterations: Annotated[
         int | None, typer.Option("-i", "--iterations", help="Max total number of iterations to run")
     ] = None,
+    arrival_rate: Annotated[
+        float | None,
+        typer.Option(
+            "--arrival-rate",
+            help="Start this many iterations per second (open model), using a pool of --users users, instead of each user running iterations back to back",
+        ),
+    ] = None,
+    stop_timeout: Annotated[
+        float,
+        typer.Option(
+            "--stop-timeout",
+            help="At shutdown, wait this long for running iterations to finish before cancelling them (seconds, 0 to wait indefinitely)",
+        ),
+    ] = 10.0,
     host: Annotated[str | None, typer.Option("-H", "--host", help="Base URL to target")] = None,
     instrument: Annotated[
         bool,
@@ -88,19 +226,117 @@ def main(
         typer.Option(
             metavar="JSON",
             parser=load_config,
-            help='JSON string or path to JSON file, e.g. \n\n{"stages":[{"duration":10,"target":10},{"duration":5,"target":0}]}',
+            help='JSON string or path to JSON file, e.g. \n\n{"stages":[{"duration":10,"target":10},{"duration":5,"target":0}]}\n\nor, for arrival rate mode:\n\n{"stages":[{"duration":10,"rate":100}],"max_users":50,"arrival":"poisson"}',
         ),
     ] = None,
     event_loops: Annotated[
+        str | None,
+        typer.Option(
+            "--event-loops",
+            metavar="INTEGER|auto",
+            parser=parse_event_loops,
+            help="Set the number of aio event loops, or auto to add/remove loops during the test depending on how busy they are",
+            rich_help_panel="Advanced Configuration",
+        ),
+    ] = None,
+    processes: Annotated[
         int | None,
         typer.Option(
-            "--event-loops", help="Set the number of aio event loops", rich_help_panel="Advanced Configuration"
+            "--processes",
+            help="Run the test in this many (forked) processes, each with its own event loops, for when one process isn't enough (like on GIL builds of Python). Stats are combined as if it were a single process",
+            rich_help_panel="Advanced Configuration",
         ),
     ] = None,
+    coordinator: Annotated[
+        bool,
+        typer.Option(
+            "--coordinator",
+            help="Run a distributed test: wait for --expect-workers workers to connect, then start the test on all of them, splitting the users between them and combining their stats",
+            rich_help_panel="Distributed",
+        ),
+    ] = False,
+    expect_workers: Annotated[
+        int,
+        typer.Option(
+            "--expect-workers",
+            help="Number of workers the coordinator waits for before starting the test",
+            rich_help_panel="Distributed",
+        ),
+    ] = 1,
+    coordinator_port: Annotated[
+        int,
+        typer.Option("--coordinator-port", help="Port for the coordinator to listen on", rich_help_panel="Distributed"),
+    ] = 5557,
+    worker: Annotated[
+        str | None,
+        typer.Option(
+            "--worker",
+            metavar="HOST[:PORT]",
+            help="Run as a worker in a distributed test, getting the locustfile and all options that determine the load from the coordinator at this address",
+            rich_help_panel="Distributed",
+        ),
+    ] = None,
+    instance_index: Annotated[
+        int,
+        typer.Option(
+            "--instance-index",
+            help="Run part INDEX (counting from 0) of a test that is split between --instance-count independent instances",
+            rich_help_panel="Distributed",
+        ),
+    ] = 0,
+    instance_count: Annotated[
+        int,
+        typer.Option(
+            "--instance-count",
+            help="Number of independent instances (without a coordinator) that share the users, arrival rate and iterations of this test",
+            rich_help_panel="Distributed",
+        ),
+    ] = 1,
+    start_at: Annotated[
+        float | None,
+        typer.Option(
+            "--start-at",
+            metavar="TIMESTAMP",
+            parser=parse_start_at,
+            help="Wait until this time (unix timestamp or ISO 8601, like 2026-01-31T12:00:00Z) before starting the test, to start several instances at once",
+            rich_help_panel="Distributed",
+        ),
+    ] = None,
+    run_id: Annotated[
+        str | None,
+        typer.Option(
+            "--run-id",
+            help="Identifies the test run in otel resource attributes (run.id). By default, instances with the same --start-at and file name get the same id",
+            rich_help_panel="Distributed",
+        ),
+    ] = None,
+    rebalance: Annotated[
+        bool,
+        typer.Option(
+            "--rebalance",
+            help="Periodically move users from busy event loops to less busy ones during the test",
+            rich_help_panel="Advanced Configuration",
+        ),
+    ] = False,
     html_report: Annotated[
         Path | None,
         typer.Option("--html-report", help="Write the final summary as a static HTML report"),
     ] = None,
+    co_correction: Annotated[
+        bool,
+        typer.Option(
+            "--co-correction",
+            help="Also report latencies corrected for coordinated omission, measured from each iteration's intended start time (requires pacing to be set on the User)",
+        ),
+    ] = False,
+    record: Annotated[
+        Path | None,
+        typer.Option(
+            "--record",
+            metavar="FILE",
+            help="Record every request to a compact binary file, for analysis with `aiolocust analyze FILE`",
+        ),
+    ] = None,
     profile: Annotated[
         str | None,
         typer.Option(
@@ -125,69 +361,56 @@ def main(
 
     configure_telemetry()
 
-    # delayed imports so that logging is configured first
-    from aiolocust import HttpUser, User
+    # delayed import so that logging is configured first
     from aiolocust.runner import Runner
 
-    file_path = Path(filename).resolve()
-    if not file_path.exists():
-        if filename == "locustfile.py":
+    publisher = None
+    start = {}  # the coordinator's start message, when running as a worker
+    if worker:
+        if coordinator or processes or record or instance_count > 1:
             typer.echo(
-                "Welcome to aiolocust! Create a locustfile.py in your current directory or specify a different one as an argument."
+                "Error: --worker can't be combined with --coordinator, --processes, --record or --instance-count"
             )
-            ctx = click.get_current_context()
-            typer.echo(ctx.get_help())
-        else:
-            typer.echo(f"Error: Could not find the file at {file_path}")
-        raise typer.Exit(code=1)
-
-    module_name = file_path.stem
-
-    spec = importlib.util.spec_from_file_location(
-        module_name,
-        file_path,
-        submodule_search_locations=[str(file_path.parent)],
-    )
-    if spec is None or spec.loader is None:
-        typer.echo(f"Error: Could not load the file at {file_path}")
-        raise typer.Exit(code=1)
-
-    module = importlib.util.module_from_spec(spec)
-
-    # Add the module to sys.modules so it behaves like a normal import
-    sys.modules[module_name] = module
-
-    SDK_ROOT = Path(__file__).resolve().parent
+            raise typer.Exit(code=1)
+        from aiolocust.distributed import connect
 
-    def is_ignored_frame(tb):
-        filename = tb.tb_frame.f_code.co_filename
-
-        # 1. Skip frozen / synthetic frames
-        if filename.startswith("<") and filename.endswith(">"):
-            return True
-
-        # 2. Skip your SDK frames
         try:
-            path = Path(filename).resolve()
-            if path.is_relative_to(SDK_ROOT):
-                return True
-        except Exception:
-            pass
-
-        return False
-
-    # Run any top-level code
-    try:
-        spec.loader.exec_module(module)
-    except BaseException as exc:
-        # if there's an error during import, print the traceback for the user code, but leave out aiolocust and importlib
-        tb = exc.__traceback__
-        logger.debug(f"Error during import of {filename}: {exc}")
-        while tb and is_ignored_frame(tb):
-            tb = tb.tb_next
-
-        traceback.print_exception(type(exc), exc, tb)
-        raise SystemExit(1)
+            publisher, start = connect(worker)
+        except (ConnectionError, ValueError) as e:
+            typer.echo(f"Error: {e}")
+            raise typer.Exit(code=1)
+        # the locustfile comes from the coordinator (cleaned up when we exit)
+        workdir = tempfile.TemporaryDirectory(prefix="aiolocust-")
+        file_path = Path(workdir.name) / start["filename"]
+        file_path.write_text(start["source"], encoding="utf-8")
+        runner_options = start["options"]
+    else:
+        file_path = Path(filename).resolve()
+        if not file_path.exists():
+            if filename == "locustfile.py":
+                typer.echo(
+                    "Welcome to aiolocust! Create a locustfile.py in your current directory or specify a different one as an argument."
+                )
+                ctx = click.get_current_context()
+                typer.echo(ctx.get_help())
+            else:
+                typer.echo(f"Error: Could not find the file at {file_path}")
+            raise typer.Exit(code=1)
+        # everything that determines the load, which is the same for all workers in a distributed test
+        runner_options = {
+            "user_count": users,
+            "duration": duration,
+            "rate": rate,
+            "iterations": iterations,
+            "host": host,
+            "config": config,
+            "co_correction": co_correction,
+            "arrival_rate": arrival_rate,
+            "rebalance": rebalance,
+            "stop_timeout": stop_timeout or None,
+        }
+
+    user_classes, shape = load_locustfile(file_path)
 
     # apply --instrument option after loading script, so that any code based instrumentation takes precedence
     if instrument:
@@ -195,37 +418,61 @@ def main(
 
         AioHttpClientInstrumentor().instrument()
 
-    def is_user_class(item) -> bool:
-        """
-        Check if a variable is a runnable (non-abstract) User class
-        """
-        return bool(inspect.isclass(item)) and issubclass(item, User) and not inspect.isabstract(item)
+    if not user_classes:
+        typer.echo(f"Error: No User classes or run function defined in {file_path.name}")
+        return
+
+    worker_group = None
+    if coordinator:
+        from aiolocust.distributed import WorkerGroup
+
+        payload = {
+            "filename": file_path.name,
+            "source": file_path.read_text(encoding="utf-8"),
+            "options": runner_options,
+        }
+        worker_group = WorkerGroup(expect_workers, payload, port=coordinator_port)
+
+    r = Runner(
+        list(user_classes.values()),
+        **runner_options,
+        event_loops=event_loops,
+        html_report=html_report,
+        record=record,
+        shape=shape,
+        processes=processes,
+        coordinator=worker_group,
+        start_at=start["start_at"] if publisher else start_at,
+        instance_index=instance_index,
+        instance_count=instance_count,
+    )
+    if publisher:
+        r.become_worker(start["index"], start["count"], publisher)
+    r.run_test()
 
-    user_classes = {name: value for name, value in vars(module).items() if is_user_class(value)}
-    if not user_classes and hasattr(module, "run"):
 
-        class SimpleUser(HttpUser):
-            async def run(self):
-                pass  # This will be overwritten immediately, but needs to be here to satisfy the abstract base class requirement
+@app.command("analyze")
+def analyze(
+    file: Annotated[Path, typer.Argument(help="A file written using --record", exists=True, dir_okay=False)],
+    slice_length: Annotated[
+        float, typer.Option("--slice", help="Length of each time slice in the per-slice table (seconds)")
+    ] = 10.0,
+):
+    """
+    Analyze a recording made using --record: percentiles per name and per time slice, errors and status codes
+    """
+    from rich.console import Console
 
-        SimpleUser.run = module.run
-        user_classes = {"SimpleUser": SimpleUser}
+    from aiolocust.analyze import analyze_recording, print_analysis
+    from aiolocust.stats import TABLE_WIDTH
 
-    if user_classes:
-        r = Runner(
-            [user for user in user_classes.values()],
-            user_count=users,
-            duration=duration,
-            rate=rate,
-            iterations=iterations,
-            host=host,
-            config=config,
-            event_loops=event_loops,
-            html_report=html_report,
-        )
-        r.run_test()
-    else:
-        typer.echo(f"Error: No User classes or run function defined in {filename}")
+    console = Console(width=None if sys.stdout.isatty() else TABLE_WIDTH)
+    try:
+        analysis = analyze_recording(file, slice_length)
+    except ValueError as e:
+        typer.echo(f"Error: {e}")
+        raise typer.Exit(code=1)
+    print_analysis(analysis, slice_length, console)
 
 
 # Expose a Click command object for mkdocs-click documentation generation.
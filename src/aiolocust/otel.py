@@ -2,10 +2,14 @@ import logging
 import os
 import socket
 import sys
+import threading
+import time
+import uuid
 from importlib.metadata import version
+from pathlib import Path
 
 from opentelemetry import metrics, trace
-from opentelemetry._logs import set_logger_provider
+from opentelemetry._logs import get_logger_provider, set_logger_provider
 from opentelemetry.instrumentation.logging.handler import LoggingHandler
 from opentelemetry.sdk._logs import LoggerProvider
 from opentelemetry.sdk._logs.export import BatchLogRecordProcessor, ConsoleLogRecordExporter
@@ -13,14 +17,22 @@ from opentelemetry.sdk.metrics import Histogram, MeterProvider
 from opentelemetry.sdk.metrics.export import (
     AggregationTemporality,
     ConsoleMetricExporter,
-    InMemoryMetricReader,
+    HistogramDataPoint,
+    Metric,
+    MetricExporter,
+    MetricExportResult,
     MetricReader,
+    MetricsData,
     PeriodicExportingMetricReader,
+    ResourceMetrics,
+    ScopeMetrics,
 )
+from opentelemetry.sdk.metrics.export import Histogram as HistogramData
 from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.sdk.util.instrumentation import InstrumentationScope
 from rich.console import Console
 from rich.logging import RichHandler
 
@@ -28,13 +40,25 @@ from aiolocust import config
 
 HISTOGRAM_BOUNDARIES = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0]
 
-reader: InMemoryMetricReader = None  # type: ignore
+resource: Resource = None  # type: ignore
 logger = logging.getLogger(__name__)
 
 
+def run_id() -> str:
+    """
+    Identifies the test run. All instances of a test (--instance-count) that share --start-at and the locustfile get
+    the same id, so their telemetry can be combined without any coordination. Use --run-id to set it explicitly
+    """
+    if config.run_id:
+        return config.run_id
+    if config.start_at is not None:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"aiolocust:{Path(config.filename).name}:{config.start_at}"))
+    return str(uuid.uuid4())
+
+
 def configure_telemetry():
-    global reader
-    if reader:
+    global resource
+    if resource:
         return
     resource = Resource.create(
         {
@@ -43,6 +67,9 @@ def configure_telemetry():
             "host.name": socket.gethostname(),
             "filename": config.filename,
             "profile": config.profile or "",
+            "run.id": run_id(),
+            "instance.index": config.instance_index,
+            "instance.count": config.instance_count,
         }
     )
     logger_provider = LoggerProvider(resource=resource)
@@ -50,13 +77,27 @@ def configure_telemetry():
     setup_logging(getattr(logging, config.log_level.value.upper()), logger_provider)
     tracer_provider = TracerProvider(resource=resource)
     trace.set_tracer_provider(tracer_provider)
-    reader = InMemoryMetricReader(
-        preferred_temporality={
-            Histogram: AggregationTemporality.DELTA,
-        }
-    )
     setup_trace_exporters(tracer_provider)
-    setup_meter_provider([reader], resource)
+    setup_meter_provider([], resource)
+
+
+def shutdown_telemetry(timeout: float) -> bool:
+    """
+    Flush and shut down the meter and logger providers, in parallel. Returns False if that took longer than timeout
+    seconds (an unreachable collector shouldn't keep us from exiting, so any remaining exports are abandoned)
+    """
+    providers = [metrics.get_meter_provider(), get_logger_provider()]
+    threads = [
+        threading.Thread(target=provider.shutdown, daemon=True)  # pyright: ignore[reportAttributeAccessIssue]
+        for provider in providers
+        if hasattr(provider, "shutdown")  # the no-op default providers have nothing to flush
+    ]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.join(max(deadline - time.monotonic(), 0))
+    return not any(t.is_alive() for t in threads)
 
 
 def setup_logging(level: int, logger_provider: LoggerProvider):
@@ -203,14 +244,14 @@ def get_metric_exporters() -> list[MetricReader]:
                     continue
             except ImportError:
                 continue
-            metric_reader = PeriodicExportingMetricReader(OTLPMetricExporter())
+            metric_reader = PeriodicExportingMetricReader(RequestMetricsExporter(OTLPMetricExporter()))
             metric_readers.append(metric_reader)
 
         elif exporter == "prometheus":
             logger.warning("Prometheus metrics exporter is not yet implemented!")
 
         elif exporter == "console":
-            metric_reader = PeriodicExportingMetricReader(ConsoleMetricExporter())
+            metric_reader = PeriodicExportingMetricReader(RequestMetricsExporter(ConsoleMetricExporter()))
             metric_readers.append(metric_reader)
 
         elif exporter == "none":
@@ -223,3 +264,131 @@ def get_metric_exporters() -> list[MetricReader]:
         logger.debug("No metrics exporter configured,")
 
     return metric_readers
+
+
+class RequestMetricsExporter(MetricExporter):
+    """
+    Wraps another MetricExporter, adding the request stats to each export.
+
+    Requests are not recorded using a regular OTel instrument (that would mean contention between all event loops
+    for every request). Instead they are aggregated by aiolocust.stats and fed to OTel in bulk, as a
+    locust.client.duration histogram, whenever the periodic reader exports. The histograms are cumulative, unless
+    the wrapped exporter prefers delta (like OTLP exporters with OTEL_EXPORTER_OTLP_METRICS_TEMPORALITY_PREFERENCE).
+    """
+
+    # turned off in workers (processes or machines), because whoever aggregates the stats exports the request metrics
+    # of all of them. Workers still export their other metrics, like event loop lag
+    export_requests = True
+
+    def __init__(self, exporter: MetricExporter):
+        super().__init__(exporter._preferred_temporality, exporter._preferred_aggregation)
+        from aiolocust import stats  # avoid circular import
+
+        self.exporter = exporter
+        self.scope = InstrumentationScope("locust")
+        self.temporality = (exporter._preferred_temporality or {}).get(Histogram, AggregationTemporality.CUMULATIVE)
+        # with delta temporality, each export covers what was collected since the previous one
+        self.deltas = stats.track_deltas() if self.temporality == AggregationTemporality.DELTA else None
+        self.last_export_ns = time.time_ns()
+
+    def export(self, metrics_data: MetricsData, timeout_millis: float = 10_000, **kwargs) -> MetricExportResult:
+        if self.export_requests and (request_metrics := self.get_request_metrics()):
+            metrics_data = MetricsData(
+                resource_metrics=[
+                    *metrics_data.resource_metrics,
+                    ResourceMetrics(
+                        resource=resource,
+                        scope_metrics=[ScopeMetrics(scope=self.scope, metrics=request_metrics, schema_url="")],
+                        schema_url="",
+                    ),
+                ]
+            )
+        return self.exporter.export(metrics_data, timeout_millis=timeout_millis, **kwargs)
+
+    def force_flush(self, timeout_millis: float = 10_000) -> bool:
+        return self.exporter.force_flush(timeout_millis=timeout_millis)
+
+    def shutdown(self, timeout_millis: float = 30_000, **kwargs) -> None:
+        self.exporter.shutdown(timeout_millis=timeout_millis, **kwargs)
+
+    def get_request_metrics(self) -> list[Metric]:
+        from aiolocust import stats  # avoid circular import
+
+        if self.deltas is None:
+            entries, start = stats.get_totals(), stats.totals_start_time_ns
+        else:
+            entries, start = stats.take_deltas(self.deltas), self.last_export_ns
+        now = self.last_export_ns = time.time_ns()
+        ttlb_points = []
+        ttfb_points = []
+        corrected_points = []
+        for (name, error_type), entry in entries.items():
+            attributes = {"name": name}
+            if error_type:
+                attributes["error.type"] = error_type
+            ttlb_points.append(
+                HistogramDataPoint(
+                    attributes=attributes,
+                    start_time_unix_nano=start,
+                    time_unix_nano=now,
+                    count=entry.count,
+                    sum=entry.sum_ttlb,
+                    bucket_counts=entry.ttlb_histogram.bucket_counts(HISTOGRAM_BOUNDARIES),
+                    explicit_bounds=HISTOGRAM_BOUNDARIES,
+                    min=entry.min_ttlb,
+                    max=entry.max_ttlb,
+                )
+            )
+            ttfb_points.append(
+                HistogramDataPoint(
+                    attributes=attributes,
+                    start_time_unix_nano=start,
+                    time_unix_nano=now,
+                    count=entry.count,
+                    sum=entry.sum_ttfb,
+                    bucket_counts=entry.ttfb_histogram.bucket_counts(HISTOGRAM_BOUNDARIES),
+                    explicit_bounds=HISTOGRAM_BOUNDARIES,
+                    min=entry.min_ttfb,
+                    max=entry.max_ttfb,
+                )
+            )
+            if entry.corrected_count:
+                corrected_points.append(
+                    HistogramDataPoint(
+                        attributes=attributes,
+                        start_time_unix_nano=start,
+                        time_unix_nano=now,
+                        count=entry.corrected_count,
+                        sum=entry.sum_corrected,
+                        bucket_counts=entry.corrected_histogram.bucket_counts(HISTOGRAM_BOUNDARIES),
+                        explicit_bounds=HISTOGRAM_BOUNDARIES,
+                        min=entry.min_corrected,
+                        max=entry.max_corrected,
+                    )
+                )
+        if not ttlb_points:
+            return []
+        metrics = [
+            Metric(
+                name="locust.client.duration",
+                description="Time to last byte for requests",
+                unit="s",
+                data=HistogramData(data_points=ttlb_points, aggregation_temporality=self.temporality),
+            ),
+            Metric(
+                name="locust.client.time_to_first_byte",
+                description="Time to first byte for requests",
+                unit="s",
+                data=HistogramData(data_points=ttfb_points, aggregation_temporality=self.temporality),
+            ),
+        ]
+        if corrected_points:
+            metrics.append(
+                Metric(
+                    name="locust.client.duration.corrected",
+                    description="Time to last byte for requests, measured from their intended start time",
+                    unit="s",
+                    data=HistogramData(data_points=corrected_points, aggregation_temporality=self.temporality),
+                )
+            )
+        return metrics
@@ -0,0 +1,88 @@
+"""
+Pacing: how long a user waits between iterations.
+
+By default the interval is measured from the start of one iteration to the start of the next, so iterations keep to
+their schedule even when the server slows down (and an iteration that takes longer than its slot is counted as an
+overrun). With think_time=True it is measured from the end of the previous iteration instead, like a user pausing.
+"""
+
+import asyncio
+import random
+from collections.abc import Callable
+
+
+class Pacing:
+    """Calls interval() for the length of each iteration's slot (seconds). Use the functions below to create one"""
+
+    def __init__(self, interval: Callable[[], float], think_time: bool = False):
+        self.interval = interval
+        self.think_time = think_time
+
+
+def constant(interval: float, think_time: bool = False) -> Pacing:
+    return Pacing(lambda: interval, think_time)
+
+
+def exponential(mean: float, think_time: bool = False) -> Pacing:
+    """Exponentially distributed intervals, which make the iterations (of many users combined) a Poisson process"""
+    return Pacing(lambda: random.expovariate(1 / mean), think_time)
+
+
+def uniform(low: float, high: float, think_time: bool = False) -> Pacing:
+    return Pacing(lambda: random.uniform(low, high), think_time)
+
+
+def normal(mean: float, stddev: float, think_time: bool = False) -> Pacing:
+    """Normally distributed intervals (never negative, values below zero become zero)"""
+    return Pacing(lambda: max(random.gauss(mean, stddev), 0.0), think_time)
+
+
+def as_pacing(pacing: float | Pacing | None) -> Pacing | None:
+    """User.pacing can be a plain number too, meaning a constant interval"""
+    if pacing is None or isinstance(pacing, Pacing):
+        return pacing
+    return constant(pacing)
+
+
+class PacingTimer:
+    """
+    Wakes paced users up at their next iteration's start time, on one event loop. Each wait is a timer on the loop
+    itself for an absolute deadline (so there's no drift from turning it into a relative sleep), and waiting users
+    can be woken early when they are stopped. Also counts overruns: iterations that didn't finish within their slot.
+    Only ever touched from its loop.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.waiting: dict[object, asyncio.Future] = {}  # by user
+        self.iterations = 0  # paced iterations started
+        self.overruns = 0
+        self.max_overrun = 0.0
+
+    async def wait_until(self, user: object, deadline: float) -> None:
+        fut = self.loop.create_future()
+        handle = self.loop.call_at(deadline, self._wake, fut)
+        self.waiting[user] = fut
+        try:
+            await fut
+        finally:
+            handle.cancel()
+            del self.waiting[user]
+
+    @staticmethod
+    def _wake(fut: asyncio.Future) -> None:
+        if not fut.done():
+            fut.set_result(None)
+
+    def wake(self, user: object) -> None:
+        if fut := self.waiting.get(user):
+            self._wake(fut)
+
+    def wake_all(self) -> None:
+        for fut in self.waiting.values():
+            self._wake(fut)
+
+    def record_overrun(self, overrun: float) -> None:
+        self.overruns += 1
+        if overrun > self.max_overrun:
+            self.max_overrun = overrun
@@ -0,0 +1,290 @@
+"""
+Running a test in several processes (--processes), for GIL builds of Python and for machines with more cores than one
+process can keep busy.
+
+The parent process loads the locustfile and then forks the worker processes, each running its part of the users on
+its own event loops. Stats flow back through a shared memory region with one slot per worker: the worker writes what
+it has recorded since its last snapshot, the parent merges it into its own stats. So the console table, the summary,
+the HTML report and the OTel request metrics all come from the parent, just like when running in a single process.
+"""
+
+import asyncio
+import logging
+import marshal
+import multiprocessing
+import os
+import struct
+import time
+import warnings
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import fields
+from multiprocessing.process import BaseProcess
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Lock
+
+from aiolocust import stats
+from aiolocust.datatypes import LatencyHistogram, RequestEntry
+from aiolocust.stats import EntryKey
+
+logger = logging.getLogger(__name__)
+
+# shared memory per worker process. Only the pages that are actually written to take up any memory,
+# and snapshots are usually far smaller, but with lots of names and very spread out latencies they can get big
+SLOT_SIZE = 64 * 1024 * 1024
+# how often workers publish their stats (the parent checks twice as often)
+PUBLISH_INTERVAL = 0.5
+# how long a worker waits for the parent to pick up its final snapshot
+FINAL_PUBLISH_TIMEOUT = 5.0
+# a process that dies while holding a slot's lock never releases it, so the other side gives up after this long
+SLOT_LOCK_TIMEOUT = 1.0
+
+_ENTRY_FIELDS = [f.name for f in fields(RequestEntry)]
+
+
+def encode_entries(entries: dict[EntryKey, RequestEntry]) -> list[tuple]:
+    """Turn entries into plain values (histograms become (bucket, count) pairs), for marshal and JSON"""
+    encoded = []
+    for (name, error_type), entry in entries.items():
+        values = (getattr(entry, field) for field in _ENTRY_FIELDS)
+        encoded.append(
+            (name, error_type, *(list(v.counts.items()) if isinstance(v, LatencyHistogram) else v for v in values))
+        )
+    return encoded
+
+
+def decode_entries(encoded: list[tuple]) -> dict[EntryKey, RequestEntry]:
+    entries = {}
+    for name, error_type, *values in encoded:
+        entry = RequestEntry()
+        for field, value in zip(_ENTRY_FIELDS, values, strict=True):
+            if isinstance(histogram := getattr(entry, field), LatencyHistogram):
+                histogram.counts = dict(value)
+            else:
+                setattr(entry, field, value)
+        entries[(name, error_type)] = entry
+    return entries
+
+
+class StatsSlot:
+    """
+    One worker's part of the shared memory. The worker writes a snapshot and then increments seq, the parent reads it
+    and sets ack to the same value, after which the slot is free for the next snapshot. If the parent falls behind,
+    the worker keeps accumulating until the slot is free again. The parent can also raise a flag, asking the worker
+    to stop.
+
+    Plain writes to shared memory can become visible to the other process in any order (on ARM, for example), so all
+    access goes through a lock shared between the two, which also orders the writes to the snapshot and to seq.
+    """
+
+    HEADER_SIZE = 32
+    SEQ, ACK, LENGTH, STOP = 0, 8, 16, 24
+
+    def __init__(self, buf: memoryview, lock: Lock):
+        self.buf = buf
+        self.lock = lock
+
+    def _get(self, offset: int) -> int:
+        return struct.unpack_from("Q", self.buf, offset)[0]
+
+    def _set(self, offset: int, value: int) -> None:
+        struct.pack_into("Q", self.buf, offset, value)
+
+    @property
+    def free(self) -> bool:
+        """True if the parent has read the latest snapshot"""
+        if not self.lock.acquire(timeout=SLOT_LOCK_TIMEOUT):
+            return False
+        try:
+            return self._get(self.SEQ) == self._get(self.ACK)
+        finally:
+            self.lock.release()
+
+    def write(self, data: bytes) -> bool:
+        """Write a snapshot (in the worker), returns False if the previous one hasn't been read yet"""
+        if len(data) > len(self.buf) - self.HEADER_SIZE:
+            raise ValueError(f"Stats snapshot ({len(data)} bytes) doesn't fit in shared memory")
+        if not self.lock.acquire(timeout=SLOT_LOCK_TIMEOUT):
+            return False
+        try:
+            if self._get(self.SEQ) != self._get(self.ACK):
+                return False
+            self.buf[self.HEADER_SIZE : self.HEADER_SIZE + len(data)] = data
+            self._set(self.LENGTH, len(data))
+            self._set(self.SEQ, self._get(self.SEQ) + 1)
+            return True
+        finally:
+            self.lock.release()
+
+    def read(self) -> bytes | None:
+        """Read the latest snapshot (in the parent), if there is a new one"""
+        if not self.lock.acquire(timeout=SLOT_LOCK_TIMEOUT):
+            return None
+        try:
+            seq = self._get(self.SEQ)
+            if seq == self._get(self.ACK):
+                return None
+            data = bytes(self.buf[self.HEADER_SIZE : self.HEADER_SIZE + self._get(self.LENGTH)])
+            self._set(self.ACK, seq)
+            return data
+        finally:
+            self.lock.release()
+
+    @property
+    def stop_requested(self) -> bool:
+        # a single flag that only ever goes from 0 to 1, so seeing it a little late is harmless and needs no lock
+        return bool(self._get(self.STOP))
+
+    def request_stop(self) -> None:
+        self._set(self.STOP, 1)
+
+
+class StatsDeltas:
+    """Stats recorded since the last snapshot that was delivered: request entries and errors"""
+
+    def __init__(self):
+        self.entries: dict[EntryKey, RequestEntry] = defaultdict(RequestEntry)
+        self.errors: dict[str, int] = {}
+        self.error_counts: dict[str, int] = {}  # totals as of the previous call, the stats module only keeps totals
+
+    def snapshot(self, state: dict) -> dict:
+        """Everything not yet delivered, plus state (clear() once it has been)"""
+        for key, entry in stats.take_entries().items():
+            self.entries[key] += entry
+        error_counts = stats.get_error_counts()
+        for message, count in error_counts.items():
+            if new := count - self.error_counts.get(message, 0):
+                self.errors[message] = self.errors.get(message, 0) + new
+        self.error_counts = error_counts
+        return {**state, "entries": encode_entries(self.entries), "errors": self.errors}
+
+    def clear(self) -> None:
+        self.entries = defaultdict(RequestEntry)
+        self.errors = {}
+
+
+class StatsPublisher:
+    """Publishes a worker process's stats to its slot"""
+
+    interval = PUBLISH_INTERVAL
+
+    def __init__(self, slot: StatsSlot):
+        self.slot = slot
+        self.deltas = StatsDeltas()
+        self.parent_pid = os.getppid()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self.slot.stop_requested or os.getppid() != self.parent_pid  # asked to, or the parent is gone
+
+    def publish(self, state: dict) -> bool:
+        """Returns False if the parent hasn't read the previous snapshot yet (nothing is lost, it is sent next time)"""
+        if not self.slot.write(marshal.dumps(self.deltas.snapshot(state))):
+            return False
+        self.deltas.clear()
+        return True
+
+    async def publish_final(self, state: dict) -> None:
+        """Publish everything that's left, and wait for the parent to read it"""
+        deadline = time.monotonic() + FINAL_PUBLISH_TIMEOUT
+        while not self.publish(state) and time.monotonic() < deadline:
+            await asyncio.sleep(PUBLISH_INTERVAL / 10)
+        while not self.slot.free and time.monotonic() < deadline:
+            await asyncio.sleep(PUBLISH_INTERVAL / 10)
+
+
+class StatsAggregator(ABC):
+    """Merges snapshots from workers (processes, or machines in a distributed test) into this process's stats"""
+
+    worker_label = "worker"
+
+    def __init__(self, count: int):
+        self.snapshots: list[dict] = [{} for _ in range(count)]  # the latest state of each worker
+        self.max_lags: dict[tuple[int, int], float] = {}  # by (worker, loop), since the previous loop_stats() call
+
+    def merge_snapshot(self, index: int, snapshot: dict) -> None:
+        stats.merge(decode_entries(snapshot.pop("entries")), snapshot.pop("errors"))
+        self.snapshots[index] = snapshot
+        for loop_index, _lag, max_lag, _cpu_usage in snapshot["loops"]:
+            self.max_lags[index, loop_index] = max(self.max_lags.get((index, loop_index), 0.0), max_lag)
+
+    def total(self, key: str) -> float:
+        return sum(snapshot.get(key, 0) for snapshot in self.snapshots)
+
+    def loop_stats(self) -> list[tuple[str, float, float, float]]:
+        """Like Runner.loop_stats(), for the event loops of all the workers"""
+        max_lags, self.max_lags = self.max_lags, {}
+        return [
+            (f"{loop_index} ({self.worker_label} {i})", lag, max_lags.get((i, loop_index), 0.0), cpu_usage)
+            for i, snapshot in enumerate(self.snapshots)
+            for loop_index, lag, _max_lag, cpu_usage in snapshot.get("loops", [])
+        ]
+
+    @property
+    @abstractmethod
+    def alive(self) -> bool:
+        """True as long as any worker is still running"""
+
+    def collect(self) -> None:
+        """Merge any new snapshots"""
+
+    @abstractmethod
+    def stop(self) -> None:
+        """Ask all workers to stop"""
+
+    def close(self) -> None:
+        """Clean up, once all workers have stopped (or taken too long)"""
+
+
+class ProcessGroup(StatsAggregator):
+    """The parent's side: starts the worker processes, and merges their stats into its own"""
+
+    worker_label = "process"
+
+    def __init__(self, count: int):
+        super().__init__(count)
+        self.shm = SharedMemory(create=True, size=count * SLOT_SIZE)
+        buf = self.shm.buf
+        assert buf is not None  # only None once closed
+        # created before forking, so that the worker processes inherit them
+        context = multiprocessing.get_context("fork")
+        self.slots = [StatsSlot(buf[i * SLOT_SIZE : (i + 1) * SLOT_SIZE], context.Lock()) for i in range(count)]
+        self.processes: list[BaseProcess] = []
+
+    def start(self, target: Callable[[int, StatsSlot], None]) -> None:
+        """Fork a process for each slot, running target(index, slot)"""
+        context = multiprocessing.get_context("fork")
+        with warnings.catch_warnings():
+            # forking while other threads are running is risky in general, but the only ones at this point are
+            # the OTel exporters' background threads, which reinitialize themselves in the child
+            warnings.filterwarnings("ignore", message=".*fork.* may lead to deadlocks", category=DeprecationWarning)
+            for i, slot in enumerate(self.slots):
+                process = context.Process(target=target, args=(i, slot), name=f"aiolocust-{i}", daemon=True)
+                process.start()
+                self.processes.append(process)
+
+    @property
+    def alive(self) -> bool:
+        return any(process.is_alive() for process in self.processes)
+
+    def collect(self) -> None:
+        for i, slot in enumerate(self.slots):
+            if (data := slot.read()) is not None:
+                self.merge_snapshot(i, marshal.loads(data))
+
+    def stop(self) -> None:
+        for slot in self.slots:
+            slot.request_stop()
+
+    def close(self) -> None:
+        for process in self.processes:
+            if process.is_alive():
+                logger.warning(f"Worker process {process.name} didn't stop, terminating it")
+                process.terminate()
+            process.join()
+        self.collect()
+        for slot in self.slots:
+            slot.buf.release()
+        self.shm.close()
+        self.shm.unlink()
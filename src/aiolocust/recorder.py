@@ -0,0 +1,253 @@
+"""
+Records every single request to a compact binary file, for analysis after the test (see analyze.py)
+
+The file starts with MAGIC, followed by records that are all padded to a multiple of 8 bytes:
+
+    kind (1 byte), padding (3 bytes), payload size (uint32), payload
+
+A STRING record (table id uint32, string id uint32, utf-8 text) assigns an id to a request name or error message,
+and is always written before the first chunk that uses it. A CHUNK record (row count uint32, padding uint32) is
+followed by each of the COLUMNS, in order. Columns are ordered by item size, so they are all aligned and can be
+read straight out of a memory mapped file using memoryview.cast(), without copying or parsing.
+"""
+
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+from array import array
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Literal
+
+from aiolocust.datatypes import Request
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AIOLREC1"
+STRING = 1
+CHUNK = 2
+NAMES = 0
+ERRORS = 1
+type Typecode = Literal["d", "f", "I", "H"]  # the array/memoryview typecodes used by the columns
+# timestamp is when the request finished (time.time()), error 0 means no error and status 0 means no response
+COLUMNS: dict[str, Typecode] = {"timestamp": "d", "ttfb": "f", "ttlb": "f", "name": "I", "error": "I", "status": "H"}
+CHUNK_ROWS = 16384
+# partially filled buffers are handed over to the writer thread (and written) within this many seconds, even by
+# threads that have stopped making requests
+FLUSH_INTERVAL = 1.0
+HEADER = struct.Struct("<B3xI")
+CHUNK_HEADER = struct.Struct("<I4x")
+STRING_HEADER = struct.Struct("<II")
+MAX_ERROR_LENGTH = 200
+
+
+def _padding(size: int) -> bytes:
+    return bytes(-size % 8)
+
+
+class SampleBuffer:
+    """Preallocated column arrays, only ever written to by one thread (in practice, one event loop)"""
+
+    __slots__ = ("timestamp", "ttfb", "ttlb", "name", "error", "status", "length", "first_timestamp")
+
+    def __init__(self):
+        for column, typecode in COLUMNS.items():
+            setattr(self, column, array(typecode, bytes(array(typecode).itemsize * CHUNK_ROWS)))
+        self.length = 0
+        self.first_timestamp = 0.0
+
+
+class ThreadBuffer:
+    """
+    The buffer a thread is currently filling. The lock is only ever contended when the writer thread takes the buffer
+    away, because it has been sitting there for a while
+    """
+
+    __slots__ = ("buffer", "lock")
+
+    def __init__(self, buffer: SampleBuffer):
+        self.buffer = buffer
+        self.lock = threading.Lock()
+
+
+class Recorder:
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.strings: tuple[dict[str, int], dict[str, int]] = ({}, {})  # NAMES, ERRORS
+        self.strings_lock = threading.Lock()
+        self._local = threading.local()
+        self.buffers: list[ThreadBuffer] = []
+        self.buffers_lock = threading.Lock()
+        # full buffers (and string definitions) on their way to the writer, and empty ones ready to be reused
+        self.queue: queue.SimpleQueue[SampleBuffer | tuple[int, int, str] | None] = queue.SimpleQueue()
+        self.free: queue.SimpleQueue[SampleBuffer] = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True, name="aiolocust-recorder")
+        self.writer.start()
+
+    def _string_id(self, table: int, value: str) -> int:
+        strings = self.strings[table]
+        try:
+            return strings[value]
+        except KeyError:
+            with self.strings_lock:
+                if value not in strings:
+                    string_id = len(strings) + 1  # 0 is reserved for "no error"
+                    # other threads read strings without the lock, so only publish the id once its definition is
+                    # queued, ahead of any chunk that uses it
+                    self.queue.put((table, string_id, value))
+                    strings[value] = string_id
+                return strings[value]
+
+    def _new_buffer(self) -> SampleBuffer:
+        try:
+            buffer = self.free.get_nowait()
+        except queue.Empty:
+            buffer = SampleBuffer()
+        buffer.length = 0
+        return buffer
+
+    def _get_buffer(self) -> ThreadBuffer:
+        try:
+            return self._local.buffer
+        except AttributeError:
+            thread_buffer = self._local.buffer = ThreadBuffer(self._new_buffer())
+            with self.buffers_lock:
+                self.buffers.append(thread_buffer)
+            return thread_buffer
+
+    def _hand_over(self, thread_buffer: ThreadBuffer) -> None:
+        # must be called while holding thread_buffer.lock
+        self.queue.put(thread_buffer.buffer)
+        thread_buffer.buffer = self._new_buffer()
+
+    def _hand_over_idle(self) -> None:
+        """Hand over the buffers that have had samples in them for a while, from threads that are quiet or idle"""
+        now = time.time()
+        with self.buffers_lock:
+            thread_buffers = list(self.buffers)
+        for thread_buffer in thread_buffers:
+            with thread_buffer.lock:
+                buffer = thread_buffer.buffer
+                if buffer.length and now - buffer.first_timestamp >= FLUSH_INTERVAL / 2:
+                    self._hand_over(thread_buffer)
+
+    def record(self, req: Request) -> None:
+        thread_buffer = self._get_buffer()
+        with thread_buffer.lock:
+            self._record(thread_buffer, req)
+
+    def _record(self, thread_buffer: ThreadBuffer, req: Request) -> None:
+        now = time.time()
+        buffer = thread_buffer.buffer
+        i = buffer.length
+        if i == 0:
+            buffer.first_timestamp = now
+        buffer.timestamp[i] = now
+        buffer.ttfb[i] = req.ttfb
+        buffer.ttlb[i] = req.ttlb
+        buffer.name[i] = self._string_id(NAMES, req.name)
+        if req.error:
+            message = req.error if isinstance(req.error, str) else f"{req.error.__class__.__name__}: {req.error}"
+            buffer.error[i] = self._string_id(ERRORS, message[:MAX_ERROR_LENGTH])
+        else:
+            buffer.error[i] = 0
+        buffer.status[i] = req.status
+        buffer.length = i + 1
+        if buffer.length == CHUNK_ROWS:
+            self._hand_over(thread_buffer)
+
+    def _write_loop(self) -> None:
+        # checking every half interval for buffers that have been waiting for at least half an interval means
+        # that no sample waits longer than FLUSH_INTERVAL
+        next_check = time.monotonic() + FLUSH_INTERVAL / 2
+        while True:
+            if (timeout := next_check - time.monotonic()) <= 0:
+                self._hand_over_idle()
+                self.file.flush()
+                next_check = time.monotonic() + FLUSH_INTERVAL / 2
+                continue
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            if isinstance(item, SampleBuffer):
+                self._write_chunk(item)
+                self.free.put(item)
+            else:
+                table, string_id, value = item
+                payload = STRING_HEADER.pack(table, string_id) + value.encode()
+                self.file.write(HEADER.pack(STRING, len(payload)) + payload + _padding(len(payload)))
+
+    def _write_chunk(self, buffer: SampleBuffer) -> None:
+        rows = buffer.length
+        if not rows:
+            return
+        columns = [memoryview(getattr(buffer, column))[:rows] for column in COLUMNS]
+        size = CHUNK_HEADER.size + sum(column.nbytes + len(_padding(column.nbytes)) for column in columns)
+        self.file.write(HEADER.pack(CHUNK, size) + CHUNK_HEADER.pack(rows))
+        for column in columns:
+            self.file.write(column)
+            self.file.write(_padding(column.nbytes))
+
+    def close(self) -> None:
+        """Write any remaining samples and close the file. Must only be called once no more requests are being made"""
+        with self.buffers_lock:
+            thread_buffers, self.buffers = self.buffers, []
+        for thread_buffer in thread_buffers:
+            with thread_buffer.lock:
+                self._hand_over(thread_buffer)
+        self.queue.put(None)
+        self.writer.join()
+        self.file.close()
+        logger.info(f"Recorded requests written to {self.path}")
+
+
+def read_chunks(path: Path) -> Iterator[tuple[dict[str, memoryview], list[str], list[str]]]:
+    """
+    Yields each chunk of a recording as a dict of column views (straight into the memory mapped file),
+    along with the names and error messages defined so far (index 0 of each being unused).
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an aiolocust recording")
+        f.seek(0, 2)
+        if f.tell() == len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            strings: tuple[list[str], list[str]] = ([""], [""])
+            offset = len(MAGIC)
+            try:
+                while offset + HEADER.size <= len(view):
+                    kind, size = HEADER.unpack_from(view, offset)
+                    offset += HEADER.size
+                    if offset + size > len(view):
+                        logger.warning(f"{path} is truncated, ignoring the last {len(view) - offset} bytes")
+                        break
+                    if kind == STRING:
+                        table, string_id = STRING_HEADER.unpack_from(view, offset)
+                        value = bytes(view[offset + STRING_HEADER.size : offset + size]).decode()
+                        strings[table].extend([""] * (string_id + 1 - len(strings[table])))
+                        strings[table][string_id] = value
+                    elif kind == CHUNK:
+                        (rows,) = CHUNK_HEADER.unpack_from(view, offset)
+                        position = offset + CHUNK_HEADER.size
+                        columns = {}
+                        for column, typecode in COLUMNS.items():
+                            nbytes = rows * array(typecode).itemsize
+                            columns[column] = view[position : position + nbytes].cast(typecode)
+                            position += nbytes + len(_padding(nbytes))
+                        yield columns, strings[NAMES], strings[ERRORS]
+                        for column in columns.values():
+                            column.release()
+                    offset += size + len(_padding(size))
+            finally:
+                view.release()
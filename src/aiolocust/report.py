@@ -0,0 +1,186 @@
+import base64
+import gzip
+import html
+import json
+import re
+from pathlib import Path
+
+from aiolocust.history import StatsHistory
+
+# Long runs are merged into at most this many points per chart, which is plenty for any screen
+MAX_POINTS = 1000
+REPORT_PERCENTILES = ("p50", "p95", "p99")
+
+
+def downsample(columns: dict[str, list], max_points: int = MAX_POINTS) -> dict[str, list]:
+    """
+    Merge consecutive intervals so that there are at most max_points of them.
+    Counts are summed, while max/percentiles use the worst interval in each group (so spikes stay visible).
+    """
+    length = len(columns["end"])
+    if length <= max_points:
+        return columns
+    group = -(-length // max_points)  # ceil
+    merged: dict[str, list] = {}
+    for column, values in columns.items():
+        chunks = [values[i : i + group] for i in range(0, length, group)]
+        if column == "start":
+            merged[column] = [chunk[0] for chunk in chunks]
+        elif column in ("end", "users"):
+            merged[column] = [chunk[-1] for chunk in chunks]
+        elif column in ("count", "errors", "sum"):
+            merged[column] = [sum(chunk) for chunk in chunks]
+        else:
+            merged[column] = [max(chunk) for chunk in chunks]
+    return merged
+
+
+def encode_series(columns: dict[str, list]) -> dict[str, list]:
+    return {
+        "count": columns["count"],
+        "errors": columns["errors"],
+        **{p: [round(value, 1) for value in columns[p]] for p in REPORT_PERCENTILES},
+    }
+
+
+def encode_history(history: StatsHistory, max_points: int = MAX_POINTS) -> str:
+    """
+    History as gzipped, base64 encoded JSON: a shared timeline, plus count/errors/percentiles for the total and per
+    name (by request count)
+    """
+    names = history.names()
+    series = {name: downsample(history.get(name), max_points) for name in names}
+    names.sort(key=lambda name: sum(series[name]["count"]), reverse=True)
+    total = downsample(history.get_total(), max_points)
+    t0 = total["start"][0] if total["start"] else 0
+    data = {
+        "t0": t0,
+        "start": [round(value - t0, 2) for value in total["start"]],
+        "end": [round(value - t0, 2) for value in total["end"]],
+        "users": total["users"],
+        "names": names,
+        "total": encode_series(total),
+        "series": {name: encode_series(columns) for name, columns in series.items()},
+    }
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.b64encode(gzip.compress(raw, mtime=0)).decode()
+
+
+def write_html_report(path: Path, title: str, summary_html: str, history: StatsHistory) -> None:
+    values = {"title": html.escape(title), "summary": summary_html, "data": encode_history(history)}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # substitute in a single pass, so that placeholder-like text in request names is left alone
+    path.write_text(re.sub(r"\{(title|summary|data)\}", lambda m: values[m.group(1)], TEMPLATE))
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8">
+<title>aiolocust report</title>
+<style>
+body { font-family: -apple-system, "Segoe UI", Helvetica, Arial, sans-serif; margin: 1em 2em; color: #222; }
+pre { font-family: Menlo, "DejaVu Sans Mono", consolas, "Courier New", monospace; font-size: 12px; }
+.chart { position: relative; margin: 1em 0; }
+.chart canvas { width: 100%; height: 260px; border: 1px solid #ddd; }
+.tip { position: absolute; pointer-events: none; background: rgba(255,255,255,.9); border: 1px solid #aaa; padding: 4px 6px; font-size: 12px; display: none; white-space: pre; }
+</style>
+</head>
+<body>
+<h2>{title}</h2>
+<pre>{summary}</pre>
+<label>Request name: <select id="name"></select></label>
+<div id="charts"></div>
+<script>
+const DATA = "{data}";
+const COLORS = ["#1f77b4", "#d62728", "#2ca02c", "#ff7f0e"];
+
+async function load() {
+  const bytes = Uint8Array.from(atob(DATA), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+  return JSON.parse(await new Response(stream).text());
+}
+
+function clock(t0, seconds) {
+  return new Date((t0 + seconds) * 1000).toLocaleTimeString();
+}
+
+function chart(title, data, lines) {
+  const div = document.createElement("div");
+  div.className = "chart";
+  div.innerHTML = `<b>${title}</b><br><canvas></canvas><div class="tip"></div>`;
+  document.getElementById("charts").appendChild(div);
+  const canvas = div.querySelector("canvas"), tip = div.querySelector(".tip");
+  const ratio = window.devicePixelRatio || 1;
+  canvas.width = canvas.clientWidth * ratio;
+  canvas.height = canvas.clientHeight * ratio;
+  const ctx = canvas.getContext("2d");
+  ctx.scale(ratio, ratio);
+  const w = canvas.clientWidth, h = canvas.clientHeight, pad = { l: 60, r: 10, t: 10, b: 25 };
+  const x = data.end, xmax = x[x.length - 1] || 1;
+  const ymax = Math.max(1e-9, ...lines.flatMap(l => l.values)) * 1.1;
+  const px = v => pad.l + (v / xmax) * (w - pad.l - pad.r);
+  const py = v => h - pad.b - (v / ymax) * (h - pad.t - pad.b);
+  ctx.font = "11px sans-serif";
+  ctx.strokeStyle = "#eee";
+  ctx.fillStyle = "#666";
+  for (let i = 0; i <= 4; i++) {
+    const v = (ymax * i) / 4;
+    ctx.beginPath(); ctx.moveTo(pad.l, py(v)); ctx.lineTo(w - pad.r, py(v)); ctx.stroke();
+    ctx.fillText(v.toPrecision(3), 4, py(v) + 4);
+    const t = (xmax * i) / 4;
+    ctx.fillText(clock(data.t0, t), Math.min(px(t), w - 70), h - 8);
+  }
+  lines.forEach((line, i) => {
+    ctx.strokeStyle = COLORS[i % COLORS.length];
+    ctx.beginPath();
+    line.values.forEach((v, j) => (j ? ctx.lineTo(px(x[j]), py(v)) : ctx.moveTo(px(x[j]), py(v))));
+    ctx.stroke();
+    ctx.fillStyle = ctx.strokeStyle;
+    ctx.fillText(line.label, pad.l + 10 + i * 80, pad.t + 10);
+  });
+  canvas.onmousemove = e => {
+    const t = ((e.offsetX - pad.l) / (w - pad.l - pad.r)) * xmax;
+    let j = x.findIndex(v => v >= t);
+    if (j < 0) j = x.length - 1;
+    tip.textContent = [clock(data.t0, x[j]), ...lines.map(l => `${l.label}: ${+l.values[j].toFixed(2)}`)].join("\\n");
+    tip.style.left = Math.min(e.offsetX + 15, w - 120) + "px";
+    tip.style.top = e.offsetY + "px";
+    tip.style.display = "block";
+  };
+  canvas.onmouseleave = () => (tip.style.display = "none");
+}
+
+function render(data, s) {
+  document.getElementById("charts").innerHTML = "";
+  const duration = data.end.map((end, i) => Math.max(end - data.start[i], 1e-9));
+  chart("Requests per second", data, [
+    { label: "RPS", values: s.count.map((c, i) => c / duration[i]) },
+    { label: "Failures/s", values: s.errors.map((c, i) => c / duration[i]) },
+  ]);
+  chart("Error rate (%)", data, [
+    { label: "Errors", values: s.errors.map((c, i) => (s.count[i] ? (100 * c) / s.count[i] : 0)) },
+  ]);
+  chart("Response times (ms)", data, [
+    { label: "p50", values: s.p50 },
+    { label: "p95", values: s.p95 },
+    { label: "p99", values: s.p99 },
+  ]);
+  chart("Users", data, [{ label: "Users", values: data.users }]);
+}
+
+load().then(data => {
+  const select = document.getElementById("name");
+  // the first option is the total, which is kept apart from the names (a request can be called "Total" too)
+  select.add(new Option("Total"));
+  for (const name of data.names) select.add(new Option(name));
+  select.onchange = () => {
+    const i = select.selectedIndex;
+    render(data, i ? data.series[data.names[i - 1]] : data.total);
+  };
+  render(data, data.total);
+});
+</script>
+</body>
+</html>
+"""
@@ -1,23 +1,47 @@
 import asyncio
+import functools
 import io
 import logging
-import math
 import os
+import random
 import signal
 import sys
 import threading
 import time
 import warnings
+from collections import defaultdict
+from collections.abc import Callable, Coroutine
 from datetime import datetime
 from pathlib import Path
 
 from aiohttp import ClientOSError
-from opentelemetry import _logs, metrics, trace
+from opentelemetry import metrics, trace
 from rich.console import Console
 
-from aiolocust import User, events, stats
-from aiolocust.datatypes import SafeCounter, Stage
-from aiolocust.otel import configure_telemetry
+from aiolocust import User, events, report, stats
+from aiolocust.capacity import CapacitySearch
+from aiolocust.datatypes import CANCELLED_AT_SHUTDOWN, IterationBudget, Stage
+from aiolocust.distributed import START_DELAY, NetworkPublisher, WorkerGroup
+from aiolocust.otel import RequestMetricsExporter, configure_telemetry, shutdown_telemetry
+from aiolocust.pacing import PacingTimer, as_pacing
+from aiolocust.processes import (
+    FINAL_PUBLISH_TIMEOUT,
+    PUBLISH_INTERVAL,
+    ProcessGroup,
+    StatsAggregator,
+    StatsPublisher,
+    StatsSlot,
+)
+from aiolocust.recorder import Recorder
+from aiolocust.shapes import (
+    LoadShape,
+    PartitionedSchedule,
+    Schedule,
+    ShapeSchedule,
+    StageSchedule,
+    StagesShape,
+    share,
+)
 
 # uvloop is faster than the default pure-python asyncio event loop
 # so if it is installed, we're going to be using that one
@@ -36,6 +60,24 @@ current_users_gauge = meter.create_gauge(
     unit="{user}",
     description="Currently active Locust Users",
 )
+loop_lag_histogram = meter.create_histogram(
+    "locust.event_loop.lag",
+    unit="s",
+    description="How late scheduled callbacks run on each event loop. High values mean the load generator is overloaded",
+)
+dropped_iterations_counter = meter.create_counter(
+    "locust.iterations.dropped",
+    unit="{iteration}",
+    description="Iterations not started in arrival rate mode, because there was no idle user in the pool",
+)
+overrun_iterations_counter = meter.create_counter(
+    "locust.iterations.overrun",
+    unit="{iteration}",
+    description="Iterations that took longer than their pacing slot, so the next one started late",
+)
+# added to the metrics above. Workers (processes or machines) set worker.index, because they export these metrics
+# themselves (only the request metrics are exported by whoever aggregates the stats)
+metric_attributes: dict[str, str] = {}
 
 # Some exceptions will be raised by user code trigger a restart of the run method without propagating it further.
 # Gotta do some special logic for Playwright, because it is an optional dependency.
@@ -67,33 +109,177 @@ original_sigterm_handler = signal.getsignal(signal.SIGTERM)
 
 
 def desired_user_count(stages: list[Stage], elapsed: float) -> int | None:
-    total_time = 0.0
-    previous_user_count = 0
-    for stage in stages:
-        total_time += stage.duration
-        if elapsed <= total_time:
-            time_left_in_stage = total_time - elapsed
-            return math.ceil(
-                previous_user_count + (stage.target - previous_user_count) * (1 - time_left_in_stage / stage.duration)
-            )
-        previous_user_count = stage.target
+    return StageSchedule(stages).user_count(elapsed)
+
 
-    return None
+def desired_rate(stages: list[Stage], elapsed: float) -> float | None:
+    """Target arrival rate (iterations/s), ramping linearly from the previous stage's rate"""
+    return StageSchedule(stages).rate(elapsed)
+
+
+# how often each LoopWorker measures its own lag and CPU usage
+PROBE_INTERVAL = 0.1
+# smoothing factor for the load measurements (exponentially weighted moving average)
+PROBE_SMOOTHING = 0.2
+# loop lag at (and above) which a loop counts as fully loaded
+LAG_SATURATION = 0.1
+# how often to check if users need to be moved between loops, when rebalancing is enabled
+REBALANCE_INTERVAL = 10.0
+# (smoothed) loop lag above which the load generator is considered overloaded, making response times unreliable
+LAG_WARNING_THRESHOLD = 0.05
+# with --event-loops auto: the number of loops to start with, how often to adjust it,
+# the average loop lag/CPU usage above which a loop is added,
+# and the average CPU usage (if the remaining loops were to take over) below which one is removed
+AUTO_INITIAL_LOOPS = 2
+AUTO_SCALE_INTERVAL = 5.0
+AUTO_LAG_TARGET = 0.01
+AUTO_CPU_HIGH = 0.75
+AUTO_CPU_LOW = 0.25
+# summed over all worker processes, when running with --processes
+ITERATION_COUNT_KEYS = ("started", "dropped", "delayed", "paced", "overruns")
+# at shutdown: how long cancelled users get to clean up (close sessions etc), and how long OTel gets to flush
+CANCEL_TIMEOUT = 2.0
+OTEL_FLUSH_TIMEOUT = 5.0
 
 
 class LoopWorker(threading.Thread):
-    def __init__(self):
+    def __init__(self, index: int = 0):
         super().__init__(daemon=True)
+        self.index = index
         self.loop = asyncio.new_event_loop()
+        # running users by class, only touched by the Runner's thread (the loop itself only sees commands)
+        self.users: dict[type[User], list[User]] = defaultdict(list)
+        self.user_count = 0
+        # spawn/stop commands from the Runner, picked up by the loop in batches, and the tasks of the users on it
+        self.commands: list[tuple[User, Callable[[User], Coroutine] | None]] = []
+        self.commands_lock = threading.Lock()
+        self.tasks: set[asyncio.Task] = set()
+        self.timer = PacingTimer(self.loop)
+        self.lag = 0.0  # how late timer callbacks run (seconds, smoothed)
+        self.max_lag = 0.0  # highest lag (not smoothed) since the last call to take_max_lag()
+        self.cpu_usage = 0.0  # share of one core used by this thread (0-1, smoothed)
+        self.attributes = {"loop": str(index), **metric_attributes}
+
+    @property
+    def pressure(self) -> float:
+        """How busy the loop is (0-2), rounded so that measurement noise doesn't affect placement"""
+        return round(self.cpu_usage + min(self.lag / LAG_SATURATION, 1.0), 1)
+
+    def load(self, extra_users=0) -> float:
+        """Estimated load: the number of users, weighted by how busy they are keeping the loop"""
+        return (self.user_count + extra_users) * (1 + self.pressure)
+
+    def class_load(self, user_class: type[User], extra_users=0) -> float:
+        """Estimated load, counting users of user_class double"""
+        return (self.user_count + len(self.users[user_class]) + 2 * extra_users) * (1 + self.pressure)
+
+    def spawn(self, user: User, main: Callable[[User], Coroutine]) -> None:
+        """Register a user, to be started (as main(user)) the next time flush() is called"""
+        self.users[type(user)].append(user)
+        self.user_count += 1
+        with self.commands_lock:
+            self.commands.append((user, main))
+
+    def retire(self, user_class: type[User]) -> None:
+        """Unregister the latest user of user_class, to be stopped (after its current iteration) at the next flush()"""
+        user = self.users[user_class].pop()
+        self.user_count -= 1
+        with self.commands_lock:
+            self.commands.append((user, None))
+
+    def flush(self) -> None:
+        """Wake the loop up to process the queued commands, once per batch rather than once per user"""
+        if self.commands:
+            self.loop.call_soon_threadsafe(self._process_commands)
+
+    def _process_commands(self) -> None:
+        with self.commands_lock:
+            commands, self.commands = self.commands, []
+            for user, main in commands:
+                if main is None:
+                    user.running = False
+                    self.timer.wake(user)  # don't make it wait for its next pacing slot just to stop
+                else:
+                    task = self.loop.create_task(main(user))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+
+    @property
+    def drained(self) -> bool:
+        """True if there are no users left on this loop (not even ones waiting to be started)"""
+        with self.commands_lock:
+            return not self.commands and not self.tasks
+
+    async def wait_for_users(self) -> None:
+        while tasks := list(self.tasks):
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # gather doesn't yield if the tasks are already done, so their done callbacks may not have run yet
+            self.tasks.difference_update(tasks)
+            for result in results:
+                if isinstance(result, Exception):  # users that were cancelled at shutdown are expected
+                    raise result
+
+    def wake_users(self) -> None:
+        """Wake up users waiting for their next pacing slot (at shutdown, so they notice right away)"""
+        self.loop.call_soon_threadsafe(self.timer.wake_all)
+
+    def cancel_users(self) -> None:
+        """Cancel all users immediately (on the loop's own thread, because tasks aren't thread safe)"""
+        self.loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def _cancel_tasks(self) -> None:
+        for task in self.tasks:
+            # the message lets requests that were in flight be recorded as cancelled rather than as failures
+            task.cancel(CANCELLED_AT_SHUTDOWN)
 
     def run(self):
         asyncio.set_event_loop(self.loop)
+        now = self.loop.time()
+        self.loop.call_at(now + PROBE_INTERVAL, self._probe, now + PROBE_INTERVAL, now, time.thread_time())
         self.loop.run_forever()
 
+    def _probe(self, scheduled: float, last_time: float, last_cpu: float) -> None:
+        # time.thread_time() only measures the calling thread, which is why this runs on the loop itself
+        now, cpu = self.loop.time(), time.thread_time()
+        lag = max(now - scheduled, 0.0)
+        cpu_usage = min((cpu - last_cpu) / (now - last_time), 1.0) if now > last_time else self.cpu_usage
+        loop_lag_histogram.record(lag, self.attributes)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        self.lag += PROBE_SMOOTHING * (lag - self.lag)
+        self.cpu_usage += PROBE_SMOOTHING * (cpu_usage - self.cpu_usage)
+        self.loop.call_at(now + PROBE_INTERVAL, self._probe, now + PROBE_INTERVAL, now, cpu)
+
+    def take_max_lag(self) -> float:
+        max_lag, self.max_lag = self.max_lag, 0.0
+        return max_lag
+
     def stop(self):
         self.loop.call_soon_threadsafe(self.loop.stop)
 
 
+# in arrival rate mode, iterations starting later than this (because the event loop was busy) count as delayed
+DELAY_TOLERANCE = 0.05
+# how often the arrival rate scheduler wakes up, at the least (to pick up changes in the target rate)
+MAX_SCHEDULER_SLEEP = 0.05
+# how often the runner wakes up, at the least (to check for shutdown, rebalance loops etc)
+MAX_CONTROL_SLEEP = 0.05
+# user count changes due within this time are made right away (so users are started at most this early)
+CONTROL_TOLERANCE = 0.0005
+
+
+class ArrivalPool:
+    """Users waiting to start iterations on one event loop, in arrival rate mode. Only ever touched from that loop"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.queue: asyncio.Queue[float | None] = asyncio.Queue()  # intended start time of each iteration
+        self.idle = 0
+        self.started = 0
+        self.dropped = 0
+        self.delayed = 0
+
+
 class Runner:
     def __init__(
         self,
@@ -104,28 +290,79 @@ class Runner:
         iterations: int | None = None,
         host: str | None = None,
         config: dict | None = None,
-        event_loops: int | None = None,
+        event_loops: int | str | None = None,
         html_report: Path | None = None,
+        co_correction: bool = False,
+        record: Path | None = None,
+        arrival_rate: float | None = None,
+        rebalance: bool = False,
+        shape: LoadShape | None = None,
+        stop_timeout: float | None = 10.0,
+        processes: int | None = None,
+        coordinator: WorkerGroup | None = None,
+        start_at: float | None = None,
+        instance_index: int = 0,
+        instance_count: int = 1,
     ):
+        # with more than one process, this one only starts the worker processes and aggregates their stats
+        self.processes = processes if processes and processes > 1 else None
+        if self.processes:
+            if not hasattr(os, "fork"):
+                raise ValueError("--processes needs os.fork(), which isn't available on this platform")
+            if record:
+                raise ValueError("--record can't be combined with --processes")
+        # as the coordinator of a distributed test, this one doesn't run any users either
+        self.coordinator = coordinator
+        if self.coordinator:
+            if self.processes:
+                raise ValueError("--processes can't be combined with --coordinator (use it on the workers instead)")
+            if record:
+                raise ValueError("--record can't be combined with --coordinator")
+        # one of several independent instances (without a coordinator), that each run their part of the test
+        if not 0 <= instance_index < instance_count:
+            raise ValueError(f"--instance-index must be between 0 and {instance_count - 1} (--instance-count - 1)")
+        if instance_count > 1 and self.coordinator:
+            raise ValueError("--instance-count can't be combined with --coordinator")
+        self.start_at = start_at  # wall clock time to start the test at
+        # the worker processes or machines whose stats we aggregate, and in a worker, where we send our stats
+        self.worker_group: StatsAggregator | None = None
+        self.publisher: StatsPublisher | NetworkPublisher | None = None
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
         self.running = False
         self.start_time = 0
         events.request.add_listener(stats.record_request)
+        self.recorder = Recorder(record) if record else None
+        if self.recorder:
+            events.request.add_listener(self.recorder.record)
         configure_telemetry()
-        self.sf = stats.StatsFormatter()
-        self.console = Console()
+        self.co_correction = co_correction
+        self.sf = stats.StatsFormatter(co_correction)
+        self.console = Console(width=None if sys.stdout.isatty() else stats.TABLE_WIDTH)
         self.users = users
         self.host = host
-        self.iteration_counter = SafeCounter(iterations)
+        self.iterations = iterations
+        self.iteration_budget = IterationBudget(iterations)
+        self.stop_timeout = stop_timeout  # how long to let running iterations finish at shutdown (None = forever)
         self.tracer = trace.get_tracer("aiolocust")
         config = config or {}
 
-        if "stages" in config:
+        if shape is not None:
+            # stage based shapes are scheduled like any other stages, custom ones are evaluated as we go
+            self.stages = shape.stages if isinstance(shape, StagesShape) else []
+            if "stages" in config or user_count > 1 or duration or rate or arrival_rate:
+                logger.info(
+                    f"A load shape ({type(shape).__name__}) was defined, it takes precedence over stages/user_count/duration/rate"
+                )
+            logger.debug(f"Stages: {self.stages}")
+        elif "stages" in config:
             self.stages = [Stage(**item) for item in config["stages"]]
             if user_count > 1 or duration or rate:
                 logger.info("Both stages and user_count/duration/rate were specified, stages will take precedence")
             logger.debug(f"Stages: {self.stages}")
+        elif arrival_rate:
+            self.stages = [Stage(0, rate=arrival_rate), Stage(duration or 99999999, rate=arrival_rate)]
+            logger.debug(f"Stages: {self.stages}")
         else:
             ramp_up_time = user_count / rate if rate else 0
             self.stages = [
@@ -133,73 +370,307 @@ class Runner:
                 Stage(duration - ramp_up_time if duration else 99999999, user_count),
             ]
             logger.debug(f"Stages: {self.stages}")
-        self.target_user_count = max((stage.target for stage in self.stages), default=0)
+        # in arrival rate (open model) mode, iterations are started at a target rate by a fixed pool of users,
+        # instead of each user running iterations back to back
+        custom_shape = None if shape is None or isinstance(shape, StagesShape) else shape
+        self.arrival_rate_mode = (
+            custom_shape.rate if custom_shape else any(stage.rate is not None for stage in self.stages)
+        )
+        if self.arrival_rate_mode:
+            if not custom_shape and not all(stage.rate is not None for stage in self.stages):
+                raise ValueError("Stages must either all have a rate (arrival rate mode) or none of them")
+            self.target_user_count = config.get("max_users", user_count)
+            self.poisson = config.get("arrival") == "poisson"
+        elif custom_shape:
+            self.target_user_count = user_count  # we can't know the peak of a custom shape in advance
+        else:
+            self.target_user_count = max((stage.target for stage in self.stages), default=0)
+        self.schedule: Schedule = ShapeSchedule(custom_shape) if custom_shape else StageSchedule(self.stages)
+        # a capacity search adjusts the load based on the stats, so it needs to see all of them
+        self.capacity_search = shape if isinstance(shape, CapacitySearch) else None
+        if self.capacity_search and (self.processes or self.coordinator or instance_count > 1):
+            raise ValueError("A capacity search can't be combined with --processes, --coordinator or --instance-count")
         logger.info(f"Starting test (target user count: {self.target_user_count})")
+        if co_correction and not any(user.pacing for user in users):
+            logger.warning(
+                "Coordinated omission correction needs an intended start time for each iteration, but no User has pacing set. Corrected latencies will be the same as the measured ones."
+            )
 
-        if event_loops is None:
-            if cpu_count := os.cpu_count():
-                # for heavy calculations this may need to be increased,
-                # but for I/O bound tasks 1/2 of CPU cores seems to be very efficient
-                self.event_loops = max(cpu_count // 2, 1)
-            else:
-                self.event_loops = 1
+        # in auto mode, loops are added and removed during the test depending on how busy they are (see autoscale_loops)
+        self.auto_event_loops = event_loops == "auto"
+        if self.auto_event_loops and self.arrival_rate_mode:
+            logger.warning(
+                "--event-loops auto is not supported in arrival rate mode, using the default number of loops"
+            )
+            self.auto_event_loops, event_loops = False, None
+        # per process, when running in more than one
+        self.max_event_loops = max((os.cpu_count() or 1) // (self.processes or 1), 1)
+        if self.auto_event_loops:
+            self.event_loops = min(AUTO_INITIAL_LOOPS, self.max_event_loops)
+        elif event_loops is None:
+            # for heavy calculations this may need to be increased,
+            # but for I/O bound tasks 1/2 of CPU cores seems to be very efficient
+            self.event_loops = max(self.max_event_loops // 2, 1)
         else:
-            self.event_loops = event_loops
+            self.event_loops = int(event_loops)
         self.html_report = html_report
-        self.running_users: set[User] = set()
-        self.futures: list[asyncio.Future] = []
+        self.rebalance = rebalance
+        self.peak_lag = 0.0  # highest smoothed loop lag seen during the test
+        self.overloaded_loops: set[str] = set()  # loops currently over LAG_WARNING_THRESHOLD
+        self.class_counts: dict[type[User], int] = defaultdict(int)
+        self.control_loop: asyncio.AbstractEventLoop | None = None  # the one run_test_async() runs on
+        self.fixed_counts = {user_class: user_class.fixed_count for user_class in users}
+        self.futures: list[asyncio.Future] = []  # arrival rate mode schedulers
+        self.arrival_pools: list[ArrivalPool] = []
+        self.workers: list[LoopWorker] = []
+        self.draining_workers: list[LoopWorker] = []  # removed loops, waiting for their users to finish
+        self.retired_timers: list[PacingTimer] = []  # from loops that have been stopped, for the pacing summary
+        if instance_count > 1:
+            self.partition(instance_index, instance_count)
+            logger.info(
+                f"Running part {instance_index + 1}/{instance_count} (target user count: {self.target_user_count})"
+            )
 
     async def stats_printer(self):
         first = True
         while self.running:
             if not first:
-                self.console.print(self.sf.get_table())
+                await stats.rotate_shards()
+                table = self.sf.get_table()
+                table.caption = self.check_loop_lag()
+                self.console.print(table)
             first = False
             await asyncio.sleep(2)
 
+    def check_loop_lag(self) -> str:
+        """Warn about overloaded event loops, and return a summary of loop lag/CPU usage for the table footer"""
+        max_lag = max_smoothed = cpu_usage = 0.0
+        for name, lag, loop_max_lag, loop_cpu_usage in self.loop_stats():
+            max_lag = max(max_lag, loop_max_lag)
+            max_smoothed = max(max_smoothed, lag)
+            cpu_usage = max(cpu_usage, loop_cpu_usage)
+            if lag > LAG_WARNING_THRESHOLD:
+                if name not in self.overloaded_loops:
+                    logger.warning(
+                        f"Event loop {name} is lagging {lag * 1000:.0f}ms behind, so response times will be inflated. The load generator is overloaded (CPU usage of the loop: {loop_cpu_usage:.0%}), try adding more event loops or lowering the load."
+                    )
+                    self.overloaded_loops.add(name)
+            else:
+                self.overloaded_loops.discard(name)
+        self.peak_lag = max(self.peak_lag, max_smoothed)
+        return f"Event loop lag (worst loop): {max_smoothed * 1000:.1f}ms avg, {max_lag * 1000:.1f}ms max, CPU usage {cpu_usage:.0%}"
+
+    def loop_stats(self) -> list[tuple[str, float, float, float]]:
+        """Name, lag (smoothed), max lag since the previous call and CPU usage (smoothed) of each event loop"""
+        if self.worker_group:
+            return self.worker_group.loop_stats()
+        return [(str(w.index), w.lag, w.take_max_lag(), w.cpu_usage) for w in self.workers]
+
+    def iteration_counts(self) -> dict[str, float]:
+        """Counts for the arrival rate mode and pacing summaries"""
+        if self.worker_group:
+            counts = {key: self.worker_group.total(key) for key in ITERATION_COUNT_KEYS}
+            counts["max_overrun"] = max((s.get("max_overrun", 0.0) for s in self.worker_group.snapshots), default=0.0)
+            return counts
+        timers = [w.timer for w in self.workers + self.draining_workers] + self.retired_timers
+        return {
+            "started": sum(pool.started for pool in self.arrival_pools),
+            "dropped": sum(pool.dropped for pool in self.arrival_pools),
+            "delayed": sum(pool.delayed for pool in self.arrival_pools),
+            "paced": sum(timer.iterations for timer in timers),
+            "overruns": sum(timer.overruns for timer in timers),
+            "max_overrun": max((timer.max_overrun for timer in timers), default=0.0),
+        }
+
     def shutdown(self, reason=None):
         logger.info(f"Shutting down ({reason or 'no reason given'})")
         if not self.running:
             logger.debug("Already shutting down, ignoring shutdown() call")
             return
+        # the actual waiting for users and flushing happens in run_test_async, because shutdown() is often called
+        # from a signal handler or from inside one of the users (and a user can't wait for itself to finish)
         self.running = False
-        # # wake up event loops
-        # for w in self.workers:
-        #     w.loop.call_soon_threadsafe(lambda: None)
-        for fut in self.futures:
-            _ = fut.result()
-        logger.debug("Shutdown complete. Total iteration count: %d", self.iteration_counter.value)
-        # flush otel
-        metrics.get_meter_provider().shutdown()  # pyright: ignore[reportAttributeAccessIssue]
-        _logs.get_logger_provider().shutdown()  # pyright: ignore[reportAttributeAccessIssue]
-
-        # metrics.get_meter_provider().force_flush(timeout_millis=1000)  # pyright: ignore[reportAttributeAccessIssue]
-        # logger.debug("Meter provider shut down")
-        # _logs.get_logger_provider().force_flush(timeout_millis=1000)  # pyright: ignore[reportAttributeAccessIssue]
-        # print("Logger provider shut down")
-        # trace.get_tracer_provider().shutdown()  # pyright: ignore[reportAttributeAccessIssue]
-        # logger.debug("Tracer provider shut down")
-
-    async def user_loop(self, user_instance: User):
+
+    def flush_commands(self):
+        for w in self.workers + self.draining_workers:
+            w.flush()
+
+    async def wait_for_users(self):
+        """
+        Let running iterations finish, for at most stop_timeout seconds. After that, the remaining users are cancelled
+        (all loops at once, so even with many thousands of users this is quick) and their in-flight requests are
+        recorded as "cancelled at shutdown"
+        """
+        self.flush_commands()
+        workers = self.workers + self.draining_workers
+        for w in workers:
+            w.wake_users()
+        waiters = [asyncio.wrap_future(fut) for fut in self.futures] + [
+            asyncio.wrap_future(asyncio.run_coroutine_threadsafe(w.wait_for_users(), w.loop)) for w in workers
+        ]
+        if not waiters:
+            return
+        done, pending = await asyncio.wait(waiters, timeout=self.stop_timeout)
+        if pending:
+            remaining = sum(len(w.tasks) for w in workers)
+            logger.warning(
+                f"{remaining} users were still running after the stop timeout ({self.stop_timeout}s), cancelling them"
+            )
+            for fut in self.futures:
+                fut.cancel()
+            for w in workers:
+                w.cancel_users()
+            more_done, pending = await asyncio.wait(pending, timeout=CANCEL_TIMEOUT)
+            done |= more_done
+            if pending:
+                logger.warning(
+                    f"Some users were still running {CANCEL_TIMEOUT}s after being cancelled, giving up on them"
+                )
+        for fut in done:
+            if not fut.cancelled():
+                fut.result()  # raise any unexpected errors
+        logger.debug("Shutdown complete. Total iteration count: %d", self.iteration_budget.value)
+
+    async def user_loop(self, user_instance: User, worker: LoopWorker):
+        try:
+            await self._user_loop(user_instance, worker.timer)
+        finally:
+            # users that we stopped have already been unregistered, but one that stopped on its own (or crashed)
+            # still needs to be, on the control loop's thread
+            if user_instance.running and self.running and self.control_loop:
+                self.control_loop.call_soon_threadsafe(self.user_finished, user_instance, worker)
+
+    async def _user_loop(self, user_instance: User, timer: PacingTimer):
+        loop = asyncio.get_running_loop()
+        pacing = as_pacing(user_instance.pacing)
+        next_start = loop.time()
+        first = True
+        if self.co_correction:
+            stats.iteration_delay.set(0.0)
         async with user_instance.cm():
             while user_instance.running and self.running:
-                if self.iteration_counter.increment():
+                if pacing:
+                    if (wait := next_start - loop.time()) > 0:
+                        await timer.wait_until(user_instance, next_start)
+                        if not (user_instance.running and self.running):
+                            break
+                    elif not first and not pacing.think_time:
+                        timer.record_overrun(-wait)
+                        overrun_iterations_counter.add(1, metric_attributes)
+                    if self.co_correction:
+                        stats.iteration_delay.set(max(loop.time() - next_start, 0.0))
+                    if not pacing.think_time:
+                        # keep to the original schedule even when we're late, so that lateness accumulates
+                        next_start += pacing.interval()
+                    first = False
+                if not self.iteration_budget.take():
+                    # all iterations have been handed out, any that are still running are waited for at shutdown
                     user_instance.running = False
-                    self.running_users.remove(user_instance)
-                    if not self.running_users:
-                        self.shutdown(f"reached iteration limit ({self.iteration_counter.value})")
+                    self.shutdown(f"reached iteration limit ({self.iteration_budget.value})")
                     break
-                try:
-                    await user_instance.run()
-                except EXPECTED_ERRORS:
-                    pass  # these errors should already have been recorded by the User
-                except Exception as e:
-                    if isinstance(e, RuntimeError) and "cannot schedule new futures after interpreter shutdown" in str(
-                        e
-                    ):
-                        return
-                    stats.record_error(str(e))
-                    logger.exception(e)
+                if pacing:
+                    timer.iterations += 1
+                if not await self.run_iteration(user_instance):
+                    return
+                if pacing and pacing.think_time:
+                    next_start = loop.time() + pacing.interval()
+
+    async def run_iteration(self, user_instance: User) -> bool:
+        """Run one iteration, returns False if the user should stop immediately"""
+        try:
+            await user_instance.run()
+        except EXPECTED_ERRORS:
+            pass  # these errors should already have been recorded by the User
+        except Exception as e:
+            if isinstance(e, RuntimeError) and "cannot schedule new futures after interpreter shutdown" in str(e):
+                return False
+            stats.record_error(str(e))
+            logger.exception(e)
+        return True
+
+    async def arrival_user_loop(self, user_instance: User, pool: ArrivalPool):
+        loop = asyncio.get_running_loop()
+        async with user_instance.cm():
+            while self.running:
+                pool.idle += 1
+                intended_start = await pool.queue.get()
+                if intended_start is None:  # shutting down
+                    break
+                delay = loop.time() - intended_start
+                if delay > DELAY_TOLERANCE:
+                    pool.delayed += 1
+                if self.co_correction:
+                    stats.iteration_delay.set(max(delay, 0.0))
+                if not self.iteration_budget.take():
+                    self.shutdown(f"reached iteration limit ({self.iteration_budget.value})")
+                    break
+                pool.started += 1
+                if not await self.run_iteration(user_instance):
+                    return
+
+    async def arrival_scheduler(self, pool: ArrivalPool, share: float, start: float):
+        """
+        Start iterations on this loop at its share of the target rate, handing them to idle users in the pool.
+
+        The target rate is integrated over time, and an iteration is started each time the integral crosses the next
+        threshold. For constant arrivals the threshold is always 1, for Poisson arrivals it is exponentially distributed
+        (which gives a Poisson process even while the rate is changing)
+        """
+        loop = asyncio.get_running_loop()
+        rng = random.Random()
+        threshold = rng.expovariate(1.0) if self.poisson else 1.0
+        accumulated = 0.0
+        last = loop.time()
+        while self.running:
+            now = loop.time()
+            rate = self.schedule.rate(now - start)  # on the same monotonic clock as the control loop
+            if rate is None:
+                break  # run_test_async will shut down
+            rate *= share
+            accumulated += rate * (now - last)
+            last = now
+            while accumulated >= threshold:
+                accumulated -= threshold
+                threshold = rng.expovariate(1.0) if self.poisson else 1.0
+                if pool.idle:
+                    pool.idle -= 1
+                    pool.queue.put_nowait(now - accumulated / rate)  # when the threshold was crossed
+                else:
+                    pool.dropped += 1
+                    dropped_iterations_counter.add(1, metric_attributes)
+            await asyncio.sleep(
+                min((threshold - accumulated) / rate, MAX_SCHEDULER_SLEEP) if rate else MAX_SCHEDULER_SLEEP
+            )
+        for _ in range(pool.size):
+            pool.queue.put_nowait(None)
+
+    def start_arrival_pools(self, start: float):
+        """Start the pools of users and their schedulers, following the schedule from start (in loop time)"""
+        classes = []
+        for _ in range(self.target_user_count):
+            user_class = self.user_class_to_add()
+            if user_class is None:
+                break
+            self.class_counts[user_class] += 1
+            classes.append(user_class)
+        # deal the users out one class at a time, so that each class is spread evenly over the loops
+        pool_classes: list[list[type[User]]] = [[] for _ in self.workers]
+        for i, user_class in enumerate(sorted(classes, key=self.users.index)):
+            pool_classes[i % self.event_loops].append(user_class)
+        for worker, user_classes in zip(self.workers, pool_classes, strict=True):
+            if not user_classes:
+                continue
+            pool = ArrivalPool(len(user_classes))
+            self.arrival_pools.append(pool)
+            for user_class in user_classes:
+                worker.spawn(user_class(self), functools.partial(self.arrival_user_loop, pool=pool))
+            worker.flush()
+            # give each loop a share of the rate matching its share of the users
+            self.futures.append(
+                asyncio.run_coroutine_threadsafe(  # type: ignore
+                    self.arrival_scheduler(pool, len(user_classes) / len(classes), start), worker.loop
+                )
+            )
 
     def signal_handler(self, _sig, _frame):
         if not self.running:
@@ -209,76 +680,379 @@ class Runner:
         self.shutdown("got SIGINT/CTRL-C")
 
     def run_test(self):
+        if self.processes:
+            self.worker_group = process_group = ProcessGroup(self.processes)
+            process_group.start(self.run_process)
+            asyncio.run(self.aggregate_workers(), loop_factory=new_event_loop)
+        elif self.coordinator:
+            asyncio.run(self.run_coordinator_async(), loop_factory=new_event_loop)
+        else:
+            asyncio.run(self.run_test_async(), loop_factory=new_event_loop)
+
+    def partition(self, index: int, count: int):
+        """Only run part index (of count) of the test: a share of the users, the arrival rate and the iterations"""
+        self.schedule = PartitionedSchedule(self.schedule, index, count)
+        self.target_user_count = share(self.target_user_count, index, count)
+        self.fixed_counts = {user_class: share(n, index, count) for user_class, n in self.fixed_counts.items()}
+        if self.iterations is not None:
+            self.iterations = share(self.iterations, index, count)
+            self.iteration_budget = IterationBudget(self.iterations)
+
+    def become_worker(self, index: int, count: int, publisher: StatsPublisher | NetworkPublisher):
+        """Run part index (of count) of the test, and send the stats to publisher instead of reporting them"""
+        self.publisher = publisher
+        RequestMetricsExporter.export_requests = False  # whoever aggregates the stats exports them
+        metric_attributes["worker.index"] = str(index)
+        self.partition(index, count)
+        stats.reset()
+
+    def run_process(self, index: int, slot: StatsSlot):
+        """Run part index of the test, in a worker process (forked from the parent, so we start off as its copy)"""
+        count = self.processes
+        assert count
+        self.processes = self.worker_group = None
+        self.become_worker(index, count, StatsPublisher(slot))
         asyncio.run(self.run_test_async(), loop_factory=new_event_loop)
 
-    def add_user(self, worker: LoopWorker):
-        user = self.users[0](self)
-        self.running_users.add(user)
-        fut = asyncio.run_coroutine_threadsafe(self.user_loop(user), worker.loop)
-        self.futures.append(fut)  # type: ignore
+    def worker_state(self) -> dict:
+        """What a worker publishes, along with its stats"""
+        return {
+            "users": self.current_user_count,
+            "loops": [(w.index, w.lag, w.take_max_lag(), w.cpu_usage) for w in self.workers],
+            **self.iteration_counts(),
+        }
+
+    async def publish_stats(self):
+        """In a worker: publish our stats regularly, and shut down when asked to (or when whoever asks is gone)"""
+        assert self.publisher
+        while self.running:
+            await asyncio.sleep(self.publisher.interval)
+            await stats.rotate_shards()
+            self.publisher.publish(self.worker_state())
+            if self.publisher.stop_requested:
+                self.shutdown("stopped by the coordinating process")
+
+    async def wait_for_start(self):
+        """Wait until start_at (if set), unless we are shut down before that"""
+        if self.start_at is None:
+            return
+        if self.start_at > time.time():
+            logger.info(f"Starting at {time.strftime('%H:%M:%S', time.localtime(self.start_at))}")
+        elif not self.publisher:
+            # we're late, so the other instances of the test have a head start
+            logger.warning(f"The start time was {time.time() - self.start_at:.1f}s ago, starting right away")
+        while self.running and (delay := self.start_at - time.time()) > 0:
+            await asyncio.sleep(min(delay, MAX_CONTROL_SLEEP))
+
+    async def run_coordinator_async(self):
+        """Wait for the workers to connect, start the test on all of them and then aggregate their stats"""
+        assert self.coordinator
+        self.running = True
+        await self.coordinator.listen()
+        logger.info(f"Waiting for {self.coordinator.count} worker(s) to connect on port {self.coordinator.port}")
+        while self.running and not self.coordinator.ready:
+            await asyncio.sleep(MAX_CONTROL_SLEEP)
+        if not self.running:
+            self.coordinator.close()
+            return
+        self.start_at = max(self.start_at or 0, time.time() + START_DELAY)
+        self.coordinator.start(self.start_at)
+        self.worker_group = self.coordinator
+        await self.wait_for_start()
+        await self.aggregate_workers()
+
+    async def aggregate_workers(self):
+        """Show the combined stats of the workers (processes or machines), until they have all finished"""
+        assert self.worker_group
+        group = self.worker_group
+        self.running = True
+        loop = asyncio.get_running_loop()
+        stats_printer_task = loop.create_task(self.stats_printer())
+        self.start_time = time.time()
+        self.current_user_count = 0
+        # after asking the workers to stop, give them time to finish (and publish their final stats), but not forever
+        stop_deadline = None
+        while group.alive:
+            if not self.running:
+                if stop_deadline is None:
+                    group.stop()
+                    if self.stop_timeout is not None:
+                        stop_deadline = loop.time() + self.stop_timeout + CANCEL_TIMEOUT + FINAL_PUBLISH_TIMEOUT
+                elif loop.time() > stop_deadline:
+                    break  # close() terminates them
+            group.collect()
+            self.current_user_count = int(group.total("users"))
+            current_users_gauge.set(self.current_user_count, metric_attributes)
+            self.sf.user_count = self.current_user_count
+            await asyncio.sleep(PUBLISH_INTERVAL / 2)
+        group.close()
+        if self.running:
+            self.shutdown("all workers finished")
+        end_time = time.time()
+        stats_printer_task.cancel()
+        await self.print_report(end_time)
+
+    def user_class_to_add(self) -> type[User] | None:
+        """Fill up fixed_count classes first, then pick the weighted class furthest below its share"""
+        for user_class in self.users:
+            if self.class_counts[user_class] < self.fixed_counts[user_class]:
+                return user_class
+        weighted = [user_class for user_class in self.users if not user_class.fixed_count and user_class.weight > 0]
+        if not weighted:
+            return None
+        total_weight = sum(user_class.weight for user_class in weighted)
+        count = sum(self.class_counts[user_class] for user_class in weighted) + 1
+        return max(weighted, key=lambda c: c.weight * count / total_weight - self.class_counts[c])
 
-    def stop_user(self):
-        user = self.running_users.pop()
-        user.running = False
+    def user_class_to_stop(self) -> type[User] | None:
+        """Stop the weighted class furthest above its share first, and fixed_count classes last"""
+        weighted = [user_class for user_class in self.users if not user_class.fixed_count and user_class.weight > 0]
+        running = [user_class for user_class in weighted if self.class_counts[user_class]]
+        if running:
+            total_weight = sum(user_class.weight for user_class in weighted)
+            count = sum(self.class_counts[user_class] for user_class in weighted) - 1
+            return max(running, key=lambda c: self.class_counts[c] - c.weight * count / total_weight)
+        for user_class in reversed(self.users):
+            if self.class_counts[user_class]:
+                return user_class
+        return None
+
+    def add_user(self) -> bool:
+        """Start a user of the class that is furthest below its share, returns False if there is none to start"""
+        user_class = self.user_class_to_add()
+        if user_class is None:
+            return False
+        self.class_counts[user_class] += 1
+        self.start_user(user_class, self.least_loaded_worker(user_class))
+        return True
+
+    def least_loaded_worker(self, user_class: type[User]) -> LoopWorker:
+        # counting users of the same class double so that each class gets spread out too
+        # (otherwise one loop might end up with all the heavy users)
+        return min(self.workers, key=lambda w: (w.class_load(user_class, 1), len(w.users[user_class])))
+
+    def start_user(self, user_class: type[User], worker: LoopWorker):
+        worker.spawn(user_class(self), functools.partial(self.user_loop, worker=worker))
+
+    def user_finished(self, user: User, worker: LoopWorker) -> None:
+        """A user stopped without being asked to, so it no longer counts (and the control loop replaces it)"""
+        users = worker.users[type(user)]
+        if user in users:  # unless it was retired in the meantime
+            users.remove(user)
+            worker.user_count -= 1
+            self.class_counts[type(user)] -= 1
+            self.current_user_count -= 1
+
+    def stop_user(self) -> bool:
+        """Stop a user of the class that is furthest above its share, returns False if there is none to stop"""
+        user_class = self.user_class_to_stop()
+        if user_class is None:
+            return False
+        # the most loaded loop, the same way as in add_user
+        candidates = [w for w in self.workers if w.users[user_class]]
+        worker = max(candidates, key=lambda w: (w.class_load(user_class), len(w.users[user_class])))
+        self.class_counts[user_class] -= 1
+        worker.retire(user_class)
+        return True
+
+    def rebalance_users(self):
+        """
+        Move users from the most to the least loaded loop, if it would even out the load.
+        Users can't really be moved, because they may have loop bound state (like sessions), so they are
+        stopped and new ones are started in their place (at most 10% of the loop's users at a time).
+        """
+        busiest = max(self.workers, key=lambda w: w.load())
+        idlest = min(self.workers, key=lambda w: w.load())
+        # each move lowers the busiest loop's load by 1 + its pressure, and raises the idlest one's by 1 + its pressure
+        moves = int((busiest.load() - idlest.load()) / (2 + busiest.pressure + idlest.pressure))
+        moves = min(moves, busiest.user_count // 10 + 1)
+        if moves < 1:
+            return
+        logger.debug(
+            f"Rebalancing: moving {moves} users between loops (load {busiest.load():.1f} vs {idlest.load():.1f})"
+        )
+        for _ in range(moves):
+            user_class = max(
+                (c for c in busiest.users if busiest.users[c]),
+                key=lambda c: len(busiest.users[c]) - len(idlest.users[c]),
+            )
+            busiest.retire(user_class)
+            self.start_user(user_class, idlest)
+
+    def autoscale_loops(self):
+        """
+        Add an event loop when the loops are lagging or busy on average, and remove the least loaded one when the
+        others could easily take over its work. New users are placed on the least loaded loop, and rebalance_users()
+        shifts existing ones, so a new loop gradually fills up.
+        """
+        count = len(self.workers)
+        lag = sum(w.lag for w in self.workers) / count
+        cpu_usage = sum(w.cpu_usage for w in self.workers) / count
+        if (lag > AUTO_LAG_TARGET or cpu_usage > AUTO_CPU_HIGH) and count < self.max_event_loops:
+            used = {w.index for w in self.workers + self.draining_workers}
+            worker = LoopWorker(min(i for i in range(len(used) + 1) if i not in used))
+            worker.start()
+            self.workers.append(worker)
+            logger.info(
+                f"Added event loop {worker.index} (average lag {lag * 1000:.1f}ms, CPU usage {cpu_usage:.0%}), now running {count + 1} loops"
+            )
+        elif count > 1 and lag < AUTO_LAG_TARGET / 2 and cpu_usage * count / (count - 1) < AUTO_CPU_LOW:
+            worker = min(self.workers, key=lambda w: (w.load(), w.user_count))
+            self.workers.remove(worker)
+            self.draining_workers.append(worker)
+            # restart its users elsewhere, the same way as rebalance_users() moves them
+            for user_class, users in worker.users.items():
+                for _ in range(len(users)):
+                    worker.retire(user_class)
+                    self.start_user(user_class, self.least_loaded_worker(user_class))
+            logger.info(
+                f"Removing event loop {worker.index} (average lag {lag * 1000:.1f}ms, CPU usage {cpu_usage:.0%}), now running {count - 1} loops"
+            )
+        self.rebalance_users()
+        for worker in list(self.draining_workers):
+            if worker.drained:
+                worker.stop()
+                self.draining_workers.remove(worker)
+                self.retired_timers.append(worker.timer)
 
     async def run_test_async(self):
         self.running = True
         events.startup.fire()
-        self.workers = [LoopWorker() for _ in range(self.event_loops)]
+        self.workers = [LoopWorker(i) for i in range(self.event_loops)]
         for w in self.workers:
             w.start()
         logger.debug(f"Running with {self.event_loops} event loops")
         await asyncio.sleep(0.1)
 
         loop = asyncio.get_running_loop()
-        stats_printer_task = loop.create_task(self.stats_printer())
+        stats_printer_task = loop.create_task(self.publish_stats() if self.publisher else self.stats_printer())
 
-        self.start_time = time.time()
+        self.control_loop = loop
         self.current_user_count = 0
-        current_users_gauge.set(self.current_user_count)
+        current_users_gauge.set(self.current_user_count, metric_attributes)
+        self.sf.user_count = self.current_user_count
+        await self.wait_for_start()
+        self.start_time = time.time()
+        search = self.capacity_search
+        capacity_search_task = loop.create_task(search.run(self.sf.take_window)) if search else None
+        # elapsed time is measured on the (monotonic) loop clock, so the schedule doesn't drift with wall clock changes
+        start = last_rebalance = loop.time()
+        if self.arrival_rate_mode:
+            self.start_arrival_pools(start)
 
         while self.running:
-            await asyncio.sleep(0.01)
-            elapsed = time.time() - self.start_time
-            new_user_count = desired_user_count(self.stages, elapsed)
-            if new_user_count is None:
-                self.shutdown(f"target duration elapsed after {elapsed:.2f}s")
+            now = loop.time()
+            elapsed = now - start
+            if self.auto_event_loops and now - last_rebalance > AUTO_SCALE_INTERVAL:
+                last_rebalance = now
+                self.autoscale_loops()
+            elif self.rebalance and not self.arrival_rate_mode and now - last_rebalance > REBALANCE_INTERVAL:
+                last_rebalance = now
+                self.rebalance_users()
+            if self.schedule.user_count(elapsed) is None:
+                self.shutdown("capacity search finished" if search else f"target duration elapsed after {elapsed:.2f}s")
                 break
+            # sleep until the next change in user count (or stage), but wake up regularly for the checks above
+            next_change = self.schedule.next_change(elapsed + CONTROL_TOLERANCE)
+            if next_change is None:  # about to end
+                next_change = elapsed + CONTROL_TOLERANCE
+            sleep_time = min(start + next_change - loop.time(), MAX_CONTROL_SLEEP)
+            if self.arrival_rate_mode:
+                # users currently running an iteration (approximate, because the pools are updated on their own loops)
+                self.current_user_count = sum(pool.size - pool.idle for pool in self.arrival_pools)
+                current_users_gauge.set(self.current_user_count, metric_attributes)
+                self.sf.user_count = self.current_user_count
+                await asyncio.sleep(sleep_time)
+                continue
+            # changes due within CONTROL_TOLERANCE are made right away, rather than sleeping for less than that
+            new_user_count = self.schedule.user_count(elapsed + CONTROL_TOLERANCE)
+            if new_user_count is None:
+                new_user_count = self.current_user_count
+            # only count the users that were actually started/stopped (there may not be a class left to start)
             change = new_user_count - self.current_user_count
             if change > 0:
-                for i in range(change):
-                    worker = self.workers[(i + self.current_user_count) % self.event_loops]
-                    self.add_user(worker)
+                self.current_user_count += sum(self.add_user() for _ in range(change))
             elif change < 0:
-                for i in range(-change):
-                    self.stop_user()
-            self.current_user_count = new_user_count
-            current_users_gauge.set(self.current_user_count)
+                self.current_user_count -= sum(self.stop_user() for _ in range(-change))
+            current_users_gauge.set(self.current_user_count, metric_attributes)
+            self.sf.user_count = self.current_user_count
+            # one wakeup per loop for everything that was started/stopped in this tick
+            self.flush_commands()
+            await asyncio.sleep(sleep_time)
 
         if self.running:  # if we exited the loop without a signal, we should still do a proper shutdown
             self.shutdown("run_test loop exited - possibly due to an exception?")
+        if capacity_search_task:
+            capacity_search_task.cancel()
+        await self.wait_for_users()
         end_time = time.time()
+        await stats.rotate_shards()  # while the loops are still running, so that they hand over their last requests
+        for w in self.workers + self.draining_workers:
+            w.stop()
+        events.request.flush()
         stats_printer_task.cancel()
+        if self.publisher:
+            # a worker, the parent process or coordinator does the reporting
+            await self.publisher.publish_final(self.worker_state())
+            shutdown_telemetry(OTEL_FLUSH_TIMEOUT)
+            return
+        await self.print_report(end_time)
+
+    async def print_report(self, end_time: float):
+        """Print the summary and write the HTML report, while flushing OTel"""
+        # flush OTel in the background while the report is printed (now that all requests have been recorded)
+        otel_flush = asyncio.create_task(asyncio.to_thread(shutdown_telemetry, OTEL_FLUSH_TIMEOUT))
+        if self.recorder:
+            self.recorder.close()
 
         summary_table = self.sf.get_table(True)
+        self.check_loop_lag()
+        if self.peak_lag > LAG_WARNING_THRESHOLD:
+            summary_table.caption = f"Load generator bound: event loop lag peaked at {self.peak_lag * 1000:.0f}ms, so response times are inflated"
         self.console.print(summary_table)
-        error_table = self.sf.get_error_table() if stats.error_counter else None
+        error_table = self.sf.get_error_table() if stats.get_error_counts() else None
 
-        if stats.error_counter:
+        if error_table:
             self.console.print(error_table)
 
+        counts = self.iteration_counts()
+        if self.arrival_rate_mode:
+            self.console.print(
+                f"Iterations: {counts['started']:.0f} started, {counts['dropped']:.0f} dropped (no idle user in the pool of {self.target_user_count}), {counts['delayed']:.0f} delayed (started more than {DELAY_TOLERANCE * 1000:.0f}ms late)"
+            )
+            if counts["dropped"]:
+                logger.warning(
+                    "Some iterations were dropped because all users were busy. Increase the number of users (-u or max_users) to reach the target rate."
+                )
+
+        if counts["paced"]:
+            self.console.print(
+                f"Pacing: {counts['paced']:.0f} iterations started, {counts['overruns']:.0f} overran their slot"
+                + (f" (by up to {counts['max_overrun'] * 1000:.0f}ms)" if counts["overruns"] else "")
+            )
+            if counts["overruns"]:
+                logger.warning(
+                    "Some iterations took longer than their pacing, so the following ones started late. Increase pacing or check the response times."
+                )
+
+        if self.capacity_search:
+            self.console.print(self.capacity_search.get_table())
+            self.console.print(self.capacity_search.summary())
+
         if self.html_report:
             logger.debug(f"Saving HTML report to {self.html_report}")
-            report_console = Console(record=True, file=io.StringIO())
+            report_console = Console(record=True, file=io.StringIO(), width=stats.TABLE_WIDTH)
 
             summary_table.title = f"{datetime.fromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-4]} - {datetime.fromtimestamp(end_time).strftime('%H:%M:%S.%f')[:-4]} ({end_time - self.start_time:.2f}s, target user count: {self.target_user_count})"
             report_console.print(summary_table)
             if error_table:
                 report_console.print(error_table)
-            self.html_report.parent.mkdir(parents=True, exist_ok=True)
-            report_console.save_html(str(self.html_report), inline_styles=True)
-
-        for w in self.workers:
-            w.stop()
+            if self.capacity_search:
+                report_console.print(self.capacity_search.get_table())
+                report_console.print(self.capacity_search.summary())
+            summary_html = report_console.export_html(inline_styles=True, code_format="{code}")
+            report.write_html_report(self.html_report, summary_table.title, summary_html, self.sf.history)
 
+        if not await otel_flush:
+            logger.warning(f"OTel exporters didn't finish flushing within {OTEL_FLUSH_TIMEOUT}s, some data may be lost")
         return
@@ -0,0 +1,227 @@
+"""
+Load shapes: how the target user count (or arrival rate) varies over the course of a test.
+
+The built-in shapes (step, spike, sine and from_csv) are generated as stages up front, so they are scheduled just as
+precisely as stages given in the config. For anything else, define a LoadShape subclass in your locustfile.
+"""
+
+import csv
+import itertools
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from pathlib import Path
+
+from aiolocust.datatypes import Stage
+
+
+class LoadShape(ABC):
+    """
+    Override target() to return the target user count (or arrival rate, if rate is True) at a point in the test,
+    or None to end the test. It is called at least every interval seconds (in rate mode, from each event loop too).
+    """
+
+    rate: bool = False
+    interval: float = 0.1
+
+    @abstractmethod
+    def target(self, elapsed: float) -> float | None: ...
+
+
+class Schedule(ABC):
+    """What the runner follows: the target user count/arrival rate at a point in the test (None once it is over)"""
+
+    @abstractmethod
+    def user_count(self, elapsed: float) -> int | None: ...
+
+    @abstractmethod
+    def rate(self, elapsed: float) -> float | None: ...
+
+    @abstractmethod
+    def next_change(self, elapsed: float) -> float | None:
+        """When the target will next change, so that the runner can sleep until then"""
+
+
+class StageSchedule(Schedule):
+    """
+    Target user count/arrival rate over time, ramping linearly between the targets of consecutive stages.
+
+    Stage end times are precomputed, so looking up the current stage is a binary search (which matters for long
+    lists of stages), and next_change() gives the exact time of the next change in user count, so the runner can
+    sleep until then instead of polling.
+    """
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self.ends = list(itertools.accumulate(stage.duration for stage in stages))
+
+    def _find(self, elapsed: float) -> int | None:
+        i = bisect_left(self.ends, elapsed)
+        return i if i < len(self.stages) else None
+
+    def _ramp(self, i: int, elapsed: float) -> float:
+        """Share of stage i that has passed (0-1)"""
+        stage = self.stages[i]
+        return 1 - (self.ends[i] - elapsed) / stage.duration if stage.duration else 1.0
+
+    def user_count(self, elapsed: float) -> int | None:
+        if (i := self._find(elapsed)) is None:
+            return None
+        previous = self.stages[i - 1].target if i else 0
+        return math.ceil(previous + (self.stages[i].target - previous) * self._ramp(i, elapsed))
+
+    def rate(self, elapsed: float) -> float | None:
+        if (i := self._find(elapsed)) is None:
+            return None
+        previous = (self.stages[i - 1].rate or 0.0) if i else 0.0
+        return previous + ((self.stages[i].rate or 0.0) - previous) * self._ramp(i, elapsed)
+
+    def next_change(self, elapsed: float) -> float | None:
+        """When the user count will next change (or the current stage ends, whichever comes first)"""
+        if (i := self._find(elapsed)) is None:
+            return None
+        stage, end = self.stages[i], self.ends[i]
+        previous = self.stages[i - 1].target if i else 0
+        count = math.ceil(previous + (stage.target - previous) * self._ramp(i, elapsed))
+        if stage.target > previous and count < stage.target:
+            # the count goes up as soon as the ramp passes it, and down as soon as the ramp reaches the next one
+            ramp = (count - previous) / (stage.target - previous)
+        elif stage.target < previous and count > stage.target:
+            ramp = (previous - count + 1) / (previous - stage.target)
+        else:
+            return end
+        return min(end - stage.duration * (1 - ramp), end)
+
+
+class ShapeSchedule(Schedule):
+    """The same as StageSchedule, for a custom LoadShape (which is just evaluated every interval)"""
+
+    def __init__(self, shape: LoadShape):
+        self.shape = shape
+
+    def user_count(self, elapsed: float) -> int | None:
+        target = self.shape.target(elapsed)
+        return None if target is None else math.ceil(target)
+
+    def rate(self, elapsed: float) -> float | None:
+        return self.shape.target(elapsed)
+
+    def next_change(self, elapsed: float) -> float | None:
+        return elapsed + self.shape.interval
+
+
+class StagesShape(LoadShape):
+    """A shape made up of stages, which the runner schedules exactly (see StageSchedule)"""
+
+    def __init__(self, stages: list[Stage]):
+        self.stages = stages
+        self.rate = any(stage.rate is not None for stage in stages)
+        self.schedule = StageSchedule(stages)
+
+    def target(self, elapsed: float) -> float | None:
+        return self.schedule.rate(elapsed) if self.rate else self.schedule.user_count(elapsed)
+
+
+def from_points(points: list[tuple[float, float]], rate: bool = False) -> StagesShape:
+    """Ramp linearly between (time, target) points. The shape starts at the first point's target and ends at the last"""
+    stages = []
+    previous_time = 0.0
+    for time, value in points:
+        if time < previous_time:
+            raise ValueError(f"Load shape points must be in time order ({time} comes after {previous_time})")
+        duration = time - previous_time
+        stages.append(Stage(duration, rate=value) if rate else Stage(duration, round(value)))
+        previous_time = time
+    if points and points[0][0] > 0:
+        # hold the first target from the start, instead of ramping up to it
+        first = stages[0]
+        stages[0:1] = [Stage(0, first.target, first.rate), first]
+    return StagesShape(stages)
+
+
+def step(step_size: float, step_duration: float, steps: int, rate: bool = False) -> StagesShape:
+    """Increase the target by step_size every step_duration seconds, steps times (instantly, no ramping)"""
+    points = []
+    for i in range(steps):
+        points += [(i * step_duration, (i + 1) * step_size), ((i + 1) * step_duration, (i + 1) * step_size)]
+    return from_points(points, rate)
+
+
+def spike(
+    base: float,
+    peak: float,
+    duration: float,
+    spike_at: float,
+    spike_duration: float,
+    ramp_time: float = 0.0,
+    rate: bool = False,
+) -> StagesShape:
+    """Hold base for duration seconds, except for a spike to peak at spike_at (ramping up/down over ramp_time)"""
+    points = [
+        (0, base),
+        (spike_at, base),
+        (spike_at + ramp_time, peak),
+        (spike_at + ramp_time + spike_duration, peak),
+        (spike_at + 2 * ramp_time + spike_duration, base),
+        (duration, base),
+    ]
+    return from_points(points, rate)
+
+
+def sine(
+    low: float, high: float, period: float, duration: float, resolution: float = 1.0, rate: bool = False
+) -> StagesShape:
+    """
+    Vary the target between low and high, starting at low and peaking halfway through each period. With a period of
+    (a scaled down) 24 hours this makes a simple diurnal pattern. The curve is approximated by straight lines,
+    one every resolution seconds.
+    """
+    segments = max(math.ceil(duration / resolution), 1)
+    points = []
+    for i in range(segments + 1):
+        time = min(i * resolution, duration)
+        points.append((time, low + (high - low) * (1 - math.cos(2 * math.pi * time / period)) / 2))
+    return from_points(points, rate)
+
+
+def from_csv(path: Path, rate: bool = False) -> StagesShape:
+    """
+    Ramp between points read from a CSV file with two columns: time (seconds since the start of the test) and target.
+    Rows that don't start with a number (like a header) are skipped.
+    """
+    points = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            try:
+                points.append((float(row[0]), float(row[1])))
+            except ValueError, IndexError:
+                continue
+    if not points:
+        raise ValueError(f"No (time, target) rows found in {path}")
+    return from_points(points, rate)
+
+
+def share(total: int, index: int, count: int) -> int:
+    """Part index (of count) of total, split as evenly as possible. The parts always add up to total"""
+    return total // count + (1 if index < total % count else 0)
+
+
+class PartitionedSchedule(Schedule):
+    """One part of another schedule, when the users are split between several processes"""
+
+    def __init__(self, schedule: Schedule, index: int, count: int):
+        self.schedule = schedule
+        self.index = index
+        self.count = count
+
+    def user_count(self, elapsed: float) -> int | None:
+        total = self.schedule.user_count(elapsed)
+        return None if total is None else share(total, self.index, self.count)
+
+    def rate(self, elapsed: float) -> float | None:
+        rate = self.schedule.rate(elapsed)
+        return None if rate is None else rate / self.count
+
+    def next_change(self, elapsed: float) -> float | None:
+        # a change in the total doesn't necessarily change our part, but waking up for nothing now and then is harmless
+        return self.schedule.next_change(elapsed)
@@ -1,88 +1,374 @@
+import asyncio
+import concurrent.futures
+import logging
 import os
+import threading
 import time
 from collections import defaultdict
+from contextvars import ContextVar
 from threading import Lock
-from types import TracebackType
+from types import CodeType, TracebackType
 
-from opentelemetry import metrics
-from opentelemetry.sdk.metrics.export import HistogramDataPoint
 from rich.table import Table
 
-from aiolocust import otel
 from aiolocust.datatypes import Request, RequestEntry
+from aiolocust.history import PERCENTILES, StatsHistory
 
 MAX_ERROR_KEYS = 200
+MAX_NAME_KEYS = 500
+MAX_ERROR_FINGERPRINTS = 10_000
+TTFB_PERCENTILES = (0.5, 0.95, 0.99)
+CORRECTED_PERCENTILES = (0.5, 0.95, 0.99, 0.999)
+# wide enough to fit all columns, used when we're not printing to a terminal
+TABLE_WIDTH = 250
+# how long to wait for a busy event loop to hand over its shard before moving on
+SHARD_ROTATE_TIMEOUT = 0.5
 
-
-meter = metrics.get_meter("locust")
-ttlb_histogram = meter.create_histogram(
-    "locust.client.duration", unit="s", description="Time to last byte for requests"
-)
+logger = logging.getLogger(__name__)
+# merged from the shards whenever stats are collected
 error_counter = defaultdict(int)
 error_counter_lock = Lock()
+# formatted messages of assertion errors, keyed on (exception type, code object, line number) of where they were
+# raised, so that an error storm doesn't mean formatting the same message over and over
+_error_fingerprints: dict[tuple[type, CodeType, int], str] = {}
+# every request name seen so far (a dict rather than a set, because dict lookups don't lock in freethreading builds)
+known_names: dict[str, None] = {}
+known_names_lock = Lock()
 
+type EntryKey = tuple[str, str | None]  # (name, error.type)
 
-def record_error(message: str) -> None:
+# How late the current iteration started compared to its intended start time.
+# Only set when running with coordinated omission correction, in which case it is added to each request's latency.
+iteration_delay: ContextVar[float | None] = ContextVar("iteration_delay", default=None)
+
+
+class Shard:
+    """
+    Request stats recorded by a single thread (in practice, a single event loop).
+
+    Only the owning thread ever writes to `entries` and `errors`, so recording a request doesn't need any locks.
+    When stats are collected the owner swaps in fresh dicts and hands the old ones over via `retired`.
+    """
+
+    def __init__(self):
+        self.entries: dict[EntryKey, RequestEntry] = {}
+        self.errors: dict[str, int] = {}
+        self.retired: list[tuple[dict[EntryKey, RequestEntry], dict[str, int]]] = []
+        self.thread_id = threading.get_ident()
+        self.thread = threading.current_thread()
+        try:
+            self.loop: asyncio.AbstractEventLoop | None = asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop = None
+
+    def rotate(self) -> None:
+        entries, self.entries = self.entries, {}
+        errors, self.errors = self.errors, {}
+        self.retired.append((entries, errors))
+
+    def request_rotate(self) -> concurrent.futures.Future | None:
+        """Rotate the shard, on its own loop if it is running somewhere else. Returns a Future if rotation is pending"""
+        if self.loop is None or self.thread_id == threading.get_ident() or not self.loop.is_running():
+            # either we're the owner, or the owner isn't running an event loop right now (requests recorded
+            # from plain threads without a loop are rare, and for those this is best effort)
+            self.rotate()
+            return None
+        done = concurrent.futures.Future()
+
+        def _rotate():
+            self.rotate()
+            done.set_result(None)
+
+        try:
+            self.loop.call_soon_threadsafe(_rotate)
+        except RuntimeError:  # loop closed after we checked
+            self.rotate()
+            return None
+        return done
+
+    def take_retired(self) -> list[tuple[dict[EntryKey, RequestEntry], dict[str, int]]]:
+        taken = []
+        while self.retired:
+            taken.append(self.retired.pop())
+        return taken
+
+
+_local = threading.local()
+_shards: list[Shard] = []
+_shards_lock = Lock()
+_collect_lock = Lock()
+# entries collected from shards, but not yet picked up by StatsFormatter
+_pending: dict[EntryKey, RequestEntry] = defaultdict(RequestEntry)
+# everything collected since the last reset, exported to OTel as cumulative histograms
+_totals: dict[EntryKey, RequestEntry] = defaultdict(RequestEntry)
+totals_start_time_ns = time.time_ns()
+# for each OTel exporter that prefers delta temporality: what was collected since its previous export
+_deltas: list[dict[EntryKey, RequestEntry]] = []
+
+
+def _get_shard() -> Shard:
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        return shard
+
+
+def _request_rotations() -> list[concurrent.futures.Future]:
+    with _shards_lock:
+        shards = list(_shards)
+    return [fut for shard in shards if (fut := shard.request_rotate())]
+
+
+async def rotate_shards(timeout: float = SHARD_ROTATE_TIMEOUT) -> None:
+    """
+    Have every shard hand over what it has recorded, without blocking the calling loop. Call this before collecting
+    stats to get everything up to now, rather than what the other loops had handed over by the previous collection
+    """
+    if pending := _request_rotations():
+        await asyncio.wait([asyncio.wrap_future(fut) for fut in pending], timeout=timeout)
+
+
+def _collect_shards() -> None:
+    # must be called while holding _collect_lock. Shards of other running loops are asked to rotate, but never waited
+    # for (that would block whoever is collecting, usually an event loop), so they are picked up by the next collection
+    _request_rotations()
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # once its thread has ended (like the loops removed by --event-loops auto) nothing can be added to a shard,
+        # so after a final rotation it can be dropped
+        finished = not shard.thread.is_alive()
+        if finished:
+            shard.rotate()
+        # anything not retired in time will be picked up next time
+        for entries, errors in shard.take_retired():
+            for key, entry in entries.items():
+                _add_entry(key, entry)
+            if errors:
+                _merge_errors(errors)
+        if finished:
+            with _shards_lock:
+                _shards.remove(shard)
+
+
+def _add_entry(key: EntryKey, entry: RequestEntry) -> None:
+    _pending[key] += entry
+    _totals[key] += entry
+    for deltas in _deltas:
+        deltas[key] += entry
+
+
+def _merge_errors(errors: dict[str, int]) -> None:
+    with error_counter_lock:
+        for message, count in errors.items():
+            if message not in error_counter and len(error_counter) >= MAX_ERROR_KEYS:
+                message = "OTHER"
+            error_counter[message] += count
+
+
+def merge(entries: dict[EntryKey, RequestEntry], errors: dict[str, int]) -> None:
+    """Add stats that were recorded somewhere else (in another process, when running with --processes)"""
+    with _collect_lock:
+        for (name, error_type), entry in entries.items():
+            _add_entry((limit_name(name), error_type), entry)
+    _merge_errors(errors)
+
+
+def take_entries() -> dict[EntryKey, RequestEntry]:
+    """Return everything recorded since the previous call"""
+    global _pending
+    with _collect_lock:
+        _collect_shards()
+        entries, _pending = _pending, defaultdict(RequestEntry)
+    return entries
+
+
+def get_totals() -> dict[EntryKey, RequestEntry]:
+    """Return a copy of everything recorded since the last reset (used for exporting to OTel)"""
+    with _collect_lock:
+        _collect_shards()
+        totals: dict[EntryKey, RequestEntry] = {}
+        for key, entry in _totals.items():
+            totals[key] = RequestEntry()
+            totals[key] += entry
+    return totals
+
+
+def track_deltas() -> dict[EntryKey, RequestEntry]:
+    """Start collecting into a dict of its own, to be emptied by take_deltas() (used for exporting deltas to OTel)"""
+    deltas: dict[EntryKey, RequestEntry] = defaultdict(RequestEntry)
+    with _collect_lock:
+        _deltas.append(deltas)
+    return deltas
+
+
+def take_deltas(deltas: dict[EntryKey, RequestEntry]) -> dict[EntryKey, RequestEntry]:
+    """Return what was collected into deltas (from track_deltas()) since the previous call"""
+    with _collect_lock:
+        _collect_shards()
+        taken = dict(deltas)
+        deltas.clear()
+    return taken
+
+
+def reset() -> None:
+    global totals_start_time_ns
+    with _collect_lock:
+        _collect_shards()
+        _pending.clear()
+        _totals.clear()
+        for deltas in _deltas:
+            deltas.clear()
+        totals_start_time_ns = time.time_ns()
+    error_counter.clear()
+    known_names.clear()
+
+
+def get_error_counts() -> dict[str, int]:
+    """Return a copy of the number of occurrences of each error since the last reset"""
+    with _collect_lock:
+        _collect_shards()
     with error_counter_lock:
-        if message not in error_counter and len(error_counter) >= MAX_ERROR_KEYS:
-            message = "OTHER"
-        error_counter[message] += 1
+        return dict(error_counter)
+
+
+def record_error(message: str) -> None:
+    errors = _get_shard().errors
+    if message not in errors and len(errors) >= MAX_ERROR_KEYS:
+        message = "OTHER"
+    errors[message] = errors.get(message, 0) + 1
+
+
+def error_message(error: Exception | bool | str) -> str:
+    if isinstance(error, AssertionError):
+        tb: TracebackType | None = getattr(error, "exc_tb", None) or error.__traceback__
+        if tb:
+            # note: asserts with dynamic messages will all be reported using the first message for that line
+            fingerprint = (error.__class__, tb.tb_frame.f_code, tb.tb_lineno)
+            message = _error_fingerprints.get(fingerprint)
+            if message is None:
+                message = f"{str(error) or error.__class__.__name__} ({os.path.basename(tb.tb_frame.f_code.co_filename)}:{tb.tb_lineno})"
+                if len(_error_fingerprints) < MAX_ERROR_FINGERPRINTS:
+                    _error_fingerprints[fingerprint] = message
+            return message
+    return str(error) or error.__class__.__name__
+
+
+def limit_name(name: str) -> str:
+    """Returns the name, or OTHER if there are already too many distinct names"""
+    if name in known_names:
+        return name
+    if len(known_names) >= MAX_NAME_KEYS:
+        return "OTHER"
+    with known_names_lock:
+        if len(known_names) >= MAX_NAME_KEYS:
+            return "OTHER"
+        known_names[name] = None
+        if len(known_names) == MAX_NAME_KEYS:
+            logger.warning(
+                f"Reached the maximum number of distinct request names ({MAX_NAME_KEYS}), any new ones will be counted as OTHER. Use the name parameter or HttpUser.name_rules to group requests."
+            )
+    return name
 
 
 def record_request(req: Request) -> None:
-    attributes = {
-        "name": req.name,
-        # the rest of these remain to be implemented
-        # http.method=GET,
-        # http.host=localhost,
-        # net.peer.name=localhost,
-        # net.peer.port=8080,
-        # http.status_code=200}
-    }
+    error_type = None
     if req.error:
         # error.type is propagated to otel, but it also picked up when calculating command line stats table
-        attributes["error.type"] = req.error.__class__.__name__
-        if isinstance(req.error, AssertionError):
-            tb: TracebackType = req.error.exc_tb  # type: ignore
-            record_error(
-                f"{str(req.error) or req.error.__class__.__name__} ({os.path.basename(tb.tb_frame.f_code.co_filename)}:{tb.tb_lineno})"
-            )
-        else:
-            record_error(str(req.error) or req.error.__class__.__name__)
-    ttlb_histogram.record(req.ttlb, attributes=attributes)
+        error_type = req.error.__class__.__name__
+        record_error(error_message(req.error))
+    entries = _get_shard().entries
+    key = (req.name, error_type)
+    entry = entries.get(key)
+    if entry is None:
+        # only check cardinality the first time a name is seen in this shard, to keep it off the hot path
+        key = (limit_name(req.name), error_type)
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = RequestEntry()
+    entry.record(req.ttfb, req.ttlb, error_type is not None)
+    if (delay := iteration_delay.get()) is not None:
+        entry.record_corrected(req.ttlb + delay)
+
+
+def new_table(first_column="Name", co_correction=False) -> Table:
+    table = Table(show_edge=False)
+    table.add_column(first_column, max_width=30)
+    table.add_column("Count", justify="right")
+    table.add_column("Failures", justify="right")
+    table.add_column("Avg", justify="right")
+    for quantile in PERCENTILES:
+        table.add_column(f"p{quantile * 100:g}", justify="right")
+    table.add_column("Max", justify="right")
+    table.add_column("TTFB Avg", justify="right")
+    for quantile in TTFB_PERCENTILES:
+        table.add_column(f"TTFB p{quantile * 100:g}", justify="right")
+    if co_correction:
+        for quantile in CORRECTED_PERCENTILES:
+            table.add_column(f"CO p{quantile * 100:g}", justify="right")
+        table.add_column("CO Max", justify="right")
+    table.add_column("Rate", justify="right")
+    return table
+
+
+def make_row(name: str, re: RequestEntry, start, end, co_correction=False) -> list[str]:
+    corrected = []
+    if co_correction:
+        corrected = [
+            *(f"{value:4.1f}ms" for value in re.corrected_percentiles_ms(CORRECTED_PERCENTILES)),
+            f"{re.max_corrected_ms:4.1f}ms",
+        ]
+    return [
+        name,
+        str(re.count),
+        f"{re.errorcount} ({re.error_percentage:2.1f}%)",
+        f"{re.avg_ttlb_ms:4.1f}ms",
+        *(f"{value:4.1f}ms" for value in re.ttlb_percentiles_ms(PERCENTILES)),
+        f"{re.max_ttlb_ms:4.1f}ms",
+        f"{re.avg_ttfb_ms:4.1f}ms",
+        *(f"{value:4.1f}ms" for value in re.ttfb_percentiles_ms(TTFB_PERCENTILES)),
+        *corrected,
+        f"{re.rate(start, end):.2f}/s",
+    ]
 
 
 class StatsFormatter:
-    def __init__(self):
+    def __init__(self, co_correction=False):
+        self.co_correction = co_correction
         self.start_time = time.time()
         self.last_time = self.start_time
         self.aggregate: dict[str, RequestEntry] = defaultdict(RequestEntry)
-        # clear reader, in case this is not the first Stats object
-        _ = otel.reader.get_metrics_data()
-        error_counter.clear()
+        self.history = StatsHistory()
+        self.user_count = 0  # kept up to date by the Runner, for recording in history
+        # taken by take_window() but not yet shown in a table, and what take_window() hasn't returned yet
+        self.taken: dict[str, RequestEntry] = defaultdict(RequestEntry)
+        self.window = RequestEntry()
+        # clear stats, in case this is not the first Stats object
+        reset()
 
-    def _get_entries(self) -> dict[str, RequestEntry]:
-        metrics_data = otel.reader.get_metrics_data()
-        entries: dict[str, RequestEntry] = defaultdict(RequestEntry)
-        for resource_metric in metrics_data.resource_metrics if metrics_data else []:
-            for scope_metric in resource_metric.scope_metrics:
-                for metric in scope_metric.metrics:
-                    if metric.name != "locust.client.duration":
-                        continue
-                    for point in metric.data.data_points:
-                        if not point.attributes:
-                            raise Exception(f"A data point had no attributes, that should never happen. Point: {point}")
-                        if not isinstance(point, HistogramDataPoint):
-                            raise Exception(f"Unexpected Strange datapoint type: {point}")
-                        entries[str(point.attributes["name"])] += RequestEntry(
-                            point.count,
-                            point.count if point.attributes.get("error.type") else 0,
-                            point.sum,
-                            point.max,
-                        )
+    def _take(self) -> None:
+        for (name, _error_type), entry in take_entries().items():
+            self.taken[name] += entry
+            self.window += entry
 
+    def _get_entries(self) -> dict[str, RequestEntry]:
+        self._take()
+        entries, self.taken = self.taken, defaultdict(RequestEntry)
         return entries
 
+    async def take_window(self) -> RequestEntry:
+        """
+        Everything recorded (all names combined) since the previous call, for evaluating a part of the test while it
+        runs. It still shows up in the next table as usual
+        """
+        await rotate_shards()
+        self._take()
+        window, self.window = self.window, RequestEntry()
+        return window
+
     def _get_rows(self, final_summary) -> list[list[str]]:
         table: list[list[str]] = []
         summary_table: list[list[str]] = []
@@ -96,6 +382,7 @@ class StatsFormatter:
             total += re
             table.append(self.make_row(url, re, self.last_time, now))
         table.append(self.make_row("Total", total, self.last_time, now))
+        self.history.record(self.last_time, now, self.user_count, entries, total=total)
 
         self.last_time = now
 
@@ -111,15 +398,11 @@ class StatsFormatter:
 
         return summary_table
 
-    def get_table(self, final_summary=False):
-        table = Table(show_edge=False)
-        table.add_column("Name", max_width=30)
-        table.add_column("Count", justify="right")
-        table.add_column("Failures", justify="right")
-        table.add_column("Avg", justify="right")
-        table.add_column("Max", justify="right")
-        table.add_column("Rate", justify="right")
+    def new_table(self, first_column="Name") -> Table:
+        return new_table(first_column, self.co_correction)
 
+    def get_table(self, final_summary=False):
+        table = self.new_table()
         for row in self._get_rows(final_summary):
             table.add_row(*row)
 
@@ -133,18 +416,10 @@ class StatsFormatter:
         error_table.add_column("Count")
         error_table.add_column("Error")
 
-        for key, count in sorted(error_counter.items(), key=lambda item: item[1], reverse=True):
+        for key, count in sorted(get_error_counts().items(), key=lambda item: item[1], reverse=True):
             error_table.add_row(str(count), key)
 
         return error_table
 
-    @staticmethod
-    def make_row(name: str, re: RequestEntry, start, end) -> list[str]:
-        return [
-            name,
-            str(re.count),
-            f"{re.errorcount} ({re.error_percentage:2.1f}%)",
-            f"{re.avg_ttlb_ms:4.1f}ms",
-            f"{re.max_ttlb_ms:4.1f}ms",
-            f"{re.rate(start, end):.2f}/s",
-        ]
+    def make_row(self, name: str, re: RequestEntry, start, end) -> list[str]:
+        return make_row(name, re, start, end, self.co_correction)
@@ -1,8 +1,10 @@
+import re
 import ssl
 import time
-from asyncio import Future
+from asyncio import CancelledError, Future
 from collections.abc import Coroutine
 from contextlib import asynccontextmanager
+from types import TracebackType
 from typing import TYPE_CHECKING, Any
 
 import aiohttp
@@ -13,11 +15,30 @@ from opentelemetry.context import Context, Token  # type: ignore # Token exists,
 from opentelemetry.trace import Span, StatusCode
 
 from aiolocust import User, events
-from aiolocust.datatypes import Request
+from aiolocust.datatypes import CANCELLED_AT_SHUTDOWN, Request
 
 if TYPE_CHECKING:  # avoid circular import
     from aiolocust.runner import Runner
 
+# Applied (in order) to URLs used as names for requests that don't have an explicit name,
+# to avoid every id or query string ending up as a separate row in the stats
+DEFAULT_NAME_RULES: list[tuple[str, str]] = [
+    (r"[?#].*$", ""),
+    (r"(?<![^/])[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)", "{uuid}"),
+    (r"(?<![^/])\d+(?=/|$)", "{id}"),
+    (r"(?<![^/])[0-9a-fA-F]{16,}(?=/|$)", "{hash}"),
+]
+
+
+def compile_name_rules(rules: list[tuple[str, str]]) -> tuple[tuple[re.Pattern, str], ...]:
+    return tuple((re.compile(pattern), replacement) for pattern, replacement in rules)
+
+
+def normalize_name(name: str, rules: tuple[tuple[re.Pattern, str], ...]) -> str:
+    for pattern, replacement in rules:
+        name = pattern.sub(replacement, name)
+    return name
+
 
 class HttpUser(User):
     session_kwargs: dict[str, Any] = {"timeout": aiohttp.ClientTimeout(60.0)}
@@ -48,6 +69,18 @@ class HttpUser(User):
         ...
     """
 
+    name_rules: list[tuple[str, str]] = DEFAULT_NAME_RULES
+    """
+    (regex, replacement) rules used to turn URLs into names, for requests without an explicit name.
+    By default, query strings are removed and numeric, UUID and hash-like path segments are collapsed.
+    To add your own rules, while keeping the default ones:
+    ```
+    class MyUser(HttpUser):
+        name_rules = [*DEFAULT_NAME_RULES, (r"/users/[^/]+", "/users/{username}")]
+        ...
+    ```
+    """
+
     def __init__(self, runner: Runner | None = None, base_url=None):
         super().__init__(runner)
         self.base_url = base_url or runner.host if runner else None
@@ -58,6 +91,7 @@ class HttpUser(User):
         async with LocustClientSession(
             self.runner,
             self.base_url,
+            name_rules=self.name_rules,
             connector=aiohttp.TCPConnector(ssl=self.ssl_context) if self.ssl_context else None,
             **self.session_kwargs,
         ) as self.client:
@@ -80,12 +114,16 @@ class LocustRequestContextManager(_RequestContextManager):
         self.str_or_url = coro._coro.cr_frame.f_locals["str_or_url"]  # type: ignore
         self.method = coro._coro.cr_frame.f_locals["method"]  # type: ignore
         self._base_url = coro._coro.cr_frame.f_locals["self"]._base_url  # type: ignore
+        self._name_rules = coro._coro.cr_frame.f_locals["self"].name_rules  # type: ignore
         self._resp: LocustResponse  # type: ignore
         self._token: Token[Context]
         self.span: Span
         self.start_time: float
         self.name = name
 
+    def _get_name(self, url) -> str:
+        return self.name or normalize_name(str(url).removeprefix(str(self._base_url)), self._name_rules)
+
     async def __aenter__(self) -> LocustResponse:
         self.span = trace.get_tracer("aiolocust").start_span(f"{self.method} {self.name}" if self.name else self.method)
         self.span.set_attribute("http.method", self.method)
@@ -94,40 +132,56 @@ class LocustRequestContextManager(_RequestContextManager):
         self._token = context.attach(ctx)
         try:
             await super().__aenter__()
+            self.url = super()._resp.url
+            self.ttfb = time.perf_counter() - self.start_time
+            # reading the body is part of the request, so a cancellation while doing that is handled below as well
+            self._resp._bytes = await self._resp.read()
+            self.ttlb = time.perf_counter() - self.start_time
         except ClientConnectorError as e:
             elapsed = self.ttlb = time.perf_counter() - self.start_time
             if request_info := getattr(e, "request_info", None):
                 url = request_info.url
             else:
                 url = self.str_or_url
-            events.request.fire(Request(str(self.name or url), elapsed, elapsed, e))
+            events.request.fire(Request(self._get_name(url), elapsed, elapsed, e))
             raise
         except ClientResponseError as e:
             elapsed = self.ttlb = time.perf_counter() - self.start_time
-            events.request.fire(Request(str(self.name or self.str_or_url), elapsed, elapsed, e))
+            events.request.fire(Request(self._get_name(self.str_or_url), elapsed, elapsed, e, e.status))
             raise
         except TimeoutError as e:
             elapsed = self.ttlb = time.perf_counter() - self.start_time
-            events.request.fire(Request(str(self.name or self.str_or_url), elapsed, elapsed, e))
+            events.request.fire(Request(self._get_name(self.str_or_url), elapsed, elapsed, e))
+            raise
+        except CancelledError as e:
+            if e.args == (CANCELLED_AT_SHUTDOWN,):  # not just any cancellation (like the user's own timeouts)
+                elapsed = self.ttlb = time.perf_counter() - self.start_time
+                events.request.fire(Request(self._get_name(self.str_or_url), elapsed, elapsed, CANCELLED_AT_SHUTDOWN))
+            context.detach(self._token)
+            self.span.end()
             raise
-        else:
-            self.url = super()._resp.url
-            self.ttfb = time.perf_counter() - self.start_time
-            self._resp._bytes = await self._resp.read()
-            self.ttlb = time.perf_counter() - self.start_time
         self._resp.span = self.span
         return self._resp
 
-    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
         await super().__aexit__(exc_type, exc_val, exc_tb)
         if self._resp.error is None:  # no explicit value set in with-block
             try:
                 self._resp.raise_for_status()
             except (ClientResponseError, ClientConnectorError) as e:
                 self._resp.error = e
-            if exc_val:  # overwrite if there was an explicit exception (e.g. an assert or crash)
-                exc_val.exc_tb = exc_tb  # add traceback so we can add line number info to error summary
+            if isinstance(exc_val, CancelledError) and exc_val.args == (CANCELLED_AT_SHUTDOWN,):
+                self._resp.error = CANCELLED_AT_SHUTDOWN
+            elif isinstance(exc_val, Exception):  # overwrite if there was an explicit exception (e.g. an assert)
+                setattr(exc_val, "exc_tb", exc_tb)  # add traceback so we can add line number info to error summary
                 self._resp.error = exc_val
+            elif exc_val:  # other cancellations, like the user's own timeouts
+                self._resp.error = str(exc_val) or type(exc_val).__name__
         if self._resp.error:
             self.span.set_status(StatusCode.ERROR)
             self.span.set_attribute("exception.type", type(self._resp.error).__name__)
@@ -140,17 +194,25 @@ class LocustRequestContextManager(_RequestContextManager):
         self.span.end()
         events.request.fire(
             Request(
-                self.name or str(self.url).removeprefix(str(self._base_url)),
+                self._get_name(self.url),
                 self.ttfb,
                 self.ttlb,
                 self._resp.error,
+                self._resp.status,
             )
         )
 
 
 class LocustClientSession(ClientSession):
-    def __init__(self, runner: Runner | None = None, base_url=None, **kwargs):
+    def __init__(
+        self,
+        runner: Runner | None = None,
+        base_url=None,
+        name_rules: list[tuple[str, str]] = DEFAULT_NAME_RULES,
+        **kwargs,
+    ):
         self.runner: Runner = runner  # pyright: ignore[reportAttributeAccessIssue] # always set outside of unit testing
+        self.name_rules = compile_name_rules(name_rules)  # once per session, not for every request
         super().__init__(base_url=base_url, response_class=LocustResponse, **kwargs)
 
     # explicitly declare this to get the correct return type
@@ -1,10 +1,12 @@
+import time
+from asyncio import CancelledError
 from contextlib import asynccontextmanager
 
 from opentelemetry import trace
 from playwright.async_api import Page, async_playwright  # pyright: ignore[reportMissingImports]
 
 from aiolocust import User, events
-from aiolocust.datatypes import Request
+from aiolocust.datatypes import CANCELLED_AT_SHUTDOWN, Request
 from aiolocust.runner import Runner
 
 # Setup OTel Tracer (this is probably going to need to change)
@@ -23,25 +25,48 @@ class LocustPage:
     async def goto(self, url: str, **kwargs):
         with tracer.start_as_current_span("playwright.goto") as span:
             span.set_attribute("browser.url", url)
+            start_time = time.perf_counter()
             try:
                 result = await self._page.goto(url, **kwargs)
-                events.request.fire(Request(url, 1, 1, None))
             except Exception as e:
+                elapsed = time.perf_counter() - start_time
                 span.record_exception(e)
-                events.request.fire(Request(url, 1, 1, e))
+                events.request.fire(Request(url, elapsed, elapsed, e))
                 raise
+            except CancelledError as e:
+                if e.args == (CANCELLED_AT_SHUTDOWN,):
+                    elapsed = time.perf_counter() - start_time
+                    events.request.fire(Request(url, elapsed, elapsed, CANCELLED_AT_SHUTDOWN))
+                raise
+            ttlb = time.perf_counter() - start_time
+            ttfb = ttlb
+            if result:
+                # timings are in ms, relative to the start of the request, and -1 if not available
+                response_start = result.request.timing["responseStart"]
+                if response_start >= 0:
+                    ttfb = response_start / 1000
+            events.request.fire(Request(url, ttfb, ttlb, None, result.status if result else 0))
             return result
 
     async def click(self, selector: str, **kwargs):
         with tracer.start_as_current_span("playwright.click") as span:
             span.set_attribute("browser.selector", selector)
+            start_time = time.perf_counter()
             try:
                 result = await self._page.click(selector, **kwargs)
-                events.request.fire(Request(selector, 1, 1, None))
             except Exception as e:
+                elapsed = time.perf_counter() - start_time
                 span.record_exception(e)
-                events.request.fire(Request(selector, 1, 1, e))
+                events.request.fire(Request(selector, elapsed, elapsed, e))
+                raise
+            except CancelledError as e:
+                if e.args == (CANCELLED_AT_SHUTDOWN,):
+                    elapsed = time.perf_counter() - start_time
+                    events.request.fire(Request(selector, elapsed, elapsed, CANCELLED_AT_SHUTDOWN))
                 raise
+            # there's no response to wait for, so first byte and last byte are the same thing
+            elapsed = time.perf_counter() - start_time
+            events.request.fire(Request(selector, elapsed, elapsed, None))
             return result
 
 
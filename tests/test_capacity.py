@@ -0,0 +1,56 @@
+import pytest
+
+from aiolocust.capacity import CapacitySearch
+from aiolocust.datatypes import RequestEntry
+
+
+def window(count: int, latency: float = 0.01, errors: int = 0) -> RequestEntry:
+    entry = RequestEntry()
+    for i in range(count):
+        entry.record(latency, latency, i < errors)
+    return entry
+
+
+def run_search(search: CapacitySearch, capacity: float) -> list[float]:
+    """Evaluate steps against a system that starts failing above capacity, returning the loads that were tried"""
+    loads = []
+    while search.load is not None:
+        loads.append(search.load)
+        search.record(window(100, latency=0.01 if search.load <= capacity else 1.0), 1.0)
+    return loads
+
+
+def test_step_then_bisect():
+    search = CapacitySearch(step=10, p95_ms=500)
+    assert run_search(search, capacity=27) == [10, 20, 30, 25, 28, 26, 27]
+    assert search.passed == 27
+    assert search.failed == 28
+    assert [step.phase for step in search.steps] == ["step"] * 3 + ["bisect"] * 4
+    assert search.summary() == "Capacity: 27 users met the SLO (p95 <= 500ms, errors <= 1.0%), 28 users didn't"
+
+
+def test_rate_resolution_and_max_load():
+    search = CapacitySearch(step=100, p95_ms=500, rate=True, resolution=10)
+    run_search(search, capacity=333)
+    assert search.passed is not None and search.failed is not None
+    assert 0 < search.failed - search.passed <= 10
+    assert search.passed <= 333 < search.failed
+
+    search = CapacitySearch(step=10, start=20, max_load=40, p95_ms=500)
+    assert run_search(search, capacity=1000) == [20, 30, 40]
+    assert search.summary().endswith("up to max_load")
+
+
+def test_slo():
+    search = CapacitySearch(step=5, error_rate=0.05)
+    search.record(window(100, errors=5), 1.0)
+    search.record(window(100, errors=6), 1.0)
+    search.record(window(0), 1.0)  # no requests at all
+    assert [step.passed for step in search.steps] == [True, False, False]
+    assert search.steps[1].error_rate == 0.06
+    # the first step failing means bisecting between nothing and that step
+    search = CapacitySearch(step=8, p95_ms=100)
+    search.record(window(10, latency=0.2), 1.0)
+    assert search.load == 4
+    with pytest.raises(ValueError):
+        CapacitySearch(step=5, p95_ms=None, error_rate=None)
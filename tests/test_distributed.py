@@ -0,0 +1,38 @@
+import asyncio
+
+from aiolocust.datatypes import RequestEntry
+from aiolocust.distributed import PROTOCOL_VERSION, WorkerGroup, encode_message, read_message
+from aiolocust.processes import decode_entries, encode_entries
+
+
+async def test_messages_survive_the_wire():
+    entry = RequestEntry()
+    entry.record(0.01, 0.02, False)
+    entry.record(0.1, 0.2, True)
+    reader = asyncio.StreamReader()
+    reader.feed_data(encode_message({"type": "stats", "entries": encode_entries({("/", None): entry})}))
+    reader.feed_eof()
+    message = await read_message(reader)
+    assert message is not None
+    decoded = decode_entries(message["entries"])[("/", None)]
+    assert decoded.count == 2
+    assert decoded.errorcount == 1
+    assert decoded.ttlb_histogram.counts == entry.ttlb_histogram.counts
+    assert await read_message(reader) is None
+
+
+async def test_other_protocol_versions_are_rejected():
+    group = WorkerGroup(1, {}, host="localhost", port=0)
+    await group.listen()
+    assert group.server
+    port = group.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("localhost", port)
+        writer.write(encode_message({"type": "hello", "version": PROTOCOL_VERSION + 1, "hostname": "old"}))
+        message = await read_message(reader)
+        assert message and message["type"] == "reject"
+        assert "protocol version" in message["reason"]
+        assert not group.writers
+        writer.close()
+    finally:
+        group.close()
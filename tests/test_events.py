@@ -0,0 +1,67 @@
+import threading
+import time
+
+from aiolocust import events
+from aiolocust.datatypes import Request
+
+
+def test_batch_listener():
+    events._clear_handlers()
+    batches: list[list[Request]] = []
+
+    @events.request.add_batch_listener(max_batch=100, interval=0.1)
+    def save_batch(requests: list[Request]):
+        batches.append(requests)
+
+    def fire_many():
+        for i in range(250):
+            events.request.fire(Request(f"foo{i}", 0, 0, None))
+
+    threads = [threading.Thread(target=fire_many) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    events.request.flush()
+    assert sum(len(batch) for batch in batches) == 1000
+    assert max(len(batch) for batch in batches) <= 100
+
+    # partial batches are delivered after interval
+    batches.clear()
+    events.request.fire(Request("bar", 0, 0, None))
+    time.sleep(0.3)
+    assert [[request.name for request in batch] for batch in batches] == [["bar"]]
+    events._clear_handlers()
+
+
+def test_batch_listener_error(caplog):
+    events._clear_handlers()
+    calls = []
+
+    def broken(requests: list[Request]):
+        calls.append(len(requests))
+        raise Exception("oops")
+
+    events.request.add_batch_listener(broken, max_batch=2)
+    for _ in range(3):
+        events.request.fire(Request("foo", 0, 0, None))
+    events.request.flush()
+    assert sum(calls) == 3
+    assert "Error in batch listener broken" in caplog.text
+    events._clear_handlers()
+
+
+def test_batch_listener_registered_once():
+    events._clear_handlers()
+    batches: list[list[Request]] = []
+
+    def save_batch(requests: list[Request]):
+        batches.append(requests)
+
+    events.request.add_batch_listener(save_batch)
+    events.request.add_batch_listener(save_batch, max_batch=10)
+    assert len(events.request._batch_listeners) == 1
+    events.request.fire(Request("foo", 0, 0, None))
+    events.request.flush()
+    assert [[request.name for request in batch] for batch in batches] == [["foo"]]
+    events._clear_handlers()
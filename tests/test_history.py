@@ -0,0 +1,66 @@
+from aiolocust.datatypes import RequestEntry
+from aiolocust.history import RingBuffer, StatsHistory
+
+
+def entry(count: int, ttlb: float, errors: int = 0) -> RequestEntry:
+    re = RequestEntry()
+    for i in range(count):
+        re.record(ttlb, ttlb, i < errors)
+    return re
+
+
+def test_ring_buffer():
+    rb = RingBuffer(3, {"a": "I", "b": "d"})
+    for i in range(2):
+        rb.append(i, i / 2)
+    assert rb.get("a") == [0, 1]
+    for i in range(2, 5):
+        rb.append(i, i / 2)
+    assert len(rb) == 3
+    assert rb.get("a") == [2, 3, 4]
+    assert rb.get("b") == [1.0, 1.5, 2.0]
+    assert rb.nbytes == 3 * rb.columns["a"].itemsize + 3 * 8
+
+
+def test_history():
+    history = StatsHistory()
+    history.record(0, 2, 1, {"foo": entry(10, 0.1, errors=2), "bar": entry(5, 0.2)})
+    history.record(2, 4, 2, {"bar": entry(5, 0.3)})
+    history.record(4, 6, 3, {"foo": entry(20, 0.1)})
+    assert history.names() == ["foo", "bar"]
+
+    foo = history.get("foo")
+    assert foo["end"] == [2, 4, 6]
+    assert foo["users"] == [1, 2, 3]
+    assert foo["count"] == [10, 0, 20]
+    assert foo["errors"] == [2, 0, 0]
+    assert round(foo["max"][0], 1) == 100.0
+    assert round(foo["p50"][2]) == 100
+
+    bar = history.get("bar", since=3)
+    assert bar["end"] == [4, 6]
+    assert bar["count"] == [5, 0]
+    assert round(bar["sum"][0]) == 1500
+
+    assert history.get("doesnt_exist")["count"] == [0, 0, 0]
+
+
+def test_total_is_kept_apart_from_names():
+    history = StatsHistory()
+    history.record(0, 2, 1, {"Total": entry(1, 0.1), "foo": entry(2, 0.1)}, total=entry(3, 0.1))
+    history.record(2, 4, 1, {"foo": entry(2, 0.1)}, total=entry(2, 0.1))
+    assert history.names() == ["Total", "foo"]
+    assert history.get("Total")["count"] == [1, 0]
+    assert history.get_total()["count"] == [3, 2]
+
+
+def test_history_capacity():
+    history = StatsHistory(capacity=100)
+    for i in range(1000):
+        history.record(i * 2, i * 2 + 2, 10, {"foo": entry(1, 0.01), "sparse": entry(1, 0.01)} if i % 10 else {})
+    foo = history.get("foo")
+    assert len(foo["end"]) == 100
+    assert foo["end"][-1] == 2000
+    assert sum(foo["count"]) == 90
+    # 100 rows of 2 int + 6 float columns + 1 double, for two names, plus the timeline
+    assert history.nbytes < 100 * 3 * 50
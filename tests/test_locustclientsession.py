@@ -9,7 +9,7 @@ from pytest_httpserver import HTTPServer
 
 from aiolocust import events
 from aiolocust.datatypes import Request
-from aiolocust.users.http import LocustClientSession
+from aiolocust.users.http import DEFAULT_NAME_RULES, LocustClientSession
 
 requests: list[Request] = []
 
@@ -39,6 +39,33 @@ async def test_basic(httpserver: HTTPServer):
         await _(client)
 
 
+async def test_name_normalization(httpserver: HTTPServer):
+    httpserver.expect_request("/items/123").respond_with_data("")
+    httpserver.expect_request("/items/550e8400-e29b-41d4-a716-446655440000/thumb").respond_with_data("")
+    httpserver.expect_request("/blobs/9a0364b9e99bb480dd25e1f0284c8555").respond_with_data("")
+    httpserver.expect_request("/users/bob").respond_with_data("")
+    base_url = httpserver.url_for("/").removesuffix("/")
+
+    async with LocustClientSession(base_url=base_url) as client:
+        async with client.get("/items/123?color=red") as resp:
+            pass
+        async with client.get("/items/550e8400-e29b-41d4-a716-446655440000/thumb") as resp:
+            pass
+        async with client.get("/blobs/9a0364b9e99bb480dd25e1f0284c8555") as resp:
+            pass
+        async with client.get("/items/123", name="explicit/123") as resp:
+            pass
+    assert [r.name for r in requests] == ["/items/{id}", "/items/{uuid}/thumb", "/blobs/{hash}", "explicit/123"]
+
+    requests.clear()
+    async with LocustClientSession(
+        base_url=base_url, name_rules=[*DEFAULT_NAME_RULES, (r"/users/[^/]+", "/users/{username}")]
+    ) as client:
+        async with client.get("/users/bob") as resp:
+            pass
+    assert requests[0].name == "/users/{username}"
+
+
 async def test_name(httpserver: HTTPServer):
     httpserver.expect_request("/").respond_with_data("")
 
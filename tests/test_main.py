@@ -1,8 +1,13 @@
 import os
+import time
+from datetime import datetime
 
 from typer.testing import CliRunner
+from utils import assert_search
 
+from aiolocust import config
 from aiolocust.main import app
+from aiolocust.otel import run_id
 
 
 def _timeout_handler(_signum, _frame):
@@ -91,6 +96,26 @@ async def run(user):
         assert "http://localhost:" in html
         assert "target user count: 2" in html
         assert "Total" in html
+        assert 'const DATA = "' in html  # embedded data for the charts
+
+
+def test_record_and_analyze(http_server):  # noqa: ARG001
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("my_locustfile.py", "w") as f:
+            f.write("""
+async def run(user):
+    async with user.client.get("http://localhost:8081/") as resp:
+        pass
+""")
+        result = runner.invoke(app, ["my_locustfile.py", "--iterations", "5", "--record", "requests.bin"])
+        assert result.exit_code == 0
+        result = runner.invoke(app, ["analyze", "requests.bin", "--slice", "60"])
+        print(result.output)
+        assert result.exit_code == 0
+        assert "http://localhost:8081/" in result.output
+        assert "Total per 60s" in result.output
+        assert "200" in result.output
 
 
 def test_relative_import_in_module():
@@ -138,3 +163,56 @@ async def run(user):
         assert "http://localhost:" in result.output
         assert "0 (0.0%)" in result.output
         assert result.exit_code == 0
+
+
+def test_load_shape(http_server):  # noqa: ARG001
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("my_locustfile.py", "w") as f:
+            f.write("""
+from aiolocust.shapes import LoadShape
+
+class MyShape(LoadShape):
+    def target(self, elapsed):
+        return 2 if elapsed < 1.5 else None
+
+async def run(user):
+    async with user.client.get("http://localhost:8081/") as resp:
+        pass
+""")
+        result = runner.invoke(app, ["my_locustfile.py", "-u", "5"])
+        print(result.output)
+        assert "http://localhost:" in result.output
+        assert result.exit_code == 0
+
+
+def test_instances(http_server):  # noqa: ARG001
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open("my_locustfile.py", "w") as f:
+            f.write("""
+async def run(user):
+    async with user.client.get("http://localhost:8081/") as resp:
+        pass
+""")
+        start_at = time.time() + 1
+        # the second of two instances runs 2 of the 5 iterations, once the shared start time has come
+        result = runner.invoke(
+            app,
+            ["my_locustfile.py", "-i", "5", "-u", "3", "--instance-index", "1", "--instance-count", "2"]
+            + ["--start-at", datetime.fromtimestamp(start_at).isoformat()],
+        )
+        print(result.output)
+        assert time.time() >= start_at
+        assert_search(r" http://localhost:8081/ +│ +2 ", result.output)
+        assert result.exit_code == 0
+
+
+def test_run_id(monkeypatch):
+    monkeypatch.setattr(config, "run_id", None)
+    monkeypatch.setattr(config, "start_at", 1767225600.0)
+    assert run_id() == run_id()  # the same for every instance started at the same time
+    monkeypatch.setattr(config, "start_at", None)
+    assert run_id() != run_id()
+    monkeypatch.setattr(config, "run_id", "nightly-42")
+    assert run_id() == "nightly-42"
@@ -0,0 +1,36 @@
+from opentelemetry.sdk.metrics import Histogram
+from opentelemetry.sdk.metrics.export import AggregationTemporality, ConsoleMetricExporter, HistogramDataPoint
+from opentelemetry.sdk.metrics.export import Histogram as HistogramData
+
+from aiolocust.datatypes import Request
+from aiolocust.otel import RequestMetricsExporter
+from aiolocust.stats import StatsFormatter, record_request
+
+
+def request_counts(exporter: RequestMetricsExporter) -> list[int]:
+    counts = []
+    for metric in exporter.get_request_metrics():
+        assert isinstance(metric.data, HistogramData)
+        assert metric.data.aggregation_temporality == exporter.temporality
+        if metric.name == "locust.client.duration":
+            counts = [point.count for point in metric.data.data_points if isinstance(point, HistogramDataPoint)]
+    return counts
+
+
+def test_request_metrics_temporality():
+    StatsFormatter()  # resets stats
+    cumulative = RequestMetricsExporter(ConsoleMetricExporter())
+    delta = RequestMetricsExporter(
+        ConsoleMetricExporter(preferred_temporality={Histogram: AggregationTemporality.DELTA})
+    )
+    assert cumulative.temporality == AggregationTemporality.CUMULATIVE
+    assert delta.temporality == AggregationTemporality.DELTA
+
+    for _ in range(3):
+        record_request(Request("foo", 0.1, 0.2, None))
+    assert request_counts(cumulative) == [3]
+    assert request_counts(delta) == [3]
+    record_request(Request("foo", 0.1, 0.2, None))
+    assert request_counts(cumulative) == [4]
+    assert request_counts(delta) == [1]
+    assert request_counts(delta) == []
@@ -0,0 +1,41 @@
+import asyncio
+import random
+import statistics
+
+from aiolocust.pacing import Pacing, PacingTimer, as_pacing, constant, exponential, normal, uniform
+
+
+def test_distributions():
+    random.seed(1)
+    assert constant(2).interval() == 2
+    assert all(1 <= uniform(1, 3).interval() <= 3 for _ in range(1000))
+    assert all(normal(0.1, 1).interval() >= 0 for _ in range(1000))  # clamped, even though most would be negative
+    assert 1.9 < statistics.mean(exponential(2).interval() for _ in range(10000)) < 2.1
+    assert exponential(2, think_time=True).think_time
+
+
+def test_as_pacing():
+    assert as_pacing(None) is None
+    assert as_pacing(0.5).interval() == 0.5  # pyright: ignore[reportOptionalMemberAccess]
+    pacing = Pacing(lambda: 1.0, think_time=True)
+    assert as_pacing(pacing) is pacing
+
+
+async def test_pacing_timer():
+    loop = asyncio.get_running_loop()
+    timer = PacingTimer(loop)
+    deadline = loop.time() + 0.05
+    await timer.wait_until("user", deadline)
+    assert deadline <= loop.time() < deadline + 0.01
+    assert not timer.waiting
+
+    # waiting users can be woken early
+    start = loop.time()
+    waiters = [asyncio.create_task(timer.wait_until(user, start + 10)) for user in ("a", "b", "c")]
+    await asyncio.sleep(0)
+    timer.wake("a")
+    await waiters[0]
+    assert not waiters[1].done()
+    timer.wake_all()
+    await asyncio.gather(*waiters)
+    assert loop.time() - start < 1
@@ -0,0 +1,75 @@
+import io
+import threading
+import time
+
+from rich.console import Console
+
+from aiolocust import recorder, stats
+from aiolocust.analyze import analyze_recording, print_analysis
+from aiolocust.datatypes import Request
+from aiolocust.recorder import Recorder, read_chunks
+
+
+def test_recorder(tmp_path, mocker):
+    mocker.patch.object(recorder, "CHUNK_ROWS", 100)
+    path = tmp_path / "rec" / "requests.bin"
+    rec = Recorder(path)
+
+    def make_requests(name: str):
+        for i in range(250):
+            error = ValueError("bad value") if i % 50 == 0 else None
+            rec.record(Request(name, 0.001, 0.002 + i / 1000, error, 500 if error else 200))
+
+    threads = [threading.Thread(target=make_requests, args=(f"/thread{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    rec.close()
+
+    rows = 0
+    for columns, names, errors in read_chunks(path):
+        assert len(columns["timestamp"]) <= 100
+        assert all(names[name_id].startswith("/thread") for name_id in columns["name"])
+        assert {errors[error_id] for error_id in columns["error"] if error_id} <= {"ValueError: bad value"}
+        rows += len(columns["ttlb"])
+    assert rows == 1000
+
+    analysis = analyze_recording(path, slice_length=1)
+    assert sorted(analysis.entries) == ["/thread0", "/thread1", "/thread2", "/thread3"]
+    entry = analysis.entries["/thread1"]
+    assert entry.count == 250
+    assert entry.errorcount == 5
+    assert round(entry.max_ttlb_ms) == 251
+    assert sum(slice.count for slice in analysis.slices.values()) == 1000
+    assert analysis.errors == {"ValueError: bad value": 20}
+    assert analysis.statuses == {200: 980, 500: 20}
+
+    # printing doesn't touch the live stats
+    stats.record_error("live error")
+    output = io.StringIO()
+    print_analysis(analysis, 1, Console(file=output, width=200))
+    assert "/thread1" in output.getvalue()
+    assert stats.get_error_counts()["live error"] == 1
+
+
+def test_idle_thread_is_flushed(tmp_path, mocker):
+    mocker.patch.object(recorder, "FLUSH_INTERVAL", 0.2)
+    path = tmp_path / "requests.bin"
+    rec = Recorder(path)
+    # a thread that makes a single request and then goes idle (or away) doesn't keep it to itself until close()
+    thread = threading.Thread(target=rec.record, args=(Request("/once", 0.001, 0.002, None, 200),))
+    thread.start()
+    thread.join()
+    time.sleep(0.5)
+    chunks = [(len(columns["name"]), names[1:]) for columns, names, _errors in read_chunks(path)]
+    assert chunks == [(1, ["/once"])]
+    rec.close()
+    assert analyze_recording(path).entries["/once"].count == 1
+
+
+def test_empty_recording(tmp_path):
+    path = tmp_path / "requests.bin"
+    Recorder(path).close()
+    assert list(read_chunks(path)) == []
+    assert not analyze_recording(path).entries
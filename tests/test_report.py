@@ -0,0 +1,54 @@
+import base64
+import gzip
+import json
+
+from aiolocust.datatypes import RequestEntry
+from aiolocust.history import StatsHistory
+from aiolocust.report import downsample, encode_history
+
+
+def entry(count: int, ttlb: float) -> RequestEntry:
+    re = RequestEntry()
+    for _ in range(count):
+        re.record(ttlb, ttlb, False)
+    return re
+
+
+def test_downsample():
+    columns = {
+        "start": list(range(10)),
+        "end": list(range(1, 11)),
+        "users": list(range(10)),
+        "count": [1] * 10,
+        "p99": [1, 1, 1, 9, 1, 1, 1, 1, 1, 1],
+    }
+    assert downsample(columns, 10) is columns
+    merged = downsample(columns, 4)
+    assert merged["start"] == [0, 3, 6, 9]
+    assert merged["end"] == [3, 6, 9, 10]
+    assert merged["users"] == [2, 5, 8, 9]
+    assert merged["count"] == [3, 3, 3, 1]
+    assert merged["p99"] == [1, 9, 1, 1]
+
+
+def test_encode_history():
+    history = StatsHistory()
+    for i in range(2000):
+        entries = {"/foo": entry(2, 0.01)}
+        total = entry(2, 0.01)
+        if i % 100 == 0:
+            entries["/rare"] = total = entry(1, 0.5)
+        history.record(1000 + i * 2, 1002 + i * 2, i, entries, total=total)
+
+    encoded = encode_history(history, max_points=500)
+    data = json.loads(gzip.decompress(base64.b64decode(encoded)))
+    assert data["t0"] == 1000
+    assert data["names"] == ["/foo", "/rare"]
+    assert sum(data["total"]["count"]) == 1980 * 2 + 20
+    assert len(data["end"]) == 500
+    assert data["end"][-1] == 4000
+    assert data["users"][-1] == 1999
+    assert sum(data["series"]["/rare"]["count"]) == 20
+    assert round(max(data["series"]["/rare"]["p99"])) == 500
+    # a couple of hours of data for a few names should be small
+    assert len(encoded) < 20000
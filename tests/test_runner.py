@@ -1,9 +1,18 @@
 import asyncio
+import re
+import socket
+import threading
+import time
+from collections import defaultdict
 
 import aiohttp
 from utils import WINDOWS_DELAY, assert_search
 
-from aiolocust.runner import Runner, Stage, desired_user_count
+from aiolocust import User
+from aiolocust.capacity import CapacitySearch
+from aiolocust.datatypes import IterationBudget
+from aiolocust.pacing import constant
+from aiolocust.runner import LoopWorker, Runner, Stage, StageSchedule, desired_rate, desired_user_count
 from aiolocust.users.http import HttpUser, LocustClientSession
 
 
@@ -118,6 +127,27 @@ def test_manual_shutdown(http_server, capteesys):  # noqa: ARG001
     # assert "foo" in out
 
 
+def test_stop_timeout(capteesys):
+    # a server that accepts connections but never responds, so requests hang until they're cancelled
+    server = socket.create_server(("127.0.0.1", 0), backlog=1024)
+    port = server.getsockname()[1]
+
+    class TestUser(HttpUser):
+        async def run(self):
+            async with self.client.get(f"http://127.0.0.1:{port}/hang") as resp:
+                pass
+
+    try:
+        start = time.perf_counter()
+        Runner([TestUser], user_count=200, duration=1, event_loops=2, stop_timeout=0.5).run_test()
+        assert time.perf_counter() - start < 4
+    finally:
+        server.close()
+    out, _ = capteesys.readouterr()
+    assert_search(rf"http://127.0.0.1:{port}/hang .* 200 .* 200 \(100.0%\)", out)
+    assert_search(r"200 .* cancelled at shutdown", out)
+
+
 def test_iterations(http_server, capteesys):  # noqa: ARG001
     class TestUser(HttpUser):
         async def run(self):
@@ -142,6 +172,93 @@ def test_iterations(http_server, capteesys):  # noqa: ARG001
     assert_search(r"30 .* assert 'foo' in 'OK'", out)
 
 
+def test_processes(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        pacing = 0.1
+
+        async def run(self):
+            async with self.client.get("http://localhost:8081/") as resp:
+                pass
+            async with self.client.get("http://localhost:8081/") as resp:
+                assert "foo" in await resp.text()
+
+    start = time.perf_counter()
+    Runner([TestUser], user_count=3, iterations=31, event_loops=1, duration=8, processes=2).run_test()
+    assert time.perf_counter() - start < 6
+    out, _ = capteesys.readouterr()
+    # one table, with the stats of both processes
+    assert out.count("Summary") == 1
+    assert_search(r" http://localhost:8081/.* 62 .* 31 \(50.0%\)", out)
+    assert_search(r"31 .* assert 'foo' in 'OK'", out)
+    assert_search(r"Pacing: 31 iterations started", out)
+
+
+def test_capacity_search(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        running = 0
+
+        async def run(self):
+            TestUser.running += 1
+            try:
+                async with self.client.get("http://localhost:8081/") as resp:
+                    # the "system under test" fails when more than 4 users use it at the same time
+                    assert TestUser.running <= 4
+                await asyncio.sleep(0.01)
+            finally:
+                TestUser.running -= 1
+
+    search = CapacitySearch(step=2, step_duration=0.5, error_rate=0.0)
+    Runner([TestUser], event_loops=1, shape=search).run_test()
+    assert [step.load for step in search.steps] == [2, 4, 6, 5]
+    assert search.passed == 4
+    out, _ = capteesys.readouterr()
+    assert "Capacity search" in out
+    assert "Capacity: 4 users met the SLO (errors <= 0.0%), 5 users didn't" in out
+
+
+def test_iteration_budget():
+    budget = IterationBudget(1000, max_lease=50)
+    taken = [0] * 4
+    barrier = threading.Barrier(4)
+
+    def worker(i):
+        barrier.wait()
+        while budget.take():
+            taken[i] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(taken) == 1000
+    assert budget.value == 1000
+    assert not budget.take()
+
+    # iterations leased by a thread that stopped taking them are used by the others
+    budget = IterationBudget(10)
+    assert budget.take()
+    thread = threading.Thread(target=lambda: [budget.take() for _ in range(100)])
+    thread.start()
+    thread.join()
+    assert budget.value == 10
+
+
+def test_iterations_multiple_loops():
+    counts: dict[int, int] = defaultdict(int)
+
+    class CountingUser(User):
+        async def run(self):
+            counts[threading.get_ident()] += 1
+            await asyncio.sleep(0)
+
+    start = time.time()
+    Runner([CountingUser], user_count=10, iterations=5000, event_loops=4, duration=8).run_test()
+    assert time.time() - start < 5  # the last users shut the test down, instead of waiting for the duration
+    assert sum(counts.values()) == 5000
+    assert len(counts) == 4
+
+
 def test_desired_user_count():
     stages = [
         Stage(duration=2, target=2),
@@ -166,6 +283,47 @@ def test_desired_user_count():
     assert desired_user_count([Stage(0, 100), Stage(1, 100)], 0.001) == 100  # correctly handles instant ramp up
 
 
+def test_stage_schedule():
+    schedule = StageSchedule([Stage(2, 4), Stage(1, 4), Stage(2, 0)])
+    assert schedule.next_change(0) == 0  # the count goes to 1 as soon as the test starts
+    assert schedule.next_change(0.1) == 0.5
+    assert schedule.next_change(1.9) == 2  # target reached, so the next change is at the end of the stage
+    assert schedule.next_change(2.5) == 3
+    assert schedule.next_change(3.1) == 3.5
+    assert schedule.user_count(3.5) == 3
+    assert schedule.next_change(5.1) is None
+
+    # every change in user count happens exactly at a time returned by next_change, even with lots of stages
+    schedule = StageSchedule([Stage(0.01 * (i % 3 + 1), i * 7 % 11) for i in range(5000)])
+    elapsed, changes = 0.0, 0
+    count = schedule.user_count(1e-9)
+    while (next_change := schedule.next_change(elapsed + 1e-9)) is not None:
+        assert schedule.user_count((elapsed + next_change) / 2) == count  # no change in between
+        if (after := schedule.user_count(next_change + 1e-9)) is None:
+            break
+        changes += after != count
+        count, elapsed = after, next_change
+    assert changes > 10000
+
+
+def test_spawn_timing():
+    started = []
+
+    class MyUser(User):
+        async def run(self):
+            started.append(time.monotonic())
+            await asyncio.sleep(2)
+
+    runner = Runner([MyUser], config={"stages": [{"duration": 1, "target": 200}]}, event_loops=1)
+    runner.run_test()
+    assert len(started) == 200
+    started.sort()
+    offsets = [t - started[0] for t in started]
+    # users are started evenly, at their exact time (user n at n/200 s), rather than in bursts
+    tolerance = 0.05 + WINDOWS_DELAY / 10
+    assert all(abs(offset - i / 200) < tolerance for i, offset in enumerate(offsets))
+
+
 def test_current_user_count_gauge(http_server, monkeypatch):  # noqa: ARG001
     class TestUser(HttpUser):
         async def run(self):
@@ -181,3 +339,322 @@ def test_current_user_count_gauge(http_server, monkeypatch):  # noqa: ARG001
 
     assert gauge_values[0] == 0
     assert max(gauge_values) == 2
+
+
+def test_co_correction(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        pacing = 0.2
+
+        async def run(self):
+            async with self.client.get("http://localhost:8081/") as resp:
+                pass
+            await asyncio.sleep(0.5)  # overrun the pacing, so each iteration starts later than intended
+
+    Runner([TestUser], user_count=1, duration=2, co_correction=True).run_test()
+    out, err = capteesys.readouterr()
+    assert err == ""
+    assert "CO p50" in out
+    assert "CO Max" in out
+    # measured latency is low, but the last iteration should have been sent at least 0.9s too late
+    assert_search(r" http://localhost:8081/ .* 9\d\d\.\dms │ +\d\.\d\d/s", out)
+
+
+def test_pacing(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        pacing = 0.5
+
+        async def run(self):
+            async with self.client.get("http://localhost:8081/") as resp:
+                pass
+
+    Runner([TestUser], user_count=1, duration=2).run_test()
+    out, err = capteesys.readouterr()
+    assert err == ""
+    assert "CO Max" not in out
+    assert_search(r" http://localhost:8081/[ ]+│[ ]+4 ", out)
+
+
+def test_pacing_overrun(capteesys):
+    class SlowUser(User):
+        pacing = 0.2
+
+        async def run(self):
+            await asyncio.sleep(0.3)
+
+    Runner([SlowUser], user_count=1, duration=1).run_test()
+    out, _ = capteesys.readouterr()
+    assert_search(r"Pacing: [45] iterations started, [34] overran their slot \(by up to [1-4]\d\dms\)", out)
+
+
+def test_think_time():
+    iterations = []
+
+    class ThinkingUser(User):
+        pacing = constant(0.5, think_time=True)
+
+        async def run(self):
+            iterations.append(time.perf_counter())
+            await asyncio.sleep(0.25)
+
+    Runner([ThinkingUser], user_count=1, duration=2).run_test()
+    # measured from the end of each iteration, so they start 0.75s apart (with pacing it would have been 0.5s)
+    assert len(iterations) == 3
+    assert all(0.74 < b - a < 0.9 + WINDOWS_DELAY for a, b in zip(iterations, iterations[1:]))
+
+
+def test_desired_rate():
+    stages = [Stage(duration=2, rate=10), Stage(duration=2, rate=10), Stage(duration=0, rate=100), Stage(2, rate=0)]
+    assert desired_rate(stages, 0) == 0
+    assert desired_rate(stages, 1) == 5  # ramping up from 0
+    assert desired_rate(stages, 3) == 10
+    assert desired_rate(stages, 4.5) == 75  # instant jump to 100, then ramping down
+    assert desired_rate(stages, 6) == 0
+    assert desired_rate(stages, 6.1) is None
+
+
+def test_arrival_rate(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        async def run(self):
+            async with self.client.get("http://localhost:8081/") as resp:
+                pass
+            await asyncio.sleep(0.1)
+
+    Runner([TestUser], user_count=4, duration=2, arrival_rate=20, event_loops=2).run_test()
+    out, err = capteesys.readouterr()
+    assert err == ""
+    # 20/s for 2s, with a bit of slack for startup/shutdown
+    assert_search(r" http://localhost:8081/[ ]+│[ ]+(3[89]|4[01]) ", out)
+    assert_search(r"Iterations: (3[89]|4[01]) started, 0 dropped", out)
+
+
+def test_arrival_rate_dropped(http_server, capteesys):  # noqa: ARG001
+    class TestUser(HttpUser):
+        async def run(self):
+            await asyncio.sleep(0.45)
+
+    Runner(
+        [TestUser],
+        config={
+            "stages": [{"duration": 0, "rate": 10}, {"duration": 2, "rate": 10}],
+            "max_users": 2,
+            "arrival": "poisson",
+        },
+        event_loops=1,
+    ).run_test()
+    out, _err = capteesys.readouterr()
+    # 2 users can only do ~9 of the ~20 iterations
+    match = re.search(r"Iterations: (\d+) started, (\d+) dropped", out)
+    assert match
+    assert int(match.group(1)) <= 10
+    assert int(match.group(2)) > 0
+
+
+def stop_workers(runner: Runner):
+    runner.running = False
+    runner.flush_commands()
+    for w in runner.workers + runner.draining_workers:
+        asyncio.run_coroutine_threadsafe(w.wait_for_users(), w.loop).result(timeout=1)
+        w.stop()
+
+
+def test_spawn_rate():
+    started = {}
+
+    class IdleUser(User):
+        async def run(self):
+            started[self] = time.monotonic()
+            await asyncio.sleep(1)
+
+    Runner([IdleUser], user_count=20000, rate=20000, duration=2, event_loops=2).run_test()
+    assert len(started) == 20000
+    # spawning keeps up with the rate: everyone is started within about a second (the ramp up) of the first user
+    assert max(started.values()) - min(started.values()) < 2 + WINDOWS_DELAY
+
+
+def test_user_counts_follow_actual_users():
+    class Admin(User):
+        fixed_count = 2
+
+        async def run(self):
+            await asyncio.sleep(0.1)
+
+    # only fixed_count users, so there is nothing to start beyond those
+    runner = Runner([Admin], user_count=5, duration=1)
+    runner.run_test()
+    assert runner.current_user_count == 2
+
+    users = []
+
+    class Quitter(User):
+        async def run(self):
+            users.append(self)
+            if len(users) == 1:
+                raise asyncio.CancelledError  # this user stops on its own
+            await asyncio.sleep(0.1)
+
+    runner = Runner([Quitter], user_count=2, duration=1)
+    runner.run_test()
+    # the user that stopped was unregistered and replaced
+    assert len(set(users)) == 3
+    assert runner.class_counts[Quitter] == runner.current_user_count == 2
+    assert sum(len(w.users[Quitter]) for w in runner.workers) == 2
+
+
+def test_user_class_weights():
+    class Browse(User):
+        weight = 4
+
+        async def run(self):
+            await asyncio.sleep(0.1)
+
+    class Checkout(Browse):
+        weight = 1
+
+    class Admin(Browse):
+        fixed_count = 1
+
+    runner = Runner([Browse, Checkout, Admin], event_loops=3)
+    runner.workers = [LoopWorker() for _ in range(3)]
+    for w in runner.workers:
+        w.start()
+    runner.running = True
+
+    def check_spread():
+        for user_class in (Browse, Checkout, Admin):
+            per_loop = [len(w.users[user_class]) for w in runner.workers]
+            assert max(per_loop) - min(per_loop) <= 1
+
+    def counts():
+        return [runner.class_counts[user_class] for user_class in (Browse, Checkout, Admin)]
+
+    runner.add_user()
+    assert counts() == [0, 0, 1]
+    for weighted_count in range(1, 31):
+        runner.add_user()
+        # the ratio is as exact as it can be, at every step of the ramp up
+        assert abs(runner.class_counts[Browse] - weighted_count * 4 / 5) < 1
+        assert runner.class_counts[Browse] + runner.class_counts[Checkout] == weighted_count
+        check_spread()
+    assert counts() == [24, 6, 1]
+
+    for weighted_count in range(29, -1, -1):
+        runner.stop_user()
+        assert abs(runner.class_counts[Browse] - weighted_count * 4 / 5) < 1
+        check_spread()
+    assert counts() == [0, 0, 1]  # fixed_count users are stopped last
+    runner.stop_user()
+    assert not any(w.user_count for w in runner.workers)
+    stop_workers(runner)
+
+
+def test_loop_worker_load():
+    worker = LoopWorker()
+    worker.start()
+
+    def busy():
+        time.sleep(0.001)  # doesn't use CPU, but delays the loop
+        end = time.thread_time() + 0.05
+        while time.thread_time() < end:
+            pass
+        worker.loop.call_soon(busy)
+
+    worker.loop.call_soon_threadsafe(busy)
+    time.sleep(1.5)
+    assert worker.cpu_usage > 0.5
+    assert worker.lag > 0.01
+    assert worker.pressure > 0.5
+    worker.stop()
+
+
+def test_least_loaded_placement():
+    class MyUser(User):
+        async def run(self):
+            await asyncio.sleep(0.1)
+
+    class BusyWorker(LoopWorker):
+        @property
+        def pressure(self) -> float:
+            return 1.0  # pretend the users on this loop are twice as heavy
+
+    runner = Runner([MyUser], event_loops=2)
+    runner.workers = [BusyWorker(), LoopWorker()]
+    for w in runner.workers:
+        w.start()
+    runner.running = True
+    for _ in range(9):
+        runner.add_user()
+    assert [w.user_count for w in runner.workers] == [3, 6]
+    runner.stop_user()  # stops users from the most loaded loop first
+    assert [w.user_count for w in runner.workers] == [3, 5]
+    runner.stop_user()
+    assert [w.user_count for w in runner.workers] == [2, 5]
+
+    # pile everything onto one loop and then rebalance
+    for _ in range(6):
+        runner.start_user(MyUser, runner.workers[0])
+    assert [w.user_count for w in runner.workers] == [8, 5]
+    runner.rebalance_users()
+    assert [w.user_count for w in runner.workers] == [7, 6]  # at most 10% of a loop's users are moved at a time
+    for _ in range(5):
+        runner.rebalance_users()
+    assert [w.user_count for w in runner.workers] == [5, 8]  # 10 vs 8 is as balanced as it gets
+
+    stop_workers(runner)
+
+
+def test_load_generator_bound(capteesys, caplog):
+    class BlockingUser(User):
+        async def run(self):
+            time.sleep(0.2)  # blocks the event loop
+            await asyncio.sleep(0)
+
+    Runner([BlockingUser], user_count=1, duration=3, event_loops=1).run_test()
+    out, _err = capteesys.readouterr()
+    assert "Event loop lag (worst loop)" in out
+    assert "Load generator bound" in out
+    assert "Event loop 0 is lagging" in caplog.text
+
+
+def test_autoscale_loops():
+    class MyUser(User):
+        async def run(self):
+            await asyncio.sleep(0.1)
+
+    class ManualWorker(LoopWorker):
+        def run(self):  # no probe, so lag and cpu_usage can be set by the test
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_forever()
+
+    runner = Runner([MyUser], event_loops="auto")
+    assert runner.auto_event_loops
+    runner.max_event_loops = 2
+    runner.workers = [ManualWorker(0)]
+    runner.workers[0].start()
+    runner.running = True
+    for _ in range(10):
+        runner.add_user()
+
+    runner.workers[0].lag = 0.05
+    runner.autoscale_loops()
+    assert [w.index for w in runner.workers] == [0, 1]
+    assert [w.user_count for w in runner.workers] == [8, 2]  # some users are moved right away
+    runner.autoscale_loops()
+    assert len(runner.workers) == 2  # already at max_event_loops
+    assert [w.user_count for w in runner.workers] == [7, 3]
+    for _ in range(3):
+        runner.add_user()  # new users go to the new loop
+    assert [w.user_count for w in runner.workers] == [7, 6]
+
+    # both loops are mostly idle, so the least loaded one is removed
+    runner.workers[0].lag = 0.0
+    runner.workers[0].cpu_usage = 0.1
+    removed = runner.workers[1]
+    runner.autoscale_loops()
+    assert runner.workers == [runner.workers[0]] and runner.draining_workers
+    assert runner.workers[0].user_count == 13
+    assert removed.user_count == 0
+    runner.flush_commands()
+    time.sleep(0.3)  # let the moved users finish their iterations
+    runner.autoscale_loops()
+    assert not runner.draining_workers
+    stop_workers(runner)
@@ -0,0 +1,67 @@
+import pytest
+
+from aiolocust.datatypes import Stage
+from aiolocust.shapes import LoadShape, ShapeSchedule, StageSchedule, from_csv, from_points, sine, spike, step
+
+
+def test_from_points():
+    shape = from_points([(5, 10), (15, 20)])
+    assert shape.stages == [Stage(0, 10), Stage(5, 10), Stage(10, 20)]  # holds the first target, instead of ramping
+    assert shape.target(0) == 10
+    assert shape.target(10) == 15
+    assert shape.target(15) == 20
+    assert shape.target(16) is None
+    with pytest.raises(ValueError):
+        from_points([(5, 10), (1, 20)])
+
+
+def test_step():
+    shape = step(10, 60, 3)
+    assert not shape.rate
+    assert [shape.target(t) for t in (0.001, 59, 60.001, 150, 180)] == [10, 10, 20, 30, 30]
+    assert shape.target(181) is None
+    # steps are instant
+    assert StageSchedule(shape.stages).next_change(1) == 60
+
+
+def test_spike():
+    shape = spike(base=10, peak=100, duration=60, spike_at=20, spike_duration=5, ramp_time=2)
+    assert [shape.target(t) for t in (0, 19, 21, 22, 26, 28, 29, 60)] == [10, 10, 55, 100, 100, 55, 10, 10]
+
+
+def test_sine():
+    shape = sine(low=10, high=30, period=100, duration=200, rate=True)
+    assert shape.rate
+    assert shape.target(0) == pytest.approx(10)
+    assert shape.target(25) == pytest.approx(20)
+    assert shape.target(50) == pytest.approx(30)
+    assert shape.target(150) == pytest.approx(30)
+    assert shape.target(175.5) == pytest.approx(20 - 10 * 0.0314, abs=0.01)  # linear between points
+    assert shape.target(200) == pytest.approx(10)
+    assert len(shape.stages) == 201  # one per second, plus the start
+
+
+def test_from_csv(tmp_path):
+    path = tmp_path / "shape.csv"
+    path.write_text("time,users\n0,5\n10,15\n20,15\n")
+    shape = from_csv(path)
+    assert [shape.target(t) for t in (0, 5, 15, 20)] == [5, 10, 15, 15]
+    path.write_text("time,users\n")
+    with pytest.raises(ValueError):
+        from_csv(path)
+
+
+def test_custom_shape():
+    class Square(LoadShape):
+        interval = 0.5
+
+        def target(self, elapsed: float) -> float | None:
+            if elapsed > 10:
+                return None
+            return 10.5 if elapsed % 2 < 1 else 2
+
+    schedule = ShapeSchedule(Square())
+    assert schedule.user_count(0.5) == 11
+    assert schedule.user_count(1.5) == 2
+    assert schedule.user_count(11) is None
+    assert schedule.next_change(3) == 3.5
@@ -1,16 +1,19 @@
 import asyncio
 import io
+import threading
 
 from rich.console import Console
 from utils import assert_search
 
-from aiolocust.datatypes import Request
-from aiolocust.stats import StatsFormatter, record_request
+from aiolocust import stats
+from aiolocust.datatypes import LatencyHistogram, Request
+from aiolocust.runner import LoopWorker
+from aiolocust.stats import MAX_NAME_KEYS, TABLE_WIDTH, StatsFormatter, get_error_counts, record_request, rotate_shards
 
 
 async def test_get_table():
     f = io.StringIO()
-    console = Console(file=f)
+    console = Console(file=f, width=TABLE_WIDTH)
     sf = StatsFormatter()
     console.print(sf.get_table())
     output = f.getvalue()
@@ -43,7 +46,7 @@ async def test_get_table():
 
 async def test_error_pct_summary():
     f = io.StringIO()
-    console = Console(file=f)
+    console = Console(file=f, width=TABLE_WIDTH)
     sf = StatsFormatter()
     record_request(Request("foo", 1, 1, None))
     record_request(Request("foo", 2, 2, None))
@@ -70,7 +73,7 @@ async def test_error_pct_summary():
 
 async def test_error_cardinality():
     f = io.StringIO()
-    console = Console(file=f)
+    console = Console(file=f, width=TABLE_WIDTH)
     sf = StatsFormatter()
     for i in range(300):
         record_request(Request("foo", 1, 1, Exception(f"error with unique id {i}")))
@@ -80,3 +83,153 @@ async def test_error_cardinality():
     assert_search(r"1 .* error with unique id 0", output)
     assert_search(r"1 .* error with unique id 199", output)
     assert_search(r"100 .* OTHER", output)
+
+
+async def test_assertion_error_fingerprint():
+    f = io.StringIO()
+    console = Console(file=f, width=TABLE_WIDTH)
+    sf = StatsFormatter()
+    for i in range(3):
+        for message in (f"first {i}", f"second {i}"):
+            try:
+                raise AssertionError(message)
+            except AssertionError as e:
+                e.exc_tb = e.__traceback__  # type: ignore
+                record_request(Request("foo", 1, 1, e))
+    console.print(sf.get_error_table())
+    output = f.getvalue()
+    print(output)
+    # same line, so the message is only formatted once
+    assert_search(r"6 .* first 0 \(test_stats.py:\d+\)", output)
+    assert "second" not in output
+    assert list(get_error_counts().values()) == [6]
+
+
+async def test_errors_are_merged_across_event_loops():
+    StatsFormatter()  # resets stats
+    workers = [LoopWorker() for _ in range(3)]
+    for w in workers:
+        w.start()
+
+    async def record_many():
+        for _ in range(100):
+            record_request(Request("foo", 1, 1, Exception("boom")))
+            await asyncio.sleep(0)
+
+    for fut in [asyncio.run_coroutine_threadsafe(record_many(), w.loop) for w in workers]:
+        await asyncio.wrap_future(fut)
+    await rotate_shards()
+    for w in workers:
+        w.stop()
+    assert get_error_counts() == {"boom": 300}
+
+
+async def test_shards_are_merged_across_event_loops():
+    f = io.StringIO()
+    console = Console(file=f, width=TABLE_WIDTH)
+    sf = StatsFormatter()
+    workers = [LoopWorker() for _ in range(3)]
+    for w in workers:
+        w.start()
+
+    async def record_many():
+        for _ in range(100):
+            record_request(Request("foo", 1, 1, None))
+            await asyncio.sleep(0)
+
+    for fut in [asyncio.run_coroutine_threadsafe(record_many(), w.loop) for w in workers]:
+        await asyncio.wrap_future(fut)
+    await rotate_shards()
+    console.print(sf.get_table())
+    for w in workers:
+        w.stop()
+    output = f.getvalue()
+    assert_search(r"foo .* 300 ", output)
+    assert_search(r"Total .* 300 ", output)
+
+
+async def test_shards_of_finished_threads_are_dropped():
+    StatsFormatter()  # resets stats
+    worker = LoopWorker()
+    worker.start()
+
+    async def record():
+        record_request(Request("foo", 1, 1, None))
+
+    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(record(), worker.loop))
+    shard = next(shard for shard in stats._shards if shard.thread is worker)
+    worker.stop()
+    worker.join()
+    thread = threading.Thread(target=record_request, args=(Request("foo", 1, 1, None),))
+    thread.start()
+    thread.join()
+    assert sum(entry.count for entry in stats.take_entries().values()) == 2
+    assert shard not in stats._shards
+    assert all(shard.thread.is_alive() for shard in stats._shards)
+
+
+def test_latency_histogram_percentiles():
+    h = LatencyHistogram()
+    for i in range(1, 10001):
+        h.record(i / 1000)  # 1ms .. 10s
+    p50, p99, p999 = h.percentiles([0.5, 0.99, 0.999])
+    assert abs(p50 - 5.0) / 5.0 < 0.01
+    assert abs(p99 - 9.9) / 9.9 < 0.01
+    assert abs(p999 - 9.99) / 9.99 < 0.01
+    assert len(h.counts) < 1000
+    assert h.percentiles([0.5]) == [h.percentiles([0.1, 0.5])[1]]
+
+    small = LatencyHistogram()
+    small.record(0.000_05)
+    assert small.percentiles([0.5]) == [0.000_050_5]  # exact below 128us (bucket midpoint)
+
+
+def test_latency_histogram_merge():
+    a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for i in range(1000):
+        a.record(i / 10000)
+        b.record(i / 100)
+        both.record(i / 10000)
+        both.record(i / 100)
+    a += b
+    assert a.counts == both.counts
+    assert a.count == 2000
+    assert sum(a.bucket_counts([0.01, 0.1, 1.0])) == 2000
+
+
+async def test_percentile_columns():
+    f = io.StringIO()
+    console = Console(file=f, width=TABLE_WIDTH)
+    sf = StatsFormatter()
+    for i in range(1, 101):
+        record_request(Request("foo", i / 1000, i / 1000, None))
+    console.print(sf.get_table(True))
+    output = f.getvalue()
+    assert_search(r"p50 .* p90 .* p95 .* p99 .* p99.9 .* Max", output)
+    assert_search(r"foo .* 50.5ms │ 49.9ms │ 89.6ms │ 94.7ms │ 98.8ms │ 99.8ms │ 100.0ms", output)
+
+
+async def test_ttfb_columns():
+    f = io.StringIO()
+    console = Console(file=f, width=TABLE_WIDTH)
+    sf = StatsFormatter()
+    record_request(Request("streaming", 0.1, 0.5, None))
+    record_request(Request("streaming", 0.3, 1.5, None))
+    console.print(sf.get_table(True))
+    output = f.getvalue()
+    assert_search(r"Max .* TTFB Avg .* TTFB p50 .* TTFB p95 .* TTFB p99", output)
+    assert_search(r"streaming .* 1000.0ms .* 1500.0ms │ +200.0ms │ +100.0ms │ +300.0ms │ +300.0ms", output)
+
+
+async def test_name_cardinality():
+    f = io.StringIO()
+    console = Console(file=f, width=TABLE_WIDTH)
+    sf = StatsFormatter()
+    for i in range(MAX_NAME_KEYS + 100):
+        record_request(Request(f"/item/{i}", 1, 1, None))
+    console.print(sf.get_table(True))
+    output = f.getvalue()
+    assert_search(r"/item/0 .* 1 ", output)
+    assert_search(rf"/item/{MAX_NAME_KEYS - 1} .* 1 ", output)
+    assert f"/item/{MAX_NAME_KEYS} " not in output
+    assert_search(r"OTHER .* 100 ", output)